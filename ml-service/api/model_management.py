@@ -1,8 +1,15 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel, ConfigDict
 from typing import Optional, List, Dict, Any
 import logging
 import asyncio
+import json
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from config import config
+from utils.ttl_cache import AsyncTTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -10,24 +17,82 @@ router = APIRouter()
 
 # Global trainer instance (will be set from main.py)
 trainer_instance = None
+job_manager_instance = None
 db_connector_instance = None
+event_rollups_instance = None  # Realtime event rollups (utils/event_rollups.py); analyze falls back to SQL without them
+trainer_proxy_url = None  # Forked serving workers: training and job endpoints go to the training process
 
 def set_trainer(trainer):
     """Set trainer instance from main.py"""
     global trainer_instance
     trainer_instance = trainer
 
+def set_job_manager(job_manager):
+    """Set training job manager instance from main.py"""
+    global job_manager_instance
+    job_manager_instance = job_manager
+
 def set_db_connector(db_connector):
     """Set db connector instance from main.py"""
     global db_connector_instance
     db_connector_instance = db_connector
 
+def set_event_rollups(rollups):
+    """Set event rollups instance from main.py"""
+    global event_rollups_instance
+    event_rollups_instance = rollups
+
+def set_trainer_proxy(url: str):
+    """Forward training and job endpoints to the training process at url (multi-worker serving)"""
+    global trainer_proxy_url
+    trainer_proxy_url = url
+
+async def _forward(method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Same endpoint on the training process; its HTTP errors are passed through"""
+    def call():
+        request = urllib.request.Request(
+            f"{trainer_proxy_url}/api/models{path}",
+            data=json.dumps(body).encode() if body is not None else None,
+            headers={"Content-Type": "application/json"},
+            method=method
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b'{}')
+    
+    try:
+        status, payload = await asyncio.get_running_loop().run_in_executor(None, call)
+    except (OSError, ValueError) as e:
+        raise HTTPException(status_code=503, detail=f"Training process unavailable: {e}")
+    if status >= 400:
+        raise HTTPException(status_code=status, detail=payload.get('detail', payload))
+    return payload
+
+async def _relay_job_stream(websocket: WebSocket, job_id: str):
+    """Relay a job's progress stream from the training process"""
+    import websockets
+    
+    url = trainer_proxy_url.replace('http://', 'ws://', 1) + f"/api/models/jobs/{job_id}/stream"
+    try:
+        async with websockets.connect(url) as upstream:
+            async for message in upstream:
+                await websocket.send_text(message)
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info(f"Job stream client disconnected ({job_id})")
+    except (OSError, websockets.exceptions.WebSocketException) as e:
+        await websocket.send_json({"error": f"Training process unavailable: {e}"})
+        await websocket.close()
+
 class TrainRequest(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
     model_type: str
     epochs: Optional[int] = None
     batch_size: Optional[int] = None
     days: Optional[int] = 30
+    incremental: Optional[bool] = False  # Fine-tune the latest version on the newest days only
 
 class DeployRequest(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
@@ -38,128 +103,147 @@ class AnalyzeRequest(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
     days: Optional[int] = 30
     analysis_type: Optional[str] = "overview"
-
-async def train_model_background(model_type: str, days: int = 30):
-    """Background task for model training"""
-    import sys
-    import traceback
-    
-    # Force flush logs immediately
-    print(f"\n{'='*60}", flush=True)
-    print(f"🚀 MODEL EĞİTİMİ BAŞLATILIYOR: {model_type}", flush=True)
-    print(f"{'='*60}\n", flush=True)
-    
-    logger.info(f"{'='*60}")
-    logger.info(f"🚀 MODEL EĞİTİMİ BAŞLATILIYOR: {model_type}")
-    logger.info(f"📅 Veri aralığı: Son {days} gün")
-    logger.info(f"{'='*60}")
-    
-    try:
-        if not trainer_instance:
-            error_msg = "❌ Trainer instance not set"
-            print(error_msg, flush=True)
-            logger.error(error_msg)
-            return
-        
-        logger.info(f"✅ Trainer instance bulundu, eğitim başlatılıyor...")
-        print(f"✅ Trainer instance bulundu, eğitim başlatılıyor...", flush=True)
-        
-        if model_type == "purchase_prediction":
-            print(f"📊 Purchase prediction modeli eğitiliyor...", flush=True)
-            logger.info("📊 Purchase prediction modeli eğitiliyor...")
-            await trainer_instance.train_purchase_model()
-        elif model_type == "recommendation":
-            print(f"📊 Recommendation modeli eğitiliyor...", flush=True)
-            logger.info("📊 Recommendation modeli eğitiliyor...")
-            await trainer_instance.train_recommendation_model()
-        elif model_type == "anomaly_detection":
-            print(f"📊 Anomaly detection modeli eğitiliyor...", flush=True)
-            logger.info("📊 Anomaly detection modeli eğitiliyor...")
-            await trainer_instance.train_anomaly_model()
-        elif model_type == "segmentation":
-            print(f"📊 Segmentation modeli eğitiliyor...", flush=True)
-            logger.info("📊 Segmentation modeli eğitiliyor...")
-            await trainer_instance.train_segmentation_model()
-        elif model_type == "all":
-            print(f"📊 Tüm modeller eğitiliyor...", flush=True)
-            logger.info("📊 Tüm modeller eğitiliyor...")
-            await trainer_instance.train_all_models()
-        else:
-            error_msg = f"❌ Unknown model type: {model_type}"
-            print(error_msg, flush=True)
-            logger.error(error_msg)
-            return
-            
-        success_msg = f"✅ Model eğitimi tamamlandı: {model_type}"
-        print(f"\n{'='*60}", flush=True)
-        print(success_msg, flush=True)
-        print(f"{'='*60}\n", flush=True)
-        logger.info(f"{'='*60}")
-        logger.info(success_msg)
-        logger.info(f"{'='*60}")
-        
-    except Exception as e:
-        error_msg = f"❌ Model eğitimi hatası: {str(e)}"
-        print(f"\n{'='*60}", flush=True)
-        print(error_msg, flush=True)
-        print(f"Traceback:", flush=True)
-        traceback.print_exc(file=sys.stdout)
-        print(f"{'='*60}\n", flush=True)
-        logger.error(f"{'='*60}")
-        logger.error(error_msg, exc_info=True)
-        logger.error(f"{'='*60}")
+    refresh: Optional[bool] = False  # Bypass the cached result
 
 @router.post("/train")
-async def train_model(request: TrainRequest, background_tasks: BackgroundTasks):
-    """Trigger model training"""
+async def train_model(request: TrainRequest):
+    """Queue model training as a tracked job"""
     try:
-        print(f"\n{'='*60}", flush=True)
-        print(f"📥 Eğitim isteği alındı: {request.model_type}", flush=True)
-        print(f"{'='*60}\n", flush=True)
-        
         logger.info(f"{'='*60}")
         logger.info(f"📥 Eğitim isteği alındı: {request.model_type}")
         logger.info(f"{'='*60}")
         
-        if not trainer_instance:
+        if not job_manager_instance and trainer_proxy_url:
+            return await _forward('POST', '/train', request.model_dump())
+        
+        if not job_manager_instance:
             error_msg = "Trainer not initialized"
-            print(f"❌ {error_msg}", flush=True)
             logger.error(error_msg)
             raise HTTPException(status_code=503, detail=error_msg)
         
-        # Start training in background
-        background_tasks.add_task(
-            train_model_background,
-            request.model_type,
-            request.days or 30
-        )
+        days = request.days or 30
+        if request.model_type == "all":
+            submitted = job_manager_instance.submit_all(days, request.epochs, request.batch_size, bool(request.incremental))
+        elif request.model_type in job_manager_instance.TRAIN_METHODS:
+            submitted = [job_manager_instance.submit(
+                request.model_type, days, request.epochs, request.batch_size, bool(request.incremental)
+            )]
+        else:
+            raise HTTPException(status_code=400, detail=f"Unknown model type: {request.model_type}")
+        
+        jobs = [job.to_dict() for job, _ in submitted]
+        coalesced = [job.id for job, created in submitted if not created]
         
-        response_msg = f"✅ Eğitim başlatıldı: {request.model_type}"
-        print(response_msg, flush=True)
+        response_msg = f"✅ Eğitim kuyruğa alındı: {request.model_type} ({', '.join(j['job_id'] for j in jobs)})"
         logger.info(response_msg)
         
         return {
             "success": True,
-            "message": f"Training started for {request.model_type}",
+            "message": f"Training queued for {request.model_type}",
             "model_type": request.model_type,
-            "status": "training",
-            "days": request.days or 30
+            "status": jobs[0]["status"] if len(jobs) == 1 else "queued",
+            "days": days,
+            "job_id": jobs[0]["job_id"] if len(jobs) == 1 else None,
+            "jobs": jobs,
+            "coalesced": coalesced
         }
+    except HTTPException:
+        raise
     except Exception as e:
         error_msg = f"Training error: {e}"
-        print(f"❌ {error_msg}", flush=True)
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/jobs")
+async def list_jobs():
+    """List queued, running and recently finished training jobs"""
+    if not job_manager_instance and trainer_proxy_url:
+        return await _forward('GET', '/jobs')
+    if not job_manager_instance:
+        raise HTTPException(status_code=503, detail="Trainer not initialized")
+    return {
+        "success": True,
+        "jobs": job_manager_instance.list_jobs()
+    }
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get training job status and progress"""
+    if not job_manager_instance and trainer_proxy_url:
+        return await _forward('GET', f'/jobs/{job_id}')
+    if not job_manager_instance:
+        raise HTTPException(status_code=503, detail="Trainer not initialized")
+    
+    job = job_manager_instance.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    
+    return {
+        "success": True,
+        "job": job.to_dict()
+    }
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running training job"""
+    if not job_manager_instance and trainer_proxy_url:
+        return await _forward('POST', f'/jobs/{job_id}/cancel')
+    if not job_manager_instance:
+        raise HTTPException(status_code=503, detail="Trainer not initialized")
+    
+    job = job_manager_instance.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    
+    return {
+        "success": True,
+        "message": "Cancellation requested" if job.is_active else f"Job already {job.status}",
+        "job": job.to_dict()
+    }
+
+@router.websocket("/jobs/{job_id}/stream")
+async def stream_job(websocket: WebSocket, job_id: str):
+    """Stream training job progress until the job finishes"""
+    await websocket.accept()
+    if not job_manager_instance and trainer_proxy_url:
+        await _relay_job_stream(websocket, job_id)
+        return
+    job = job_manager_instance.get(job_id) if job_manager_instance else None
+    if not job:
+        await websocket.send_json({"error": f"Job not found: {job_id}"})
+        await websocket.close()
+        return
+    
+    queue = job.subscribe()
+    try:
+        while True:
+            try:
+                snapshot = await asyncio.wait_for(queue.get(), timeout=5)
+            except asyncio.TimeoutError:
+                # Keep elapsed/ETA fresh between epochs
+                snapshot = job.to_dict()
+            await websocket.send_json(snapshot)
+            if snapshot["status"] not in job.ACTIVE_STATES:
+                break
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info(f"Job stream client disconnected ({job_id})")
+    finally:
+        job.unsubscribe(queue)
+
 @router.post("/deploy")
 async def deploy_model(request: DeployRequest):
-    """Deploy a model version"""
+    """Point a model's "deployed" version at a registered version (serving picks it up on its next registry check)"""
     try:
-        # TODO: Implement deployment
+        from utils.model_loader import ModelLoader
+        loader = ModelLoader()
+        version = loader.deploy(request.model_name, request.version)
         return {
             "success": True,
-            "message": f"Model {request.model_name} v{request.version} deployed"
+            "message": f"Model {request.model_name} v{version} deployed"
         }
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         logger.error(f"Deployment error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -196,15 +280,121 @@ async def get_model_status(model_name: str):
             "status": "active" if exists else "not_found",
             "version": metadata.get("version", "unknown") if metadata else "unknown",
             "trained_at": metadata.get("trained_at") if metadata else None,
+            "deployed_version": loader.resolve_version(model_name, "deployed") if exists else None,
             "exists": exists
         }
     except Exception as e:
         logger.error(f"Get status error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Event window scan, one row per eventType plus the WITH ROLLUP total as the last row.
+# Event statistics count only events with a userId; the quality columns count all events.
+_EVENT_ANALYSIS_QUERY = """
+    SELECT 
+        eventType,
+        COUNT(userId) as count,
+        COUNT(DISTINCT userId) as unique_users,
+        COUNT(DISTINCT CASE WHEN userId IS NOT NULL THEN deviceId END) as unique_devices,
+        MIN(CASE WHEN userId IS NOT NULL THEN timestamp END) as first_event,
+        MAX(CASE WHEN userId IS NOT NULL THEN timestamp END) as last_event,
+        COUNT(*) as all_events,
+        SUM(userId IS NULL) as null_user_events,
+        SUM(eventData IS NULL OR eventData = '{}') as empty_data_events,
+        SUM(sessionId IS NULL) as null_session_events
+    FROM user_behavior_events
+    WHERE timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
+    GROUP BY eventType WITH ROLLUP
+"""
+
+_PURCHASE_ANALYSIS_QUERY = """
+    SELECT 
+        COUNT(*) as total_purchases,
+        COUNT(DISTINCT userId) as purchasing_users,
+        SUM(totalAmount) as total_revenue
+    FROM orders
+    WHERE createdAt >= DATE_SUB(NOW(), INTERVAL %s DAY)
+        AND status = 'completed'
+"""
+
+_analysis_cache = AsyncTTLCache(ttl=config.ANALYZE_CACHE_TTL, max_stale=config.ANALYZE_CACHE_MAX_STALE)
+
+async def _rollup_analysis(days: int) -> Optional[Dict[str, Any]]:
+    """Event statistics from the rollups, or None when they do not cover the whole window"""
+    if not event_rollups_instance:
+        return None
+    try:
+        if not await event_rollups_instance.covers(days):
+            return None
+        rollup = await event_rollups_instance.query(days)
+    except Exception as e:
+        logger.warning(f"⚠️ Event rollups unavailable, scanning events: {e}")
+        return None
+    
+    active_days = [entry['day'] for entry in rollup['daily'] if entry['events']]
+    user_stats = [{
+        "total_users": rollup['total_users'],
+        "total_events": rollup['total_events'],
+        "total_devices": rollup['total_devices'],
+        "first_event": active_days[0] if active_days else None,
+        "last_event": active_days[-1] if active_days else None
+    }]
+    return {"event_stats": rollup['event_statistics'], "user_stats": user_stats, "quality_stats": [rollup['data_quality']]}
+
+async def _sql_analysis(days: int) -> Dict[str, Any]:
+    """Event statistics from a scan of the event window"""
+    event_rows = await db_connector_instance.execute(_EVENT_ANALYSIS_QUERY, (days,), workload='analytics')
+    
+    total = event_rows[-1] if event_rows else {}
+    event_stats = sorted(
+        ({"eventType": row['eventType'], "count": int(row['count']), "unique_users": int(row['unique_users']),
+          "unique_devices": int(row['unique_devices'])}
+         for row in event_rows[:-1] if row['count']),
+        key=lambda row: row['count'],
+        reverse=True
+    )
+    user_stats = [{
+        "total_users": int(total.get('unique_users') or 0),
+        "total_events": int(total.get('count') or 0),
+        "total_devices": int(total.get('unique_devices') or 0),
+        "first_event": total.get('first_event'),
+        "last_event": total.get('last_event')
+    }]
+    quality_stats = [{
+        "total_events": int(total.get('all_events') or 0),
+        "null_user_events": int(total.get('null_user_events') or 0),
+        "empty_data_events": int(total.get('empty_data_events') or 0),
+        "null_session_events": int(total.get('null_session_events') or 0)
+    }]
+    return {"event_stats": event_stats, "user_stats": user_stats, "quality_stats": quality_stats}
+
+async def _compute_analysis(days: int, analysis_type: str) -> Dict[str, Any]:
+    """Build the analysis response: event counts from the rollups when they cover the window (else the
+    event scan), purchases from the orders query, run concurrently"""
+    start = time.perf_counter()
+    rollup_stats, purchase_stats = await asyncio.gather(
+        _rollup_analysis(days),
+        db_connector_instance.execute(_PURCHASE_ANALYSIS_QUERY, (days,), workload='analytics')
+    )
+    source = "rollups" if rollup_stats is not None else "events"
+    stats = rollup_stats if rollup_stats is not None else await _sql_analysis(days)
+    event_stats, user_stats, quality_stats = stats['event_stats'], stats['user_stats'], stats['quality_stats']
+    
+    logger.info(f"📊 Analysis for {days} days computed from {source} in {time.perf_counter() - start:.2f}s")
+    return {
+        "success": True,
+        "analysis_type": analysis_type,
+        "days": days,
+        "source": source,
+        "event_statistics": event_stats,
+        "user_statistics": user_stats[0],
+        "purchase_statistics": purchase_stats[0] if purchase_stats else {},
+        "data_quality": quality_stats[0],
+        "recommendations": _generate_recommendations(event_stats, user_stats, purchase_stats, quality_stats)
+    }
+
 @router.post("/analyze")
 async def analyze_data(request: AnalyzeRequest):
-    """Analyze training data"""
+    """Analyze training data (cached per days/analysis_type, refreshed in the background)"""
     try:
         if not db_connector_instance:
             raise HTTPException(status_code=503, detail="Database not connected")
@@ -212,69 +402,19 @@ async def analyze_data(request: AnalyzeRequest):
         days = request.days or 30
         analysis_type = request.analysis_type or "overview"
         
-        # Get event statistics
-        event_stats_query = """
-            SELECT 
-                eventType,
-                COUNT(*) as count,
-                COUNT(DISTINCT userId) as unique_users,
-                COUNT(DISTINCT deviceId) as unique_devices
-            FROM user_behavior_events
-            WHERE timestamp >= DATE_SUB(NOW(), INTERVAL ? DAY)
-                AND userId IS NOT NULL
-            GROUP BY eventType
-            ORDER BY count DESC
-        """
-        event_stats = await db_connector_instance.execute(event_stats_query, (days,))
-        
-        # Get user statistics
-        user_stats_query = """
-            SELECT 
-                COUNT(DISTINCT userId) as total_users,
-                COUNT(*) as total_events,
-                COUNT(DISTINCT deviceId) as total_devices,
-                MIN(timestamp) as first_event,
-                MAX(timestamp) as last_event
-            FROM user_behavior_events
-            WHERE timestamp >= DATE_SUB(NOW(), INTERVAL ? DAY)
-                AND userId IS NOT NULL
-        """
-        user_stats = await db_connector_instance.execute(user_stats_query, (days,))
-        
-        # Get purchase statistics
-        purchase_stats_query = """
-            SELECT 
-                COUNT(*) as total_purchases,
-                COUNT(DISTINCT userId) as purchasing_users,
-                SUM(totalAmount) as total_revenue
-            FROM orders
-            WHERE createdAt >= DATE_SUB(NOW(), INTERVAL ? DAY)
-                AND status = 'completed'
-        """
-        purchase_stats = await db_connector_instance.execute(purchase_stats_query, (days,))
-        
-        # Get data quality metrics
-        quality_query = """
-            SELECT 
-                COUNT(*) as total_events,
-                COUNT(CASE WHEN userId IS NULL THEN 1 END) as null_user_events,
-                COUNT(CASE WHEN eventData IS NULL OR eventData = '{}' THEN 1 END) as empty_data_events,
-                COUNT(CASE WHEN sessionId IS NULL THEN 1 END) as null_session_events
-            FROM user_behavior_events
-            WHERE timestamp >= DATE_SUB(NOW(), INTERVAL ? DAY)
-        """
-        quality_stats = await db_connector_instance.execute(quality_query, (days,))
-        
+        result, computed_at, cached = await _analysis_cache.get(
+            (days, analysis_type),
+            lambda: _compute_analysis(days, analysis_type),
+            refresh=bool(request.refresh)
+        )
         return {
-            "success": True,
-            "analysis_type": analysis_type,
-            "days": days,
-            "event_statistics": event_stats,
-            "user_statistics": user_stats[0] if user_stats else {},
-            "purchase_statistics": purchase_stats[0] if purchase_stats else {},
-            "data_quality": quality_stats[0] if quality_stats else {},
-            "recommendations": _generate_recommendations(event_stats, user_stats, purchase_stats, quality_stats)
+            **result,
+            "cached": cached,
+            "computed_at": datetime.fromtimestamp(computed_at).isoformat(),
+            "age_seconds": round(time.time() - computed_at, 1)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Analysis error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,219 @@
+"""Online scoring: synchronous purchase, anomaly, recommendation and segment scores for one or many users
+
+Each endpoint builds the users' features from their recent events (given in the request,
+else the realtime processor's buffer, else MySQL) and runs the model through the per-model
+DynamicBatcher (models/batching.model_batcher) it shares with the realtime processor, so
+concurrent requests share model calls.
+"""
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Optional, List, Dict, Any
+from collections import deque
+import asyncio
+import logging
+import time
+import numpy as np
+from config import config
+from models.batching import BatchStats, batcher_stats, model_batcher
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Set from main.py
+realtime_processor_instance = None
+db_connector_instance = None
+
+def set_realtime_processor(processor):
+    """Set realtime processor instance (served models, event buffer) from main.py"""
+    global realtime_processor_instance
+    realtime_processor_instance = processor
+
+def set_db_connector(db_connector):
+    """Set db connector instance from main.py"""
+    global db_connector_instance
+    db_connector_instance = db_connector
+
+class ScoreRequest(BaseModel):
+    user_id: Optional[Any] = None
+    user_ids: Optional[List[Any]] = None
+    events: Optional[Dict[str, List[Dict[str, Any]]]] = None  # Recent events per user id (else buffer, then MySQL)
+
+class RecommendRequest(ScoreRequest):
+    top_k: int = 10
+    candidate_product_ids: Optional[List[Any]] = None  # Default: the trained catalog
+
+_latencies: Dict[str, deque] = {}  # endpoint -> request seconds
+
+def _model(attr: str, label: str):
+    model = getattr(realtime_processor_instance, attr, None) if realtime_processor_instance else None
+    if model is None or not model.is_trained:
+        raise HTTPException(status_code=503, detail=f"{label} model not loaded")
+    if hasattr(model, 'is_calibrated') and not model.is_calibrated():
+        # Saved before training-time calibration: its scores would depend on the users scored together
+        raise HTTPException(status_code=503, detail=f"{label} model has no training-time calibration, retrain it")
+    return model
+
+def _users(request: ScoreRequest) -> List[Any]:
+    users = list(request.user_ids or [])
+    if request.user_id is not None:
+        users.insert(0, request.user_id)
+    users = list(dict.fromkeys(users))
+    if not users:
+        raise HTTPException(status_code=400, detail="user_id or user_ids is required")
+    if len(users) > config.SCORING_MAX_USERS:
+        raise HTTPException(status_code=400, detail=f"At most {config.SCORING_MAX_USERS} users per request")
+    return users
+
+async def _user_events(users: List[Any], provided: Optional[Dict[str, List[Dict[str, Any]]]]) -> Dict[Any, list]:
+    """Recent events per user: request, realtime buffer, then one MySQL query for the rest"""
+    provided = provided or {}
+    buffered = realtime_processor_instance.user_sequences if realtime_processor_instance else {}
+    limit = config.SEQUENCE_LENGTH * 2  # Same history the realtime processor keeps
+    events, missing = {}, []
+    for user_id in users:
+        if str(user_id) in provided:
+            events[user_id] = provided[str(user_id)][-limit:]
+        elif user_id in buffered:
+            events[user_id] = buffered[user_id]
+        else:
+            missing.append(user_id)
+            events[user_id] = []
+    
+    if missing and db_connector_instance:
+        query = f"""
+            SELECT userId, eventType, eventData, timestamp, sessionId
+            FROM user_behavior_events
+            WHERE userId IN ({', '.join(['%s'] * len(missing))})
+                AND timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
+            ORDER BY userId, timestamp
+        """
+        rows = await db_connector_instance.execute(query, (*missing, config.SCORING_HISTORY_DAYS), workload='realtime')
+        by_user = {}
+        for row in rows:
+            by_user.setdefault(row['userId'], []).append(row)
+        for user_id in missing:
+            events[user_id] = by_user.get(user_id, by_user.get(str(user_id), []))[-limit:]
+    return events
+
+def _features(users: List[Any], events: Dict[Any, list]) -> np.ndarray:
+    data_processor = realtime_processor_instance.data_processor
+    return np.array([data_processor.create_user_features(events[u]) for u in users], dtype=np.float32)
+
+def _respond(endpoint: str, model_name: str, started: float, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    elapsed = time.perf_counter() - started
+    _latencies.setdefault(endpoint, deque(maxlen=2000)).append(elapsed)
+    return {
+        "success": True,
+        "model_version": realtime_processor_instance.served_versions.get(model_name),
+        "latency_ms": round(1000 * elapsed, 2),
+        "results": results
+    }
+
+@router.post("/predict/purchase")
+async def predict_purchase(request: ScoreRequest):
+    """Purchase probability per user from the last SEQUENCE_LENGTH events"""
+    started = time.perf_counter()
+    model = _model('purchase_model', 'Purchase')
+    users = _users(request)
+    try:
+        events = await _user_events(users, request.events)
+        data_processor = realtime_processor_instance.data_processor
+        sequences = np.array([data_processor.create_user_sequence(events[u]) for u in users], dtype=np.float32)
+        scores = np.asarray(await model_batcher('purchase', model).predict([sequences, _features(users, events)])).ravel()
+    except Exception as e:
+        logger.error(f"Purchase scoring error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return _respond('purchase', 'purchase_model', started, [
+        {"userId": u, "probability": float(p), "eventCount": len(events[u])} for u, p in zip(users, scores)
+    ])
+
+@router.post("/predict/anomaly")
+async def predict_anomaly(request: ScoreRequest):
+    """Hybrid (autoencoder + IsolationForest) anomaly score per user, on the training-time scales"""
+    started = time.perf_counter()
+    model = _model('anomaly_model', 'Anomaly')
+    users = _users(request)
+    try:
+        events = await _user_events(users, request.events)
+        features = _features(users, events)
+        reconstructed = await model_batcher('anomaly', model).predict([model.normalize(features)])
+        scores, is_anomaly, anomaly_types = model.detect_anomaly_hybrid(features, reconstructed)
+    except Exception as e:
+        logger.error(f"Anomaly scoring error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return _respond('anomaly', 'anomaly_model', started, [
+        {"userId": u, "anomalyScore": float(scores[i]), "isAnomaly": bool(is_anomaly[i]),
+         "anomalyType": str(anomaly_types[i]), "eventCount": len(events[u])}
+        for i, u in enumerate(users)
+    ])
+
+@router.post("/recommend")
+async def recommend(request: RecommendRequest):
+    """Top-k products per user (unknown users get the cold-start row)"""
+    started = time.perf_counter()
+    model = _model('recommendation_model', 'Recommendation')
+    users = _users(request)
+    try:
+        candidates = model.candidate_rows(np.asarray(request.candidate_product_ids)
+                                          if request.candidate_product_ids is not None else None).astype(np.int64)
+        results = []
+        if len(candidates) == 0:
+            results = [{"userId": u, "productIds": [], "scores": []} for u in users]
+        else:
+            batcher = model_batcher('recommendation', model)
+            user_rows = [model.user_row(u) for u in users]
+            scores = await asyncio.gather(*(batcher.predict([np.full(len(candidates), row, dtype=np.int64), candidates])
+                                            for row in user_rows))
+            for user_id, user_scores in zip(users, scores):
+                products, top_scores = model.top_products(candidates, np.asarray(user_scores).ravel(), request.top_k)
+                results.append({"userId": user_id, "productIds": products.tolist(),
+                                "scores": [float(s) for s in top_scores]})
+    except Exception as e:
+        logger.error(f"Recommendation error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return _respond('recommend', 'recommendation_model', started, results)
+
+@router.post("/segment")
+async def segment(request: ScoreRequest):
+    """K-means segment per user, on the training-time scales"""
+    started = time.perf_counter()
+    model = _model('segmentation_model', 'Segmentation')
+    users = _users(request)
+    try:
+        events = await _user_events(users, request.events)
+        features = _features(users, events)
+        encoded = None
+        if model.has_autoencoder():
+            encoded = await model_batcher('segmentation', model).predict([model.normalize(features)])
+        segment_ids, confidence = model.predict_kmeans(features, encoded=encoded)
+    except Exception as e:
+        logger.error(f"Segmentation error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return _respond('segment', 'segmentation_model', started, [
+        {"userId": u, "segmentId": int(segment_ids[i]), "segmentName": model.get_segment_name(int(segment_ids[i])),
+         "confidence": float(confidence[i])}
+        for i, u in enumerate(users)
+    ])
+
+@router.get("/scoring/stats")
+async def scoring_stats():
+    """Request latency per endpoint against the p50/p99 targets, and batching per model"""
+    endpoints = {}
+    for endpoint, latencies in _latencies.items():
+        values = list(latencies)
+        p50 = 1000 * BatchStats._percentile(values, 0.5)
+        p99 = 1000 * BatchStats._percentile(values, 0.99)
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "p50_ms": round(p50, 2),
+            "p99_ms": round(p99, 2),
+            "meets_targets": p50 <= config.SCORING_P50_TARGET_MS and p99 <= config.SCORING_P99_TARGET_MS
+        }
+    return {
+        "success": True,
+        "targets_ms": {"p50": config.SCORING_P50_TARGET_MS, "p99": config.SCORING_P99_TARGET_MS},
+        "batching": {"max_wait_ms": config.SCORING_MAX_WAIT_MS, "max_batch_rows": config.SCORING_MAX_BATCH_ROWS},
+        "endpoints": endpoints,
+        "models": batcher_stats()
+    }
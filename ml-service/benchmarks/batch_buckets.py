@@ -0,0 +1,98 @@
+"""Request latency with ad-hoc Keras predict vs bucketed, warmed-up tf.function backends
+
+A synthetic workload of --requests batches with sizes drawn from a heavy-tailed
+distribution (mostly small, occasionally hundreds of rows) is replayed against the purchase
+model and the anomaly autoencoder (fresh weights per mode, so the first call is cold):
+  
+  predict    keras_model.predict per request, no warm-up (the previous serving path)
+  bucketed   KerasBackend behind BucketedBackend (BATCH_BUCKETS), warmed up at load
+  tflite     TFLiteBackend behind BucketedBackend, warmed up at load
+
+Reports load + warm-up time, first request, p50, p99 and max per mode.
+    
+    python benchmarks/batch_buckets.py --requests 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def workload(rng, requests: int, max_batch: int) -> np.ndarray:
+    return np.clip(np.rint(rng.lognormal(1.0, 1.4, requests)), 1, max_batch).astype(int)
+
+def build(model_key: str):
+    """Fresh Keras model and an input generator"""
+    from config import config
+    from models.purchase_prediction import PurchasePredictionModel
+    from models.anomaly_detection import AnomalyDetectionModel
+    
+    rng = np.random.default_rng(0)
+    if model_key == 'purchase':
+        model = PurchasePredictionModel(sequence_length=config.SEQUENCE_LENGTH)
+        model.build_model()
+        (_, length, event_types), (_, feature_dim) = model.model.input_shape
+        return model.model, lambda n: [rng.random((n, length, event_types), dtype=np.float32),
+                                       rng.random((n, feature_dim), dtype=np.float32)]
+    model = AnomalyDetectionModel()
+    model.build_autoencoder()
+    return model.autoencoder, lambda n: [rng.random((n, model.input_dim), dtype=np.float32)]
+
+def run(mode: str, model_key: str, sizes: np.ndarray):
+    from models.backends import KerasBackend, TFLiteBackend, BucketedBackend, batch_buckets, warm_up
+    
+    keras_model, make_inputs = build(model_key)
+    start = time.perf_counter()
+    if mode == 'predict':
+        predict = lambda inputs: keras_model.predict(inputs if len(inputs) > 1 else inputs[0], verbose=0)
+    else:
+        inner = KerasBackend(keras_model) if mode == 'bucketed' else TFLiteBackend(keras_model)
+        backend = BucketedBackend(inner, batch_buckets())
+        warm_up(backend, make_inputs)
+        predict = backend.predict
+    load_s = time.perf_counter() - start
+    
+    requests = [make_inputs(int(n)) for n in sizes]
+    samples = []
+    for inputs in requests:
+        start = time.perf_counter()
+        predict(inputs)
+        samples.append(1000 * (time.perf_counter() - start))
+    samples = np.array(samples)
+    return {
+        "load_warmup_s": round(load_s, 2),
+        "first_ms": round(float(samples[0]), 2),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "max_ms": round(float(samples.max()), 2),
+        "total_s": round(float(samples.sum()) / 1000, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--max-batch', type=int, default=600)
+    parser.add_argument('--models', nargs='+', choices=('purchase', 'anomaly'), default=['purchase', 'anomaly'])
+    parser.add_argument('--modes', nargs='+', choices=('predict', 'bucketed', 'tflite'), default=['predict', 'bucketed', 'tflite'])
+    args = parser.parse_args()
+    
+    from models.backends import batch_buckets
+    
+    sizes = workload(np.random.default_rng(1), args.requests, args.max_batch)
+    print(f"{args.requests} requests, batch sizes p50 {int(np.median(sizes))}, p99 {int(np.percentile(sizes, 99))}, "
+          f"{len(np.unique(sizes))} distinct; buckets {batch_buckets()}")
+    for model_key in args.models:
+        print(f"\n[{model_key}]")
+        for mode in args.modes:
+            try:
+                result = run(mode, model_key, sizes)
+            except Exception as e:
+                print(f"  {mode:9s} failed: {e}")
+                continue
+            print(f"  {mode:9s} " + '  '.join(f"{k}={v}" for k, v in result.items()), flush=True)
+
+if __name__ == '__main__':
+    main()
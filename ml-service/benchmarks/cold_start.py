@@ -0,0 +1,129 @@
+"""Cold start of the serving process: Keras serving vs serving-only (NumPy runtimes, lazy TF)
+
+Saves the four models (default sizes) into a temporary registry, then starts fresh
+interpreters that import main, build the realtime processor, load the deployed models and
+run one inference each, reporting the time of every phase, RSS and whether TensorFlow was
+imported.
+    
+    python benchmarks/cold_start.py --runs 3
+    python benchmarks/cold_start.py --models anomaly_model segmentation_model purchase_model
+
+Modes:
+  keras    SERVING_ONLY=false, NUMPY_INFERENCE=false
+  serving  SERVING_ONLY=true,  NUMPY_INFERENCE=true,  MODEL_BACKENDS=purchase=numpy
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = {
+    'keras': {'SERVING_ONLY': 'false', 'NUMPY_INFERENCE': 'false'},
+    'serving': {'SERVING_ONLY': 'true', 'NUMPY_INFERENCE': 'true', 'MODEL_BACKENDS': 'purchase=numpy'}
+}
+
+ALL_MODELS = ('purchase_model', 'recommendation_model', 'anomaly_model', 'segmentation_model')
+
+def build_registry(directory: str, names):
+    from config import config
+    config.MODEL_STORAGE_PATH = directory
+    config.MODEL_SAVE_MMW = True
+    from models.purchase_prediction import PurchasePredictionModel
+    from models.recommendation import RecommendationModel
+    from models.anomaly_detection import AnomalyDetectionModel
+    from models.segmentation import SegmentationModel
+    from utils.model_loader import ModelLoader
+    import numpy as np
+    
+    loader = ModelLoader(directory)
+    data = np.random.default_rng(0).random((256, 50)).astype(np.float32)
+    
+    purchase = PurchasePredictionModel(sequence_length=config.SEQUENCE_LENGTH, embedding_dim=config.EMBEDDING_DIM)
+    purchase.build_model()
+    recommendation = RecommendationModel()
+    recommendation.build_model()
+    anomaly = AnomalyDetectionModel()
+    anomaly.build_autoencoder()
+    anomaly.train_isolation_forest(data)
+    segmentation = SegmentationModel()
+    segmentation.build_autoencoder()
+    segmentation.train_kmeans(data)
+    
+    models = {'purchase_model': purchase, 'recommendation_model': recommendation,
+              'anomaly_model': anomaly, 'segmentation_model': segmentation}
+    for name in names:
+        model = models[name]
+        model.save(loader.get_model_path(name, '1'))
+        loader.save_model_metadata(name, '1', {"benchmark": True})
+
+def child():
+    """Fresh interpreter: time import, model loading and first inference"""
+    from utils.process_stats import process_start_time, memory_usage_mb
+    started = process_start_time() or time.time()
+    phases = {"interpreter_s": round(time.time() - started, 3)}
+    
+    t0 = time.time()
+    import main  # noqa: F401
+    phases["import_main_s"] = round(time.time() - t0, 3)
+    phases["tf_after_import"] = 'tensorflow' in sys.modules
+    
+    import asyncio
+    import numpy as np
+    from realtime_processor import RealtimeProcessor
+    t0 = time.time()
+    processor = RealtimeProcessor(None, None)
+    asyncio.run(processor.load_models())
+    phases["load_models_s"] = round(time.time() - t0, 3)
+    phases["model_load_s"] = {name: status.get("load_seconds") for name, status in processor.model_status.items()}
+    phases["tf_after_load"] = 'tensorflow' in sys.modules
+    
+    t0 = time.time()
+    features = np.random.default_rng(0).random((1, 50))
+    if processor.purchase_model:
+        processor.purchase_model.predict(np.zeros((1, 20, 10)), features)
+    if processor.anomaly_model:
+        processor.anomaly_model.detect_anomaly_hybrid(features)
+    if processor.segmentation_model:
+        processor.segmentation_model.predict_kmeans(np.repeat(features, 2, axis=0))
+    if processor.recommendation_model:
+        processor.recommendation_model.recommend(0, np.arange(10), top_k=5)
+    phases["first_inference_s"] = round(time.time() - t0, 3)
+    phases["tf_after_inference"] = 'tensorflow' in sys.modules
+    phases["ready_s"] = round(time.time() - started, 3)
+    phases.update(memory_usage_mb())
+    print(json.dumps(phases))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--models', nargs='+', choices=ALL_MODELS, default=list(ALL_MODELS),
+                        help='models in the registry (recommendation still needs Keras)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        child()
+        return
+    
+    with tempfile.TemporaryDirectory(prefix='cold_start_') as directory:
+        build_registry(directory, args.models)
+        for mode, env in MODES.items():
+            results = []
+            for _ in range(args.runs):
+                child_env = dict(os.environ, MODEL_STORAGE_PATH=directory, ROLLUPS_ENABLED='false', **env)
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=ROOT,
+                                        env=child_env, capture_output=True, text=True, check=True).stdout
+                results.append(json.loads(output.strip().splitlines()[-1]))
+            best = min(results, key=lambda r: r['ready_s'])
+            print(f"\n[{mode}] best of {args.runs}")
+            for key, value in best.items():
+                print(f"  {key:20s} {value}")
+
+if __name__ == '__main__':
+    main()
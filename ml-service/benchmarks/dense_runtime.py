@@ -0,0 +1,110 @@
+"""Parity and latency of the NumPy dense runtime against Keras for the autoencoders
+
+Builds the anomaly and segmentation autoencoders (weights perturbed so no unit is trivially
+zero), checks utils/dense_runtime against Keras - copied from the live model and read from a
+.mmw file, full network and the 'encoded' cut - and times both at batch sizes 1 to 4096.
+Exits non-zero if any output differs by more than --tolerance.
+    
+    python benchmarks/dense_runtime.py --repeats 50
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH_SIZES = (1, 8, 64, 512, 4096)
+
+def build_models():
+    from models.anomaly_detection import AnomalyDetectionModel
+    from models.segmentation import SegmentationModel
+    
+    rng = np.random.default_rng(0)
+    anomaly = AnomalyDetectionModel()
+    anomaly.build_autoencoder()
+    segmentation = SegmentationModel()
+    segmentation.build_autoencoder()
+    for keras_model in (anomaly.autoencoder, segmentation.autoencoder):
+        keras_model.set_weights([w + rng.normal(0, 0.05, w.shape).astype(w.dtype) for w in keras_model.get_weights()])
+    return {
+        'anomaly': (anomaly.autoencoder, None),
+        'anomaly_encoder': (anomaly.autoencoder, 'encoded'),
+        'segmentation': (segmentation.autoencoder, None),
+        'segmentation_encoder': (segmentation.autoencoder, 'encoded')
+    }
+
+def keras_reference(keras_model, output_layer):
+    from tensorflow import keras
+    if output_layer is None:
+        return keras_model
+    return keras.Model(keras_model.input, keras_model.get_layer(output_layer).output)
+
+def timed(fn, repeats: int) -> float:
+    """Median milliseconds per call after one warm-up call"""
+    fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(1000 * (time.perf_counter() - start))
+    return float(np.median(samples))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeats', type=int, default=30)
+    parser.add_argument('--tolerance', type=float, default=1e-5)
+    args = parser.parse_args()
+    
+    from config import config
+    from utils.dense_runtime import DenseNetwork
+    from utils.weight_file import save_keras_model, weight_file_path
+    
+    config.MODEL_SAVE_MMW = True
+    models = build_models()
+    rng = np.random.default_rng(1)
+    failures = 0
+    
+    with tempfile.TemporaryDirectory(prefix='dense_runtime_') as directory:
+        print("Parity (max abs error vs Keras predict)")
+        runtimes = {}
+        for name, (keras_model, output_layer) in models.items():
+            h5_path = os.path.join(directory, f"{name}.h5")
+            save_keras_model(keras_model, h5_path)
+            reference = keras_reference(keras_model, output_layer)
+            variants = {
+                'from_keras': DenseNetwork.from_keras(keras_model, output_layer),
+                'from_weight_file': DenseNetwork.from_weight_file(weight_file_path(h5_path), output_layer)
+            }
+            runtimes[name] = (reference, variants['from_weight_file'])
+            
+            for batch_size in BATCH_SIZES:
+                x = rng.random((batch_size, keras_model.input_shape[1]), dtype=np.float32)
+                expected = reference.predict(x, verbose=0)
+                for variant, runtime in variants.items():
+                    error = float(np.max(np.abs(runtime.predict(x) - expected)))
+                    ok = error <= args.tolerance
+                    failures += not ok
+                    if not ok or batch_size == BATCH_SIZES[-1]:
+                        print(f"  {name:22s} {variant:17s} batch {batch_size:5d}: {error:.2e} {'ok' if ok else 'FAIL'}")
+        
+        print(f"\nLatency (median ms over {args.repeats} calls)")
+        print(f"  {'model':22s} {'batch':>6s} {'keras predict':>14s} {'keras __call__':>15s} {'numpy':>9s} {'speedup':>8s}")
+        for name, (reference, runtime) in runtimes.items():
+            for batch_size in BATCH_SIZES:
+                x = rng.random((batch_size, runtime.input_dim), dtype=np.float32)
+                predict_ms = timed(lambda: reference.predict(x, verbose=0), args.repeats)
+                call_ms = timed(lambda: reference(x, training=False).numpy(), args.repeats)
+                numpy_ms = timed(lambda: runtime.predict(x), args.repeats)
+                print(f"  {name:22s} {batch_size:6d} {predict_ms:14.3f} {call_ms:15.3f} {numpy_ms:9.3f} "
+                      f"{predict_ms / numpy_ms:7.1f}x")
+    
+    if failures:
+        print(f"\n{failures} parity checks above tolerance {args.tolerance}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Fastest inference backend per model and batch size on this host
+
+Builds the four models (weights perturbed), runs every backend that can be built here
+(keras, tflite, torchscript if PyTorch is installed, numpy) against Keras for parity, times
+them at batch sizes 1 to 4096 and writes the winners to BACKEND_PROFILE_PATH, which
+INFERENCE_BACKEND=auto (or MODEL_BACKENDS=<model>=auto) reads at load time. Backends off
+the parity tolerance are never picked.
+    
+    python benchmarks/inference_backends.py --repeats 30
+    python benchmarks/inference_backends.py --models purchase recommendation --output /tmp/profile.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH_SIZES = (1, 8, 64, 512, 4096)
+
+def build_models():
+    """model key -> (Keras model, NumPy network, input generator)"""
+    from config import config
+    from models.purchase_prediction import PurchasePredictionModel
+    from models.recommendation import RecommendationModel
+    from models.anomaly_detection import AnomalyDetectionModel
+    from models.segmentation import SegmentationModel
+    from utils.dense_runtime import DenseNetwork
+    from utils.lstm_runtime import PurchaseNetwork
+    from utils.ncf_runtime import RecommendationNetwork
+    
+    rng = np.random.default_rng(0)
+    purchase = PurchasePredictionModel(sequence_length=config.SEQUENCE_LENGTH)
+    purchase.build_model()
+    recommendation = RecommendationModel()
+    recommendation.build_model()
+    anomaly = AnomalyDetectionModel()
+    anomaly.build_autoencoder()
+    segmentation = SegmentationModel()
+    segmentation.build_autoencoder()
+    for keras_model in (purchase.model, recommendation.model, anomaly.autoencoder, segmentation.autoencoder):
+        keras_model.set_weights([w + rng.normal(0, 0.05, w.shape).astype(w.dtype) for w in keras_model.get_weights()])
+    encoder = segmentation._encoder()
+    
+    (_, length, event_types), (_, feature_dim) = purchase.model.input_shape
+    return {
+        'purchase': (purchase.model, PurchaseNetwork.from_keras(purchase.model),
+                     lambda n: [rng.random((n, length, event_types), dtype=np.float32),
+                                rng.random((n, feature_dim), dtype=np.float32)]),
+        'recommendation': (recommendation.model, RecommendationNetwork.from_keras(recommendation.model),
+                           lambda n: [np.full(n, rng.integers(0, recommendation.num_users + 1)),
+                                      rng.integers(0, recommendation.num_products + 1, n)]),
+        'anomaly': (anomaly.autoencoder, DenseNetwork.from_keras(anomaly.autoencoder),
+                    lambda n: [rng.random((n, anomaly.input_dim), dtype=np.float32)]),
+        'segmentation': (encoder, DenseNetwork.from_keras(segmentation.autoencoder, 'encoded'),
+                         lambda n: [rng.random((n, encoder.input_shape[1]), dtype=np.float32)])
+    }
+
+def timed(fn, repeats: int) -> float:
+    """Median milliseconds per call after one warm-up call"""
+    fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(1000 * (time.perf_counter() - start))
+    return float(np.median(samples))
+
+def routes(winners):
+    """[(batch size, backend)] ascending -> [(max batch size, backend)] with runs merged"""
+    merged = []
+    for batch_size, name in winners:
+        if merged and merged[-1][1] == name:
+            merged[-1] = [batch_size, name]
+        else:
+            merged.append([batch_size, name])
+    return merged
+
+def main():
+    from config import config
+    from models.backends import BACKENDS, create_backend, load_profile
+    
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--models', nargs='+', choices=('purchase', 'recommendation', 'anomaly', 'segmentation'),
+                        default=['purchase', 'recommendation', 'anomaly', 'segmentation'])
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    parser.add_argument('--output', default=config.BACKEND_PROFILE_PATH, help='profile JSON (empty: do not write)')
+    args = parser.parse_args()
+    
+    models = build_models()
+    profile = {"host": platform.node(), "cpu_count": os.cpu_count(), "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+               "batch_sizes": list(BATCH_SIZES), "models": {}}
+    if args.output:
+        profile["models"] = load_profile(args.output).get('models', {})  # Keep models not re-measured
+    
+    for key in args.models:
+        keras_model, network, make_inputs = models[key]
+        backends = {}
+        for name in args.backends:
+            try:
+                backends[name] = create_backend(name, lambda: keras_model, lambda: network)
+            except Exception as e:
+                print(f"  {key:15s} {name:12s} unavailable: {e}")
+        
+        print(f"\n[{key}] median ms over {args.repeats} calls (max abs error vs keras)")
+        print(f"  {'batch':>6s} " + ' '.join(f"{name:>20s}" for name in backends) + f" {'best':>12s}")
+        results, winners = {}, []
+        for batch_size in BATCH_SIZES:
+            inputs = make_inputs(batch_size)
+            expected = np.asarray(keras_model.predict(inputs if len(inputs) > 1 else inputs[0], verbose=0))
+            row = {}
+            for name, backend in backends.items():
+                error = float(np.max(np.abs(np.asarray(backend.predict(inputs)).reshape(expected.shape) - expected)))
+                row[name] = {"ms": round(timed(lambda: backend.predict(inputs), args.repeats), 4), "error": error}
+            eligible = {name: r["ms"] for name, r in row.items() if r["error"] <= args.tolerance}
+            best = min(eligible, key=eligible.get) if eligible else 'keras'
+            results[str(batch_size)] = dict(row, best=best)
+            winners.append((batch_size, best))
+            cells = ' '.join(f"{r['ms']:10.3f} ({r['error']:.0e})" for r in row.values())
+            print(f"  {batch_size:6d} {cells} {best:>12s}")
+        
+        totals = {name: sum(results[str(b)][name]["ms"] for b in BATCH_SIZES) for name in backends
+                  if all(results[str(b)][name]["error"] <= args.tolerance for b in BATCH_SIZES)}
+        profile["models"][key] = {
+            "batches": results,
+            "best": min(totals, key=totals.get) if totals else 'keras',
+            "routes": routes(winners)
+        }
+        print(f"  best overall: {profile['models'][key]['best']}, routes: {profile['models'][key]['routes']}")
+    
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(profile, f, indent=2)
+        print(f"\nProfile written to {args.output}")
+
+if __name__ == '__main__':
+    main()
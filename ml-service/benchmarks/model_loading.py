@@ -0,0 +1,155 @@
+"""Load time and memory per worker: .h5 vs memory-mapped weight files (.mmw)
+
+Builds the four models with their default sizes, saves them in both formats, then starts
+--workers fresh processes per format that load every model and report load time, RSS
+and PSS (proportional set size: pages shared between processes are split among them).
+    
+    python benchmarks/model_loading.py --workers 4
+
+Formats:
+  h5       keras.models.load_model
+  mmw      architecture from the weight file, weights copied into the Keras variables
+  mmw-raw  only the memory maps (what a numpy serving runtime reads), pages shared
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ARTIFACTS = {
+    'purchase_model': 'purchase_model_v1.h5',
+    'recommendation_model': 'recommendation_model_v1.h5',
+    'anomaly_model': 'anomaly_model_v1_autoencoder.h5',
+    'segmentation_model': 'segmentation_model_v1_autoencoder.h5'
+}
+
+def memory_kb() -> dict:
+    """RSS and PSS of this process in kB (Linux)"""
+    result = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, value = line.split(':', 1)
+                if key in ('Rss', 'Pss', 'Shared_Clean'):
+                    result[key.lower()] = int(value.split()[0])
+    except FileNotFoundError:
+        import resource
+        result['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+def build_artifacts(directory: str, num_users: int, num_products: int):
+    from config import config
+    from models.purchase_prediction import PurchasePredictionModel
+    from models.recommendation import RecommendationModel
+    from models.anomaly_detection import AnomalyDetectionModel
+    from models.segmentation import SegmentationModel
+    from utils.weight_file import save_keras_model
+    
+    config.MODEL_SAVE_MMW = True
+    purchase = PurchasePredictionModel(sequence_length=config.SEQUENCE_LENGTH, embedding_dim=config.EMBEDDING_DIM)
+    purchase.build_model()
+    recommendation = RecommendationModel(num_users=num_users, num_products=num_products, embedding_dim=config.EMBEDDING_DIM)
+    recommendation.build_model()
+    anomaly = AnomalyDetectionModel()
+    anomaly.build_autoencoder()
+    segmentation = SegmentationModel()
+    segmentation.build_autoencoder()
+    
+    models = {
+        'purchase_model': purchase.model,
+        'recommendation_model': recommendation.model,
+        'anomaly_model': anomaly.autoencoder,
+        'segmentation_model': segmentation.autoencoder
+    }
+    for name, keras_model in models.items():
+        save_keras_model(keras_model, os.path.join(directory, ARTIFACTS[name]))
+
+def child(mode: str, directory: str):
+    """Runs in a fresh interpreter: load all models in one format, print a JSON report"""
+    baseline = memory_kb()
+    start = time.perf_counter()
+    
+    from utils.weight_file import read_weight_file, weight_file_path
+    if mode != 'mmw-raw':
+        import tensorflow  # noqa: F401  (import cost is not part of the load time)
+    import_seconds = time.perf_counter() - start
+    after_import = memory_kb()
+    
+    from config import config
+    config.MODEL_LOAD_FORMAT = 'h5' if mode == 'h5' else 'mmw'
+    timings = {}
+    keep = []
+    for name, file in ARTIFACTS.items():
+        path = os.path.join(directory, file)
+        t0 = time.perf_counter()
+        if mode == 'mmw-raw':
+            _, arrays = read_weight_file(weight_file_path(path))
+            checksum = sum(float(a.sum()) for a in arrays)  # Touch every page
+            keep.append((arrays, checksum))
+        else:
+            from utils.weight_file import load_keras_model
+            keep.append(load_keras_model(path)[0])
+        timings[name] = round(1000 * (time.perf_counter() - t0), 1)
+    
+    loaded = memory_kb()
+    print(json.dumps({
+        "mode": mode,
+        "import_s": round(import_seconds, 2),
+        "load_ms": timings,
+        "total_load_ms": round(sum(timings.values()), 1),
+        "rss_mb": round(loaded.get('rss', 0) / 1024, 1),
+        "models_rss_mb": round((loaded.get('rss', 0) - after_import.get('rss', 0)) / 1024, 1),
+        "baseline_rss_mb": round(baseline.get('rss', 0) / 1024, 1)
+    }), flush=True)
+    
+    # PSS only shows sharing once every worker has mapped the files: wait for the parent
+    sys.stdin.readline()
+    print(json.dumps({"pss_mb": round(memory_kb().get('pss', 0) / 1024, 1)}), flush=True)
+    sys.stdin.read()
+
+def run_workers(mode: str, directory: str, workers: int) -> list:
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', mode, directory],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+             for _ in range(workers)]
+    reports = [json.loads(p.stdout.readline()) for p in procs]
+    for p in procs:
+        p.stdin.write("\n")
+        p.stdin.flush()
+    for p, report in zip(procs, reports):
+        report.update(json.loads(p.stdout.readline()))
+    for p in procs:
+        p.communicate('')
+    return reports
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'DIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.child:
+        child(*args.child)
+        return
+    
+    with tempfile.TemporaryDirectory(prefix='model_loading_') as directory:
+        build_artifacts(directory, args.users, args.products)
+        sizes = {f: os.path.getsize(os.path.join(directory, f)) for f in sorted(os.listdir(directory))}
+        print("Artifacts: " + ", ".join(f"{f} {s / 1e6:.1f}MB" for f, s in sizes.items()), flush=True)
+        
+        for mode in ('h5', 'mmw', 'mmw-raw'):
+            reports = run_workers(mode, directory, args.workers)
+            load = sorted(r['total_load_ms'] for r in reports)
+            print(f"\n[{mode}] {args.workers} workers", flush=True)
+            print(f"  load ms (all models): median {load[len(load) // 2]}  per model {reports[0]['load_ms']}")
+            print(f"  RSS per worker MB: {[r['rss_mb'] for r in reports]}  (models: {[r['models_rss_mb'] for r in reports]})")
+            print(f"  PSS per worker MB: {[r['pss_mb'] for r in reports]}  total PSS {sum(r['pss_mb'] for r in reports):.1f}")
+
+if __name__ == '__main__':
+    main()
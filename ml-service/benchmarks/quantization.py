@@ -0,0 +1,97 @@
+"""Quantized variants of the recommendation and purchase models: size, latency and accuracy deltas
+
+Trains both models briefly on synthetic data (recommendation: the latent-factor interactions
+of recommendation_ranking.py with sampled negatives; purchase: random sequences whose label
+depends on the event mix), saves them to a temporary directory and runs models/variants
+build_variant for every mode, printing the gate report. Nothing is written outside the
+temporary directory.
+    
+    python benchmarks/quantization.py --users 5000 --products 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def print_report(label: str, report):
+    if report is None:
+        print(f"  {label:15s} skipped")
+        return
+    deltas = ', '.join(f"{k} {v:+.4f}" for k, v in report['deltas'].items() if v is not None)
+    print(f"  {label:15s} {'accepted' if report['accepted'] else 'REJECTED':9s} "
+          f"size {report['size_bytes']['baseline'] / 1e6:7.2f} -> {report['size_bytes']['quantized'] / 1e6:7.2f} MB "
+          f"(x{report['size_ratio']:.2f})  latency {report['latency_ms']['baseline']:7.2f} -> "
+          f"{report['latency_ms']['quantized']:7.2f} ms  {deltas}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--per-user', type=int, default=20)
+    parser.add_argument('--sequences', type=int, default=4000)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--modes', nargs='+', default=['int8', 'float16', 'tflite_int8', 'tflite_float16'])
+    args = parser.parse_args()
+    
+    from config import config
+    from benchmarks.recommendation_ranking import make_interactions
+    from models.negative_sampling import NegativeSampler
+    from models.purchase_prediction import PurchasePredictionModel
+    from models.recommendation import RecommendationModel
+    from models.variants import build_variant
+    from utils.lstm_runtime import PurchaseNetwork
+    from utils.ncf_runtime import RecommendationNetwork
+    
+    config.MODEL_SAVE_MMW = True
+    rng = np.random.default_rng(0)
+    
+    with tempfile.TemporaryDirectory(prefix='quantization_') as directory:
+        # Recommendation: holdout positives plus seeded negatives
+        users, products = make_interactions(args.users, args.products, args.per_user, rng)
+        order = rng.permutation(len(users))
+        split = int(0.8 * len(order))
+        train, holdout = order[:split], order[split:]
+        sampler = NegativeSampler(users, products, args.users, args.products, num_negatives=4)
+        model = RecommendationModel(num_users=args.users, num_products=args.products, embedding_dim=config.EMBEDDING_DIM)
+        model.build_model()
+        model.train(users[train], products[train], np.ones(len(train), dtype=np.float32), validation_split=0.0,
+                    epochs=args.epochs, batch_size=256, negative_sampler=sampler)
+        gate_u, gate_p, gate_y = sampler.augment([users[holdout], products[holdout], np.ones(len(holdout), dtype=np.float32)],
+                                                 rng=np.random.default_rng(0))
+        path = os.path.join(directory, 'recommendation_model_v1.h5')
+        model.save(path)
+        print(f"\nrecommendation ({args.users} users x {args.products} products x dim {config.EMBEDDING_DIM}, "
+              f"{len(gate_y)} holdout pairs)")
+        for mode in args.modes:
+            try:
+                print_report(mode, build_variant('recommendation', model, path, [gate_u, gate_p], gate_y,
+                                                 RecommendationNetwork.from_weight_file, mode=mode))
+            except Exception as e:
+                print(f"  {mode:15s} failed: {e}")
+        
+        # Purchase: label from the share of one event type in the sequence
+        length = config.SEQUENCE_LENGTH
+        sequences = np.zeros((args.sequences, length, 10), dtype=np.float32)
+        sequences[np.arange(args.sequences)[:, None], np.arange(length), rng.integers(0, 10, (args.sequences, length))] = 1
+        features = rng.random((args.sequences, 50), dtype=np.float32)
+        labels = (sequences[:, :, 3].sum(axis=1) + 2 * features[:, 0] + rng.normal(0, 0.5, args.sequences) > 3).astype(np.float32)
+        split = int(0.8 * args.sequences)
+        purchase = PurchasePredictionModel(sequence_length=length)
+        purchase.build_model()
+        purchase.train(sequences[:split], features[:split], labels[:split], validation_split=0.0, epochs=args.epochs)
+        path = os.path.join(directory, 'purchase_model_v1.h5')
+        purchase.save(path)
+        print(f"\npurchase ({args.sequences - split} holdout sequences)")
+        for mode in args.modes:
+            try:
+                print_report(mode, build_variant('purchase', purchase, path, [sequences[split:], features[split:]],
+                                                 labels[split:], PurchaseNetwork.from_weight_file, mode=mode))
+            except Exception as e:
+                print(f"  {mode:15s} failed: {e}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Latency and throughput of the online scoring path with and without dynamic batching
+
+In-process (default): --clients concurrent clients each send --requests scoring calls of
+1 to --max-users rows to the anomaly autoencoder, once calling the backend directly per
+request (unbatched, one model call at a time like the executor would) and once through
+models/batching.DynamicBatcher for every --max-wait-ms value. The backend is the NumPy
+runtime of the autoencoder (random weights, the anomaly layer sizes), or the Keras model
+with --keras; --call-overhead-ms adds a fixed cost per model call to stand in for the
+dispatch overhead of heavier backends.
+
+HTTP: --url sends the same load to a running service (stdlib only) with --threads client
+threads, e.g. against POST /api/predict/anomaly, and prints its /api/scoring/stats.
+
+Reports p50/p99 request latency, requests/s and the average batch against the
+SCORING_P50_TARGET_MS / SCORING_P99_TARGET_MS targets.
+    
+    python benchmarks/scoring_load.py --clients 1,16,64 --requests 200
+    python benchmarks/scoring_load.py --keras --max-wait-ms 0,1,2,5
+    python benchmarks/scoring_load.py --url http://localhost:8001/api/predict/anomaly --threads 32
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def numpy_backend(input_dim: int):
+    from models.backends import NumpyBackend
+    from utils.dense_runtime import DenseNetwork
+    
+    rng = np.random.default_rng(0)
+    sizes = [input_dim, 64, 32, 16, 32, 64, input_dim]
+    activations = ['relu'] * 5 + ['sigmoid']
+    layers = [(f"dense_{i}", (rng.standard_normal((a, b)) / np.sqrt(a)).astype(np.float32),
+               np.zeros(b, dtype=np.float32), activation)
+              for i, (a, b, activation) in enumerate(zip(sizes, sizes[1:], activations))]
+    return NumpyBackend(DenseNetwork(layers))
+
+def keras_backend(input_dim: int):
+    from models.anomaly_detection import AnomalyDetectionModel
+    from models.backends import KerasBackend
+    
+    model = AnomalyDetectionModel(input_dim=input_dim)
+    model.build_autoencoder()
+    return KerasBackend(model.autoencoder)
+
+class OverheadBackend:
+    """Backend wrapper adding a fixed per-call cost"""
+    
+    def __init__(self, backend, overhead_ms: float):
+        self.backend = backend
+        self.overhead = overhead_ms / 1000
+    
+    def predict(self, inputs):
+        time.sleep(self.overhead)
+        return self.backend.predict(inputs)
+
+def summarize(latencies, elapsed: float, batches: int = 0) -> dict:
+    latencies = np.array(latencies) * 1000
+    return {"p50_ms": float(np.percentile(latencies, 50)), "p99_ms": float(np.percentile(latencies, 99)),
+            "requests_per_s": len(latencies) / elapsed,
+            "requests_per_batch": len(latencies) / batches if batches else 1.0}
+
+async def drive(score, clients: int, requests: int, sizes: np.ndarray, inputs: np.ndarray) -> tuple:
+    """clients concurrent loops of score(rows); (request latencies, seconds)"""
+    latencies = []
+    
+    async def client(index: int):
+        for i in range(requests):
+            n = int(sizes[(index * requests + i) % len(sizes)])
+            start = time.perf_counter()
+            await score(inputs[:n])
+            latencies.append(time.perf_counter() - start)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(client(c) for c in range(clients)))
+    return latencies, time.perf_counter() - start
+
+async def in_process(args):
+    from config import config
+    from models.batching import DynamicBatcher
+    
+    backend = keras_backend(args.input_dim) if args.keras else numpy_backend(args.input_dim)
+    if args.call_overhead_ms:
+        backend = OverheadBackend(backend, args.call_overhead_ms)
+    rng = np.random.default_rng(1)
+    inputs = rng.random((args.max_users, args.input_dim), dtype=np.float32)
+    sizes = np.clip(np.rint(rng.lognormal(0.3, 1.0, 1000)), 1, args.max_users).astype(int)
+    for n in sorted({1, 8, 64, args.max_users}):
+        backend.predict([inputs[:n]])  # Warm up
+    
+    print(f"{'keras' if args.keras else 'numpy'} backend, call overhead {args.call_overhead_ms} ms, "
+          f"targets p50 {config.SCORING_P50_TARGET_MS} ms / p99 {config.SCORING_P99_TARGET_MS} ms")
+    loop = asyncio.get_running_loop()
+    lock = asyncio.Lock()
+    
+    async def unbatched(rows):
+        async with lock:  # One model call at a time, as for the batcher
+            return await loop.run_in_executor(None, backend.predict, [rows])
+    
+    for clients in args.clients:
+        runs = [('unbatched', unbatched, None)]
+        for wait in args.max_wait_ms:
+            batcher = DynamicBatcher(backend, max_rows=args.max_rows, max_wait_ms=wait, name='anomaly')
+            runs.append((f"batched {wait:g} ms", lambda rows, b=batcher: b.predict([rows]), batcher))
+        for name, score, batcher in runs:
+            latencies, elapsed = await drive(score, clients, args.requests, sizes, inputs)
+            result = summarize(latencies, elapsed, batcher.stats.batches if batcher else 0)
+            meets = result['p50_ms'] <= config.SCORING_P50_TARGET_MS and result['p99_ms'] <= config.SCORING_P99_TARGET_MS
+            print(f"  clients {clients:4d}  {name:16s} p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms"
+                  f"  {result['requests_per_s']:8.0f} req/s  {result['requests_per_batch']:6.1f} req/batch"
+                  f"  {'ok' if meets else 'MISS'}", flush=True)
+
+def over_http(args):
+    url = urlparse(args.url)
+    latencies, errors = [], []
+    
+    def client(index: int):
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+        local = np.random.default_rng(index)
+        for _ in range(args.requests):
+            n = int(np.clip(np.rint(local.lognormal(0.3, 1.0)), 1, args.max_users))
+            users = [int(u) for u in local.integers(1, args.user_range, n)]
+            body = json.dumps({"user_ids": users})
+            start = time.perf_counter()
+            connection.request('POST', url.path, body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            if response.status != 200:
+                errors.append(response.status)
+        connection.close()
+    
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result = summarize(latencies, time.perf_counter() - start)
+    print(f"{args.threads} threads x {args.requests}: p50 {result['p50_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms  "
+          f"{result['requests_per_s']:.0f} req/s  {len(errors)} errors")
+    
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    connection.request('GET', url.path.split('/api/')[0] + '/api/scoring/stats')
+    print(json.dumps(json.loads(connection.getresponse().read()), indent=2))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', default='1,8,32,128', help='Concurrent clients (comma separated)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per client')
+    parser.add_argument('--max-users', type=int, default=64, help='Largest request (rows)')
+    parser.add_argument('--max-wait-ms', default='1,2,5', help='Batch windows to compare (comma separated)')
+    parser.add_argument('--max-rows', type=int, default=512)
+    parser.add_argument('--input-dim', type=int, default=50)
+    parser.add_argument('--keras', action='store_true', help='Keras backend instead of the NumPy runtime')
+    parser.add_argument('--call-overhead-ms', type=float, default=0.0)
+    parser.add_argument('--url', help='Load-test a running service endpoint instead')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--user-range', type=int, default=10000, help='User ids are drawn from 1..user-range')
+    args = parser.parse_args()
+    
+    if args.url:
+        return over_http(args)
+    args.clients = [int(c) for c in args.clients.split(',')]
+    args.max_wait_ms = [float(w) for w in args.max_wait_ms.split(',')]
+    asyncio.run(in_process(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""Best thread policy (TF intra/inter, BLAS/OpenMP threads, n_jobs, CPU split) on this host
+
+Every candidate runs in fresh processes, because TensorFlow and the BLAS runtimes size
+their pools once per process. Serving replays --requests purchase scoring calls (heavy-tailed
+batch sizes, the model's inference backend) plus IsolationForest scoring while a training
+load (Keras fit epochs and KMeans fits on synthetic data) runs next to it:
+  
+  baseline        no policy, library defaults (the previous behaviour)
+  mixed/<n>       PROCESS_ROLE=mixed, serving TF intra <n>, training in a thread of the same process
+  split/<k>       a serving process pinned to the first k CPUs and a training process on the rest
+
+Reports serving p50/p99 and training samples/s; the best candidate is the lowest serving
+p99 that keeps at least --min-training-share of the best training throughput, printed as
+the environment to set.
+    
+    python benchmarks/thread_policy.py --requests 500
+    python benchmarks/thread_policy.py --no-training   # serving latency alone
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+POLICY_ENV = ('PROCESS_ROLE', 'SERVING_TF_INTRA_THREADS', 'SERVING_TF_INTER_THREADS', 'SERVING_BLAS_THREADS',
+              'SERVING_N_JOBS', 'SERVING_CPUS', 'TRAINING_TF_INTRA_THREADS', 'TRAINING_TF_INTER_THREADS',
+              'TRAINING_BLAS_THREADS', 'TRAINING_N_JOBS', 'TRAINING_CPUS')
+
+def training_load(stop: threading.Event) -> float:
+    """Keras epochs and KMeans fits until stop is set; training samples per second"""
+    from sklearn.cluster import KMeans
+    from config import config
+    from models.purchase_prediction import PurchasePredictionModel
+    
+    rng = np.random.default_rng(1)
+    model = PurchasePredictionModel(sequence_length=config.SEQUENCE_LENGTH)
+    model.build_model()
+    (_, length, event_types), (_, feature_dim) = model.model.input_shape
+    n = 4096
+    sequences = rng.random((n, length, event_types), dtype=np.float32)
+    features = rng.random((n, feature_dim), dtype=np.float32)
+    labels = rng.integers(0, 2, n).astype(np.float32)
+    points = rng.random((20000, 16))
+    
+    samples, start = 0, time.perf_counter()
+    while not stop.is_set():
+        model.model.fit([sequences, features], labels, epochs=1, batch_size=256, verbose=0)
+        KMeans(n_clusters=8, n_init=1, random_state=0).fit(points)
+        samples += n + len(points)
+    return samples / (time.perf_counter() - start)
+
+def serving_load(requests: int) -> dict:
+    """Latency of purchase scoring and IsolationForest calls (ms)"""
+    from sklearn.ensemble import IsolationForest
+    from config import config
+    from models.purchase_prediction import PurchasePredictionModel
+    from utils.threading_policy import n_jobs
+    
+    rng = np.random.default_rng(0)
+    model = PurchasePredictionModel(sequence_length=config.SEQUENCE_LENGTH)
+    model.build_model()
+    backend = model.inference_backend()
+    (_, length, event_types), (_, feature_dim) = model.model.input_shape
+    make_inputs = lambda n: [rng.random((n, length, event_types), dtype=np.float32),
+                             rng.random((n, feature_dim), dtype=np.float32)]
+    backend.warmup(make_inputs, sorted({1, 8, 32, 128}))
+    forest = IsolationForest(n_estimators=100, random_state=0).fit(rng.random((5000, 50)))
+    forest.set_params(n_jobs=n_jobs('serving'))
+    
+    sizes = np.clip(np.rint(rng.lognormal(1.0, 1.2, requests)), 1, 256).astype(int)
+    batches = [(make_inputs(int(n)), rng.random((int(n), 50))) for n in sizes]
+    samples = []
+    for inputs, rows in batches:
+        start = time.perf_counter()
+        backend.predict(inputs)
+        forest.decision_function(rows)
+        samples.append(1000 * (time.perf_counter() - start))
+    samples = np.array(samples)
+    return {"p50_ms": float(np.percentile(samples, 50)), "p99_ms": float(np.percentile(samples, 99)),
+            "mean_ms": float(samples.mean())}
+
+def child(args):
+    """One process of a candidate: serving, training or both (mixed); prints a JSON result"""
+    if args.policy:
+        from utils.threading_policy import apply_process_policy, training_threads
+        applied = apply_process_policy()
+    else:
+        from contextlib import nullcontext as training_threads
+        applied = None
+    result = {"policy": applied}
+    stop = threading.Event()
+    
+    if args.child == 'training':
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+        print('ready', flush=True)
+        result['training_samples_per_s'] = training_load(stop)
+    else:
+        thread, rates = None, []
+        if args.child == 'mixed':
+            def train():
+                with training_threads():
+                    rates.append(training_load(stop))
+            thread = threading.Thread(target=train, daemon=True)
+            thread.start()
+            time.sleep(args.settle)
+        result.update(serving_load(args.requests))
+        stop.set()
+        if thread is not None:
+            thread.join()
+            result['training_samples_per_s'] = rates[0] if rates else None
+    print(json.dumps(result), flush=True)
+
+def spawn(kind: str, env: dict, args, policy: bool = True) -> subprocess.Popen:
+    command = [sys.executable, os.path.abspath(__file__), '--child', kind, '--requests', str(args.requests),
+               '--settle', str(args.settle)]
+    if not policy:
+        command.append('--no-policy')
+    full_env = {k: v for k, v in os.environ.items() if k not in POLICY_ENV}
+    full_env.update(env)
+    full_env['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    return subprocess.Popen(command, env=full_env, stdout=subprocess.PIPE, text=True, cwd=ROOT)
+
+def last_json(proc: subprocess.Popen) -> dict:
+    output, _ = proc.communicate()
+    lines = [line for line in output.splitlines() if line.startswith('{')]
+    if proc.returncode not in (0, -signal.SIGINT) or not lines:
+        raise RuntimeError(f"child exited with {proc.returncode}")
+    return json.loads(lines[-1])
+
+def run(candidate: dict, args) -> dict:
+    mode, env = candidate['mode'], candidate['env']
+    if mode == 'split' and args.training:
+        trainer = spawn('training', dict(env, PROCESS_ROLE='training'), args)
+        trainer.stdout.readline()  # ready
+        time.sleep(args.settle)
+        serving = last_json(spawn('serving', dict(env, PROCESS_ROLE='serving'), args))
+        trainer.send_signal(signal.SIGINT)
+        serving['training_samples_per_s'] = last_json(trainer)['training_samples_per_s']
+        return serving
+    kind = 'mixed' if args.training else 'serving'
+    role = 'mixed' if args.training else 'serving'
+    return last_json(spawn(kind, dict(env, PROCESS_ROLE=role), args, policy=mode != 'baseline'))
+
+def candidates(cpu_ids: list):
+    cpus = len(cpu_ids)
+    yield {"name": "baseline", "mode": "baseline", "env": {}}
+    for intra in sorted({1, 2, 4} & set(range(1, cpus + 1))):
+        for blas in (1, 2):
+            yield {"name": f"mixed/{intra} blas {blas}", "mode": "mixed",
+                   "env": {"SERVING_TF_INTRA_THREADS": str(intra), "SERVING_BLAS_THREADS": str(blas)}}
+    for k in sorted({2, cpus // 4, cpus // 2} - {0}):
+        if k >= cpus:
+            continue
+        yield {"name": f"split/{k}", "mode": "split",
+               "env": {"SERVING_CPUS": ','.join(map(str, cpu_ids[:k])), "TRAINING_CPUS": ','.join(map(str, cpu_ids[k:])),
+                       "SERVING_TF_INTRA_THREADS": str(min(k, 2))}}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--settle', type=float, default=3.0, help='Seconds the training load runs before serving starts')
+    parser.add_argument('--no-training', dest='training', action='store_false')
+    parser.add_argument('--min-training-share', type=float, default=0.8)
+    parser.add_argument('--child', choices=('serving', 'training', 'mixed'), help=argparse.SUPPRESS)
+    parser.add_argument('--no-policy', dest='policy', action='store_false', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+    
+    from utils.threading_policy import available_cpus
+    
+    cpu_ids = available_cpus()
+    cpus = len(cpu_ids)
+    print(f"{cpus} CPUs, {args.requests} serving requests, training load {'on' if args.training else 'off'}")
+    results = []
+    for candidate in candidates(cpu_ids):
+        if candidate['mode'] == 'split' and not args.training:
+            continue
+        try:
+            result = run(candidate, args)
+        except Exception as e:
+            print(f"  {candidate['name']:18s} failed: {e}")
+            continue
+        results.append((candidate, result))
+        rate = result.get('training_samples_per_s')
+        print(f"  {candidate['name']:18s} p50 {result['p50_ms']:7.2f} ms  p99 {result['p99_ms']:7.2f} ms"
+              + (f"  training {rate:9.0f} samples/s" if rate else ''), flush=True)
+    if not results:
+        return
+    
+    best_rate = max((r.get('training_samples_per_s') or 0) for _, r in results)
+    eligible = [(c, r) for c, r in results
+                if not best_rate or (r.get('training_samples_per_s') or 0) >= args.min_training_share * best_rate]
+    candidate, result = min(eligible or results, key=lambda item: item[1]['p99_ms'])
+    print(f"\nbest: {candidate['name']} (p99 {result['p99_ms']:.2f} ms)")
+    if candidate['mode'] == 'baseline':
+        print("  library defaults win here; leave the threading settings unset")
+        return
+    env = dict(candidate['env'])
+    if candidate['mode'] == 'split':
+        print("  run serving (SERVING_ONLY=true) and training as separate processes with:")
+    for key, value in sorted(env.items()):
+        print(f"  {key}={value}")
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,27 @@ class Config:
     DB_USER = os.getenv('DB_USER', 'u987029066_Admin')
     DB_PASSWORD = os.getenv('DB_PASSWORD', '38cdfD8217..')
     DB_NAME = os.getenv('DB_NAME', 'u987029066_mobil')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))  # Realtime pool (event processing writes)
+    DB_ACQUIRE_TIMEOUT = float(os.getenv('DB_ACQUIRE_TIMEOUT', 10))  # seconds to wait for a free connection
+    DB_QUERY_TIMEOUT = float(os.getenv('DB_QUERY_TIMEOUT', 30))
+    DB_BATCH_POOL_SIZE = int(os.getenv('DB_BATCH_POOL_SIZE', 2))  # Training data queries
+    DB_BATCH_ACQUIRE_TIMEOUT = float(os.getenv('DB_BATCH_ACQUIRE_TIMEOUT', 60))
+    DB_BATCH_QUERY_TIMEOUT = float(os.getenv('DB_BATCH_QUERY_TIMEOUT', 300))
+    DB_ANALYTICS_POOL_SIZE = int(os.getenv('DB_ANALYTICS_POOL_SIZE', 2))  # /api/models/analyze and other reporting reads
+    DB_ANALYTICS_ACQUIRE_TIMEOUT = float(os.getenv('DB_ANALYTICS_ACQUIRE_TIMEOUT', 15))
+    DB_ANALYTICS_QUERY_TIMEOUT = float(os.getenv('DB_ANALYTICS_QUERY_TIMEOUT', 60))
+    DB_WORKLOAD_PRIORITY = os.getenv('DB_WORKLOAD_PRIORITY', 'realtime,analytics,batch')  # Highest first; lower ones hold back while higher ones wait
+    DB_REPLICA_HOST = os.getenv('DB_REPLICA_HOST', '')  # Read replica, empty = everything on DB_HOST
+    DB_REPLICA_PORT = int(os.getenv('DB_REPLICA_PORT', os.getenv('DB_PORT', 3306)))
+    DB_REPLICA_WORKLOADS = os.getenv('DB_REPLICA_WORKLOADS', 'batch,analytics')  # Workloads whose reads go to the replica
+    DB_VALIDATE_INTERVAL = float(os.getenv('DB_VALIDATE_INTERVAL', 30))  # Ping connections idle longer than this
+    DB_MAX_STREAMS = int(os.getenv('DB_MAX_STREAMS', 2))  # Concurrent server-side streaming queries (own connections)
+    DB_STREAM_CHUNK_SIZE = int(os.getenv('DB_STREAM_CHUNK_SIZE', 5000))
+    DB_STREAM_TIMEOUT = float(os.getenv('DB_STREAM_TIMEOUT', 300))  # Per-chunk fetch timeout (sorting a large window can be slow)
+    DB_LOCAL_INFILE = os.getenv('DB_LOCAL_INFILE', 'false').lower() == 'true'  # Allow LOAD DATA LOCAL INFILE for bulk writes (server must allow it too)
+    DB_BULK_MAX_STATEMENT_BYTES = int(os.getenv('DB_BULK_MAX_STATEMENT_BYTES', 1024 * 1024))  # Keep well under max_allowed_packet
+    DB_BULK_LOAD_THRESHOLD = int(os.getenv('DB_BULK_LOAD_THRESHOLD', 50000))  # Rows per job before switching to LOAD DATA
+    DB_BULK_LOAD_CHUNK_ROWS = int(os.getenv('DB_BULK_LOAD_CHUNK_ROWS', 100000))
     
     # Redis
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
@@ -24,28 +45,102 @@ class Config:
     ML_SERVICE_HOST = os.getenv('ML_SERVICE_HOST', '0.0.0.0')
     ML_SERVICE_PORT = int(os.getenv('ML_SERVICE_PORT', 8001))
     
+    # Admin analysis (/api/models/analyze)
+    ANALYZE_CACHE_TTL = float(os.getenv('ANALYZE_CACHE_TTL', 300))  # seconds a cached analysis is served as fresh
+    ANALYZE_CACHE_MAX_STALE = float(os.getenv('ANALYZE_CACHE_MAX_STALE', 3600))  # Older entries are recomputed in the request, younger ones in the background
+    
     # Model Storage
     MODEL_STORAGE_PATH = os.getenv('MODEL_STORAGE_PATH', './saved_models')
+    MODEL_SAVE_MMW = os.getenv('MODEL_SAVE_MMW', 'true').lower() == 'true'  # Also write .mmw (architecture + memory-mappable float32 weights)
+    MODEL_LOAD_FORMAT = os.getenv('MODEL_LOAD_FORMAT', 'mmw')  # mmw (falls back to .h5 when missing) or h5
+    MODEL_RETENTION_VERSIONS = int(os.getenv('MODEL_RETENTION_VERSIONS', 5))  # Versions kept per model besides latest/deployed (0 = keep all)
+    MODEL_RELOAD_INTERVAL = int(os.getenv('MODEL_RELOAD_INTERVAL', 30))  # seconds between registry checks for newly deployed versions
+    MODEL_LOAD_CONCURRENCY = int(os.getenv('MODEL_LOAD_CONCURRENCY', 4))  # Models loaded in parallel (executor threads); 1 = one after another
+    SERVING_ONLY = os.getenv('SERVING_ONLY', 'false').lower() == 'true'  # No trainer/training jobs; TensorFlow is imported only if a model needs Keras
+    SERVING_WORKERS = int(os.getenv('SERVING_WORKERS', 1))  # >1: python main.py preloads the models and forks this many serving workers plus a training process
+    TRAINER_PORT = int(os.getenv('TRAINER_PORT', 0))  # SERVING_WORKERS > 1: loopback port of the training process (0 = ML_SERVICE_PORT + 1)
+    WORKER_CPU_PINNING = os.getenv('WORKER_CPU_PINNING', 'true').lower() == 'true'  # Give each worker its own slice of the serving CPUs
+    NUMPY_INFERENCE = os.getenv('NUMPY_INFERENCE', 'true').lower() == 'true'  # Run the dense autoencoders with utils/dense_runtime instead of Keras predict
     
     # Training
     BATCH_SIZE = int(os.getenv('BATCH_SIZE', 32))
     EPOCHS = int(os.getenv('EPOCHS', 50))
     LEARNING_RATE = float(os.getenv('LEARNING_RATE', 0.001))
     
+    # Training input pipeline
+    USE_TF_DATA = os.getenv('USE_TF_DATA', 'true').lower() == 'true'  # false: in-memory fit with validation_split
+    DATA_CACHE_PATH = os.getenv('DATA_CACHE_PATH', './data_cache')  # Chunked training arrays, read back as memory maps
+    PIPELINE_CHUNK_USERS = int(os.getenv('PIPELINE_CHUNK_USERS', 2000))  # Users per encoded chunk while preparing data
+    
+    # Training Jobs
+    TRAINING_MAX_CONCURRENT_JOBS = int(os.getenv('TRAINING_MAX_CONCURRENT_JOBS', 1))
+    TRAINING_JOB_HISTORY = int(os.getenv('TRAINING_JOB_HISTORY', 50))  # Finished jobs kept in memory
+    
+    # Incremental (warm-start) retraining
+    INCREMENTAL_DAYS = int(os.getenv('INCREMENTAL_DAYS', 3))  # Only the newest days are used for fine-tuning
+    INCREMENTAL_EPOCHS = int(os.getenv('INCREMENTAL_EPOCHS', 5))
+    INCREMENTAL_LEARNING_RATE = float(os.getenv('INCREMENTAL_LEARNING_RATE', 0.0001))
+    INCREMENTAL_HOLDOUT_FRACTION = float(os.getenv('INCREMENTAL_HOLDOUT_FRACTION', 0.2))
+    INCREMENTAL_MAX_REGRESSION = float(os.getenv('INCREMENTAL_MAX_REGRESSION', 0.05))  # Allowed holdout loss increase vs previous version
+    
     # Real-time Processing
     EVENT_BATCH_SIZE = int(os.getenv('EVENT_BATCH_SIZE', 10))  # Smaller batch for faster processing
     PROCESSING_INTERVAL = int(os.getenv('PROCESSING_INTERVAL', 2))  # seconds - faster polling
+    RESULT_HISTORY_SAMPLE_RATE = float(os.getenv('RESULT_HISTORY_SAMPLE_RATE', 1.0))  # Share of predictions/recommendations also appended to history (0 = latest state only)
+    RESULT_HISTORY_RETENTION_DAYS = int(os.getenv('RESULT_HISTORY_RETENTION_DAYS', 30))  # 0 = keep history forever
+    RESULT_HISTORY_PRUNE_CHUNK = int(os.getenv('RESULT_HISTORY_PRUNE_CHUNK', 5000))  # Rows per DELETE
+    RESULT_HISTORY_PRUNE_INTERVAL = int(os.getenv('RESULT_HISTORY_PRUNE_INTERVAL', 3600))  # seconds between retention runs
+    ROLLUPS_ENABLED = os.getenv('ROLLUPS_ENABLED', 'true').lower() == 'true'  # Per-day event counters and distinct user/device sketches
+    ROLLUP_BACKEND = os.getenv('ROLLUP_BACKEND', 'redis')  # redis (shared) or local (in-process, snapshotted to ROLLUP_LOCAL_PATH; single worker only)
+    ROLLUP_RETENTION_DAYS = int(os.getenv('ROLLUP_RETENTION_DAYS', 90))
+    ROLLUP_LOCAL_PATH = os.getenv('ROLLUP_LOCAL_PATH', './data_cache/event_rollups.npz')
+    
+    # Online scoring API (/api/predict/*, /api/recommend, /api/segment)
+    SCORING_MAX_WAIT_MS = float(os.getenv('SCORING_MAX_WAIT_MS', 2.0))  # Batching window opened by the first request to an idle model
+    SCORING_MAX_BATCH_ROWS = int(os.getenv('SCORING_MAX_BATCH_ROWS', 512))  # Rows that close a window early
+    SCORING_MAX_USERS = int(os.getenv('SCORING_MAX_USERS', 1000))  # Users per request
+    SCORING_HISTORY_DAYS = int(os.getenv('SCORING_HISTORY_DAYS', 30))  # Events looked up in MySQL for users not in the realtime buffer
+    SCORING_P50_TARGET_MS = float(os.getenv('SCORING_P50_TARGET_MS', 10))  # Reported against in /api/scoring/stats and the load test
+    SCORING_P99_TARGET_MS = float(os.getenv('SCORING_P99_TARGET_MS', 50))
     
     # Model Settings
     USE_TENSORFLOW = os.getenv('USE_TENSORFLOW', 'true').lower() == 'true'
     USE_PYTORCH = os.getenv('USE_PYTORCH', 'false').lower() == 'true'
+    INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', '')  # keras, tflite, torchscript, numpy or auto (profiled per batch size); empty keeps each model's default
+    MODEL_BACKENDS = os.getenv('MODEL_BACKENDS', '')  # Per model override, e.g. purchase=numpy,recommendation=torchscript
+    BACKEND_PROFILE_PATH = os.getenv('BACKEND_PROFILE_PATH', './saved_models/backend_profile.json')  # Written by benchmarks/inference_backends.py
+    BATCH_BUCKETS = os.getenv('BATCH_BUCKETS', '1,8,32,128,512')  # keras/tflite batches are padded to these sizes (larger ones split); empty disables
+    WARMUP_ON_LOAD = os.getenv('WARMUP_ON_LOAD', 'true').lower() == 'true'  # Run every bucket once when a model is loaded
+    QUANTIZATION = os.getenv('QUANTIZATION', '')  # Quantized variants built after training, e.g. recommendation=int8,purchase=tflite_int8 (see models/variants.py)
+    QUANTIZATION_TOLERANCE = float(os.getenv('QUANTIZATION_TOLERANCE', 0.005))  # Max holdout AUC/accuracy drop for a variant to be kept
+    SERVE_QUANTIZED = os.getenv('SERVE_QUANTIZED', 'true').lower() == 'true'  # Load accepted variants instead of the float model for inference
+    
+    # CPU Threading (utils/threading_policy.py; 0 = derived from the CPUs the role may use)
+    PROCESS_ROLE = os.getenv('PROCESS_ROLE', '')  # serving, training or mixed; empty: serving with SERVING_ONLY or SERVING_WORKERS > 1, else mixed
+    SERVING_TF_INTRA_THREADS = int(os.getenv('SERVING_TF_INTRA_THREADS', 0))
+    SERVING_TF_INTER_THREADS = int(os.getenv('SERVING_TF_INTER_THREADS', 0))
+    SERVING_BLAS_THREADS = int(os.getenv('SERVING_BLAS_THREADS', 0))  # OpenMP/OpenBLAS/MKL threads
+    SERVING_N_JOBS = int(os.getenv('SERVING_N_JOBS', 0))  # sklearn n_jobs of loaded estimators
+    SERVING_CPUS = os.getenv('SERVING_CPUS', '')  # CPU affinity, e.g. 0-3 (empty: no pinning)
+    TRAINING_TF_INTRA_THREADS = int(os.getenv('TRAINING_TF_INTRA_THREADS', 0))
+    TRAINING_TF_INTER_THREADS = int(os.getenv('TRAINING_TF_INTER_THREADS', 0))
+    TRAINING_BLAS_THREADS = int(os.getenv('TRAINING_BLAS_THREADS', 0))
+    TRAINING_N_JOBS = int(os.getenv('TRAINING_N_JOBS', 0))  # sklearn n_jobs of IsolationForest/DBSCAN fits
+    TRAINING_CPUS = os.getenv('TRAINING_CPUS', '')  # e.g. 4-7
     
     # Feature Engineering
     SEQUENCE_LENGTH = int(os.getenv('SEQUENCE_LENGTH', 20))
     EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', 64))
     
+    # Recommendation
+    RECOMMENDATION_NEGATIVES = int(os.getenv('RECOMMENDATION_NEGATIVES', 4))  # Sampled negatives per positive interaction (0 = off)
+    NEGATIVE_SAMPLING_POWER = float(os.getenv('NEGATIVE_SAMPLING_POWER', 0.75))  # Popularity smoothing exponent
+    
     # Anomaly Detection
     ANOMALY_THRESHOLD = float(os.getenv('ANOMALY_THRESHOLD', 0.7))
+    ANOMALY_SAMPLE_SIZE = int(os.getenv('ANOMALY_SAMPLE_SIZE', 200000))  # Training events sampled from the window (approximate: per-row Bernoulli sampling)
+    ANOMALY_MIN_PER_STRATUM = int(os.getenv('ANOMALY_MIN_PER_STRATUM', 1000))  # Rare event types are kept up to this many
+    ANOMALY_SCAN_CHUNK = int(os.getenv('ANOMALY_SCAN_CHUNK', 500000))  # Event id range per sampling query
     
     # Segmentation
     NUM_SEGMENTS = int(os.getenv('NUM_SEGMENTS', 5))
@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import shutil
+from typing import Dict, List, Optional, Callable, Tuple
+import numpy as np
+from config import config
+
+logger = logging.getLogger(__name__)
+
+class TrainingDataCache:
+    """Chunk-by-chunk on-disk store for training arrays, read back as memory maps"""
+    
+    def __init__(self, name: str, base_path: str = None):
+        self.path = os.path.join(base_path or config.DATA_CACHE_PATH, name)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
+        self._files = {}
+        self._specs = {}
+        self._rows = {}
+    
+    def append(self, **arrays: np.ndarray):
+        """Append a chunk of rows to each named array"""
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            spec = (array.dtype.str, tuple(array.shape[1:]))
+            if name not in self._files:
+                self._files[name] = open(os.path.join(self.path, f"{name}.bin"), 'wb')
+                self._specs[name] = spec
+                self._rows[name] = 0
+            elif self._specs[name] != spec:
+                raise ValueError(f"Chunk for '{name}' has spec {spec}, expected {self._specs[name]}")
+            
+            self._files[name].write(array.tobytes())
+            self._rows[name] += len(array)
+    
+    def finalize(self, **empty_specs: Tuple[str, tuple]) -> Dict[str, np.ndarray]:
+        """Close the writers and return read-only memory maps of every array
+        
+        empty_specs gives (dtype, row_shape) for arrays that may not have received any rows.
+        """
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+        
+        for name, spec in empty_specs.items():
+            if name not in self._specs:
+                self._specs[name] = (np.dtype(spec[0]).str, tuple(spec[1]))
+                self._rows[name] = 0
+        
+        meta = {name: {"dtype": dtype, "row_shape": list(shape), "rows": self._rows[name]}
+                for name, (dtype, shape) in self._specs.items()}
+        with open(os.path.join(self.path, "meta.json"), 'w') as f:
+            json.dump(meta, f, indent=2)
+        
+        return self.load()
+    
+    def load(self) -> Dict[str, np.ndarray]:
+        """Open the cached arrays as memory maps"""
+        with open(os.path.join(self.path, "meta.json"), 'r') as f:
+            meta = json.load(f)
+        
+        arrays = {}
+        for name, spec in meta.items():
+            shape = (spec["rows"],) + tuple(spec["row_shape"])
+            if spec["rows"] == 0:
+                # np.memmap cannot map an empty file
+                arrays[name] = np.empty(shape, dtype=spec["dtype"])
+            else:
+                arrays[name] = np.memmap(os.path.join(self.path, f"{name}.bin"), dtype=spec["dtype"], mode='r', shape=shape)
+        return arrays
+
+def split_indices(n: int, validation_split: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Index ranges for training/validation, last rows validate like Keras' validation_split"""
+    n_val = int(n * validation_split) if validation_split else 0
+    return np.arange(0, n - n_val, dtype=np.int64), np.arange(n - n_val, n, dtype=np.int64)
+
+def make_dataset(inputs: Dict[str, np.ndarray],
+                 targets: Optional[np.ndarray],
+                 indices: np.ndarray,
+                 batch_size: int,
+                 shuffle: bool = True,
+                 transforms: Optional[Dict[str, Callable[[np.ndarray], np.ndarray]]] = None,
+                 batch_fn: Optional[Callable[[List[np.ndarray]], List[np.ndarray]]] = None):
+    """Build a tf.data pipeline reading batches of rows from (memory-mapped) arrays
+    
+    Only row indices are shuffled (a full permutation every epoch) and batched; each batch is
+    gathered from the arrays in a parallel map, so nothing is copied up front. targets=None reconstructs the single input
+    (autoencoders). transforms are applied per batch to the named input; batch_fn maps the
+    gathered [inputs..., targets] list to a new one (it may change the row count, e.g. to add
+    sampled negatives) and runs again every epoch.
+    """
+    import tensorflow as tf
+    
+    transforms = transforms or {}
+    names = list(inputs.keys())
+    sources = [inputs[name] for name in names] + ([targets] if targets is not None else [])
+    output_dtypes = [tf.float32 if transforms.get(name) else tf.as_dtype(inputs[name].dtype) for name in names]
+    if targets is not None:
+        output_dtypes.append(tf.as_dtype(targets.dtype))
+    
+    def gather(batch_indices):
+        # Sorted indices turn random row access into forward scans of the memory map
+        batch_indices = np.sort(batch_indices)
+        batch = [np.asarray(source[batch_indices]) for source in sources]
+        for i, name in enumerate(names):
+            if transforms.get(name):
+                batch[i] = transforms[name](batch[i]).astype(np.float32)
+        if batch_fn is not None:
+            batch = batch_fn(batch)
+        return batch
+    
+    def structure(*tensors):
+        for tensor, source in zip(tensors, sources):
+            tensor.set_shape((None,) + tuple(source.shape[1:]))
+        x = {name: tensors[i] for i, name in enumerate(names)}
+        y = tensors[len(names)] if targets is not None else tensors[0]
+        return x, y
+    
+    rng = np.random.default_rng()
+    
+    def index_batches():
+        # Called again for every epoch: a new permutation of all rows, not a bounded buffer
+        order = rng.permutation(indices) if shuffle else indices
+        for start in range(0, len(order), batch_size):
+            yield order[start:start + batch_size]
+    
+    dataset = tf.data.Dataset.from_generator(index_batches, output_signature=tf.TensorSpec((None,), tf.as_dtype(indices.dtype)))
+    dataset = dataset.apply(tf.data.experimental.assert_cardinality(-(-len(indices) // batch_size)))
+    dataset = dataset.map(
+        lambda batch_indices: tf.numpy_function(gather, [batch_indices], output_dtypes),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=False
+    )
+    dataset = dataset.map(structure)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+def _materialize(inputs: Dict[str, np.ndarray], targets: Optional[np.ndarray], rows: slice,
+                 transforms: Dict[str, Callable], batch_fn: Optional[Callable]) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """In-memory (x, y) for a row range, the non-tf.data equivalent of one big batch"""
+    names = list(inputs.keys())
+    batch = [transforms[name](inputs[name][rows]) if transforms.get(name) else np.asarray(inputs[name][rows]) for name in names]
+    if targets is not None:
+        batch.append(np.asarray(targets[rows]))
+    if batch_fn is not None:
+        batch = batch_fn(batch)
+    x = dict(zip(names, batch))
+    y = batch[len(names)] if targets is not None else batch[0]
+    return x, y
+
+def fit_arrays(keras_model,
+               inputs: Dict[str, np.ndarray],
+               targets: Optional[np.ndarray] = None,
+               validation_split: float = 0.0,
+               epochs: int = 1,
+               batch_size: int = 32,
+               callbacks: Optional[list] = None,
+               transforms: Optional[Dict[str, Callable[[np.ndarray], np.ndarray]]] = None,
+               batch_fn: Optional[Callable[[List[np.ndarray]], List[np.ndarray]]] = None,
+               verbose: int = 1):
+    """Fit a Keras model through a tf.data pipeline (or in memory if USE_TF_DATA is off)
+    
+    In memory, batch_fn is applied once to the whole arrays instead of per batch and epoch.
+    """
+    from models.training_callbacks import ThroughputCallback
+    
+    transforms = transforms or {}
+    n = len(next(iter(inputs.values())))
+    train_indices, val_indices = split_indices(n, validation_split)
+    callbacks = [ThroughputCallback(len(train_indices))] + list(callbacks or [])
+    # Rows per gathered row, so throughput counts the samples actually trained on
+    if batch_fn is not None:
+        probe = [array[:1] for array in list(inputs.values()) + ([targets] if targets is not None else [])]
+        callbacks[0].num_samples *= len(batch_fn(probe)[0])
+    
+    if not config.USE_TF_DATA:
+        x, y = _materialize(inputs, targets, slice(0, len(train_indices)), transforms, batch_fn)
+        validation_data = None
+        if len(val_indices) > 0:
+            validation_data = _materialize(inputs, targets, slice(len(train_indices), n), transforms, batch_fn)
+        return keras_model.fit(
+            x, y,
+            validation_data=validation_data,
+            epochs=epochs,
+            batch_size=batch_size,
+            callbacks=callbacks,
+            verbose=verbose
+        )
+    
+    train_dataset = make_dataset(inputs, targets, train_indices, batch_size, shuffle=True,
+                                 transforms=transforms, batch_fn=batch_fn)
+    val_dataset = None
+    if len(val_indices) > 0:
+        val_dataset = make_dataset(inputs, targets, val_indices, batch_size, shuffle=False,
+                                   transforms=transforms, batch_fn=batch_fn)
+    
+    return keras_model.fit(
+        train_dataset,
+        validation_data=val_dataset,
+        epochs=epochs,
+        callbacks=callbacks,
+        verbose=verbose
+    )
+
+def min_max_stats(data: np.ndarray, chunk_rows: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+    """Column-wise min and max in one streaming pass"""
+    col_min = None
+    col_max = None
+    for start in range(0, len(data), chunk_rows):
+        chunk = np.asarray(data[start:start + chunk_rows])
+        chunk_min, chunk_max = chunk.min(axis=0), chunk.max(axis=0)
+        col_min = chunk_min if col_min is None else np.minimum(col_min, chunk_min)
+        col_max = chunk_max if col_max is None else np.maximum(col_max, chunk_max)
+    return col_min, col_max
+
+def min_max_scaler(data: np.ndarray, chunk_rows: int = 65536) -> Callable[[np.ndarray], np.ndarray]:
+    """Column-wise min-max normalizer, statistics computed in one streaming pass"""
+    col_min, col_max = min_max_stats(data, chunk_rows)
+    scale = (col_max - col_min) + 1e-8
+    return lambda batch: (batch - col_min) / scale
@@ -1,5 +1,4 @@
 import numpy as np
-import pandas as pd
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import json
@@ -93,24 +92,19 @@ class DataProcessor:
         
         return features
     
+    def encode_event(self, event: Dict[str, Any]) -> np.ndarray:
+        """One sequence row: the event type's weight in its column"""
+        row = np.zeros(len(self.event_weights))
+        event_type = event.get('eventType', 'unknown')
+        if event_type in self.event_weights:
+            row[list(self.event_weights.keys()).index(event_type)] = self.event_weights[event_type]
+        return row
+    
     def create_user_sequence(self, events: List[Dict[str, Any]]) -> np.ndarray:
         """Create sequence of events for sequence models"""
-        if not events:
-            return np.zeros((self.sequence_length, len(self.event_weights)))
-        
-        # Process events
-        processed = [self.process_event(e) for e in events[-self.sequence_length:]]
-        
-        # Create sequence matrix
         sequence = np.zeros((self.sequence_length, len(self.event_weights)))
-        
-        for i, event in enumerate(processed):
-            event_type = event.get('eventType', 'unknown')
-            if event_type in self.event_weights:
-                weight = self.event_weights[event_type]
-                idx = list(self.event_weights.keys()).index(event_type)
-                sequence[i, idx] = weight
-        
+        for i, event in enumerate(events[-self.sequence_length:]):
+            sequence[i] = self.encode_event(event)
         return sequence
     
     def create_user_features(self, events: List[Dict[str, Any]], user_data: Optional[Dict[str, Any]] = None) -> np.ndarray:
@@ -192,6 +186,61 @@ class DataProcessor:
         
         return np.array(features, dtype=np.float32)
     
+    def create_event_features(self, events: List[Dict[str, Any]]) -> np.ndarray:
+        """Per-event feature matrix; row i equals create_user_features([events[i]])
+        
+        eventData JSON is parsed once per row and each feature column is filled in one
+        array assignment instead of building a 50-slot list per event.
+        """
+        n = len(events)
+        features = np.zeros((n, 50), dtype=np.float32)
+        if n == 0:
+            return features
+        
+        # Event type one-hot (count of a single event)
+        type_index = {event_type: i for i, event_type in enumerate(self.event_weights)}
+        types = np.fromiter((type_index.get(e.get('eventType', 'unknown'), -1) for e in events), dtype=np.int64, count=n)
+        known = (types >= 0) & (types < 50)
+        features[np.flatnonzero(known), types[known]] = 1
+        
+        # Time and performance columns follow the event type counts, as in create_user_features
+        # (columns past the 50-slot vector are truncated there, so they are skipped here)
+        offset = len(self.event_weights)
+        
+        # Hour (mean over one timestamp; std stays 0)
+        if offset < 50:
+            features[:, offset] = [self._extract_hour(e['timestamp']) if e.get('timestamp') else 0 for e in events]
+        
+        # Performance values (mean over one value; std stays 0, max equals mean)
+        event_data = [self._parse_event_data(e.get('eventData')) for e in events]
+        for column, key in ((2, 'pageLoadTime'), (4, 'apiResponseTime'), (6, 'scrollDepth'), (8, 'timeOnScreen')):
+            if offset + column < 50:
+                features[:, offset + column] = [self._to_float(d.get(key)) for d in event_data]
+        if offset + 7 < 50:
+            features[:, offset + 7] = features[:, offset + 6]
+        
+        return features
+    
+    @staticmethod
+    def _parse_event_data(event_data: Any) -> Dict[str, Any]:
+        """eventData column (JSON string, dict or NULL) as a dict"""
+        if isinstance(event_data, dict):
+            return event_data
+        if isinstance(event_data, (str, bytes)):
+            try:
+                parsed = json.loads(event_data)
+                return parsed if isinstance(parsed, dict) else {}
+            except ValueError:
+                return {}
+        return {}
+    
+    @staticmethod
+    def _to_float(value: Any) -> float:
+        try:
+            return float(value) if value is not None else 0.0
+        except (TypeError, ValueError):
+            return 0.0
+    
     def create_product_features(self, product_data: Dict[str, Any]) -> np.ndarray:
         """Create feature vector for product"""
         features = []
@@ -4,13 +4,22 @@ import uvicorn
 import asyncio
 import logging
 import json
+import os
+import sys
+import time
 from datetime import datetime
 from config import config
+from utils.threading_policy import apply_process_policy
+
+# Thread pools and CPU affinity before TensorFlow, NumPy or sklearn size their own
+apply_process_policy()
+
+import serving_workers
 from utils.redis_connector import RedisConnector
 from utils.db_connector import DBConnector
-from realtime_processor import RealtimeProcessor
-from api.model_management import router as model_router, set_trainer, set_db_connector
-from trainer import ModelTrainer
+from utils.process_stats import process_start_time, memory_usage_mb
+from api.model_management import router as model_router, set_trainer, set_job_manager, set_db_connector, set_trainer_proxy, set_event_rollups
+import api.scoring as scoring
 
 # Logging setup
 logging.basicConfig(
@@ -23,6 +32,9 @@ logger = logging.getLogger(__name__)
 redis_connector = None
 db_connector = None
 realtime_processor = None
+job_manager = None
+PROCESS_STARTED = process_start_time() or time.time()
+startup_seconds = None  # Process start until the startup handler finished
 
 # FastAPI app
 app = FastAPI(
@@ -31,12 +43,50 @@ app = FastAPI(
     version="1.0.0"
 )
 
+def db_workloads():
+    """Pool settings of the realtime, batch and analytics database workloads"""
+    priority_order = [name.strip() for name in config.DB_WORKLOAD_PRIORITY.split(',') if name.strip()]
+    replica_workloads = {name.strip() for name in config.DB_REPLICA_WORKLOADS.split(',') if name.strip()}
+    workloads = {
+        'realtime': dict(pool_size=config.DB_POOL_SIZE, acquire_timeout=config.DB_ACQUIRE_TIMEOUT,
+                         query_timeout=config.DB_QUERY_TIMEOUT),
+        'batch': dict(pool_size=config.DB_BATCH_POOL_SIZE, acquire_timeout=config.DB_BATCH_ACQUIRE_TIMEOUT,
+                      query_timeout=config.DB_BATCH_QUERY_TIMEOUT),
+        'analytics': dict(pool_size=config.DB_ANALYTICS_POOL_SIZE, acquire_timeout=config.DB_ANALYTICS_ACQUIRE_TIMEOUT,
+                          query_timeout=config.DB_ANALYTICS_QUERY_TIMEOUT)
+    }
+    for name, spec in workloads.items():
+        spec['priority'] = len(priority_order) - priority_order.index(name) if name in priority_order else 0
+        spec['use_replica'] = name in replica_workloads
+    return workloads
+
+async def history_retention_loop():
+    """Periodically prune the prediction/recommendation history tables in bounded chunks"""
+    while True:
+        await asyncio.sleep(config.RESULT_HISTORY_PRUNE_INTERVAL)
+        for table in ('ml_predictions_history', 'ml_recommendations_history'):
+            try:
+                await db_connector.prune_history(
+                    table,
+                    config.RESULT_HISTORY_RETENTION_DAYS,
+                    chunk_rows=config.RESULT_HISTORY_PRUNE_CHUNK,
+                    workload='batch'
+                )
+            except Exception as e:
+                logger.error(f"❌ History retention failed for {table}: {e}")
+
 @app.on_event("startup")
 async def startup_event():
     """Startup event handler"""
-    global redis_connector, db_connector, realtime_processor
+    global redis_connector, db_connector, realtime_processor, job_manager, startup_seconds
     
-    logger.info("🚀 Starting ML Service...")
+    training_process = serving_workers.role == 'training'
+    multi_worker = serving_workers.worker_count > 1 and not training_process
+    if training_process:
+        worker_label = " training process"
+    else:
+        worker_label = f" worker {serving_workers.worker_index}/{serving_workers.worker_count}" if multi_worker else ''
+    logger.info(f"🚀 Starting ML Service{worker_label}{' (serving only)' if config.SERVING_ONLY or multi_worker else ''}...")
     
     # Initialize connectors
     try:
@@ -54,7 +104,21 @@ async def startup_event():
             port=config.DB_PORT,
             user=config.DB_USER,
             password=config.DB_PASSWORD,
-            database=config.DB_NAME
+            database=config.DB_NAME,
+            pool_size=config.DB_POOL_SIZE,
+            acquire_timeout=config.DB_ACQUIRE_TIMEOUT,
+            query_timeout=config.DB_QUERY_TIMEOUT,
+            validate_interval=config.DB_VALIDATE_INTERVAL,
+            max_streams=config.DB_MAX_STREAMS,
+            local_infile=config.DB_LOCAL_INFILE,
+            bulk_max_statement_bytes=config.DB_BULK_MAX_STATEMENT_BYTES,
+            bulk_load_threshold=config.DB_BULK_LOAD_THRESHOLD,
+            bulk_load_chunk_rows=config.DB_BULK_LOAD_CHUNK_ROWS,
+            workloads=db_workloads(),
+            default_workload='realtime',
+            replica_host=config.DB_REPLICA_HOST,
+            replica_port=config.DB_REPLICA_PORT,
+            history_sample_rate=config.RESULT_HISTORY_SAMPLE_RATE
         )
         await db_connector.connect()
         logger.info("✅ Database connected")
@@ -63,35 +127,73 @@ async def startup_event():
         logger.error(f"   Host: {config.DB_HOST}, Port: {config.DB_PORT}, User: {config.DB_USER}, Database: {config.DB_NAME}")
         raise
     
-    # Initialize trainer
-    trainer = None
-    try:
-        trainer = ModelTrainer(db_connector)
-        set_trainer(trainer)
-        set_db_connector(db_connector)
-        logger.info("✅ Model trainer initialized")
-    except Exception as e:
-        logger.error(f"❌ Trainer initialization failed: {e}")
-        raise
+    set_db_connector(db_connector)
+    
+    # Initialize trainer (imported here: training pulls in TensorFlow)
+    if config.SERVING_ONLY:
+        logger.info("⏭️ Serving only: model trainer disabled")
+    elif multi_worker:
+        set_trainer_proxy(serving_workers.trainer_url)
+        logger.info(f"➡️ Training requests forwarded to the training process ({serving_workers.trainer_url})")
+    else:
+        try:
+            from trainer import ModelTrainer
+            from training_jobs import TrainingJobManager
+            
+            trainer = ModelTrainer(db_connector)
+            job_manager = TrainingJobManager(trainer)
+            set_trainer(trainer)
+            set_job_manager(job_manager)
+            logger.info(f"✅ Model trainer initialized (max concurrent jobs: {job_manager.max_concurrent})")
+        except Exception as e:
+            logger.error(f"❌ Trainer initialization failed: {e}")
+            raise
+    
+    if training_process:
+        startup_seconds = round(time.time() - PROCESS_STARTED, 2)
+        logger.info(f"✅ Training process started in {startup_seconds}s (no realtime processing)")
+        return
     
     # Initialize realtime processor
     try:
-        realtime_processor = RealtimeProcessor(redis_connector, db_connector)
+        from realtime_processor import RealtimeProcessor
+        
+        realtime_processor = RealtimeProcessor(
+            redis_connector,
+            db_connector,
+            shard=serving_workers.worker_index,
+            shards=serving_workers.worker_count,
+            preloaded=serving_workers.preloaded,
+            worker_stats=serving_workers.stats
+        )
         asyncio.create_task(realtime_processor.start())
+        scoring.set_realtime_processor(realtime_processor)
+        scoring.set_db_connector(db_connector)
+        # Local rollups only see this worker's shard of the events
+        if realtime_processor.rollups and (config.ROLLUP_BACKEND == 'redis' or not multi_worker):
+            set_event_rollups(realtime_processor.rollups)
         logger.info("✅ Realtime processor started")
     except Exception as e:
         logger.error(f"❌ Realtime processor failed: {e}")
         raise
     
-    logger.info("✅ ML Service started successfully")
+    if config.RESULT_HISTORY_RETENTION_DAYS > 0 and serving_workers.worker_index == 0:
+        asyncio.create_task(history_retention_loop())
+        logger.info(f"✅ Result history retention: {config.RESULT_HISTORY_RETENTION_DAYS} days")
+    
+    startup_seconds = round(time.time() - PROCESS_STARTED, 2)
+    logger.info(f"✅ ML Service started successfully in {startup_seconds}s")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Shutdown event handler"""
-    global redis_connector, db_connector, realtime_processor
+    global redis_connector, db_connector, realtime_processor, job_manager
     
     logger.info("🛑 Shutting down ML Service...")
     
+    if job_manager:
+        await job_manager.shutdown()
+    
     if realtime_processor:
         await realtime_processor.stop()
     
@@ -114,6 +216,7 @@ app.add_middleware(
 
 # Include routers
 app.include_router(model_router, prefix="/api/models", tags=["models"])
+app.include_router(scoring.router, prefix="/api", tags=["scoring"])
 
 @app.get("/")
 async def root():
@@ -125,16 +228,29 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint (live: responding; ready: initial model loading finished)"""
     try:
         redis_ok = redis_connector and await redis_connector.ping()
         db_ok = db_connector and await db_connector.ping()
+        ready = bool(realtime_processor and realtime_processor.ready)
         
         return {
-            "status": "healthy" if (redis_ok and db_ok) else "degraded",
+            "status": ("healthy" if ready else "starting") if (redis_ok and db_ok) else "degraded",
+            "live": True,
+            "ready": ready,
             "redis": "connected" if redis_ok else "disconnected",
             "database": "connected" if db_ok else "disconnected",
-            "realtime_processor": "running" if realtime_processor and realtime_processor.running else "stopped"
+            "realtime_processor": "running" if realtime_processor and realtime_processor.running else "stopped",
+            "serving_only": config.SERVING_ONLY or (serving_workers.worker_count > 1 and serving_workers.role == 'serving'),
+            "worker": {"index": serving_workers.worker_index, "count": serving_workers.worker_count,
+                       "role": serving_workers.role, "pid": os.getpid()},
+            "startup_seconds": startup_seconds,
+            "uptime_seconds": round(time.time() - PROCESS_STARTED, 1),
+            "memory_mb": memory_usage_mb(),
+            "tensorflow_loaded": 'tensorflow' in sys.modules,
+            "threading": apply_process_policy(),  # Already applied: returns this process's policy
+            "models_loaded": dict(realtime_processor.served_versions) if realtime_processor else {},
+            "models": realtime_processor.model_status if realtime_processor else {}
         }
     except Exception as e:
         logger.error(f"Health check error: {e}")
@@ -143,6 +259,19 @@ async def health_check():
             "error": str(e)
         }
 
+@app.get("/health/live")
+async def liveness():
+    """Liveness: the process and its event loop respond (models may still be loading)"""
+    return {"live": True, "uptime_seconds": round(time.time() - PROCESS_STARTED, 1)}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness: 503 until every model is loaded, missing (not trained) or failed"""
+    models = realtime_processor.model_status if realtime_processor else {}
+    if not realtime_processor or not realtime_processor.ready:
+        raise HTTPException(status_code=503, detail={"ready": False, "models": models})
+    return {"ready": True, "models": models}
+
 @app.get("/api/stats")
 async def get_stats():
     """Get service statistics"""
@@ -150,15 +279,30 @@ async def get_stats():
         raise HTTPException(status_code=503, detail="Realtime processor not initialized")
     
     return {
-        "events_processed": realtime_processor.events_processed,
-        "predictions_made": realtime_processor.predictions_made,
-        "recommendations_generated": realtime_processor.recommendations_generated,
-        "anomalies_detected": realtime_processor.anomalies_detected,
-        "segments_updated": realtime_processor.segments_updated,
+        **processor_stats(),
         "running": realtime_processor.running,
-        "buffer_size": len(realtime_processor.event_buffer)
+        "database": db_connector.get_stats() if db_connector else None  # This worker's pools
     }
 
+def processor_stats():
+    """Realtime counters, summed over all serving workers (with a per-worker breakdown) when forked"""
+    if serving_workers.stats is not None:
+        serving_workers.stats.publish(serving_workers.worker_index, realtime_processor.stats())
+        return serving_workers.stats.snapshot()
+    return realtime_processor.stats()
+
+@app.get("/api/stats/events")
+async def get_event_rollups(days: int = 30):
+    """Event counts and distinct users/devices of the last days from the realtime rollups (no MySQL)"""
+    if not realtime_processor or not realtime_processor.rollups:
+        raise HTTPException(status_code=503, detail="Event rollups not enabled")
+    
+    try:
+        return {"success": True, **await realtime_processor.rollups.query(days)}
+    except Exception as e:
+        logger.error(f"Event rollup query error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/test-event")
 async def test_event():
     """Test endpoint to send a test event to ML queue"""
@@ -166,7 +310,6 @@ async def test_event():
         raise HTTPException(status_code=503, detail="Redis not connected")
     
     try:
-        import time
         test_event = {
             "id": f"test_{int(time.time() * 1000)}",
             "userId": 1,
@@ -198,18 +341,17 @@ async def websocket_endpoint(websocket: WebSocket):
         while True:
             # Send stats every 5 seconds
             if realtime_processor:
-                stats = {
-                    "events_processed": realtime_processor.events_processed,
-                    "predictions_made": realtime_processor.predictions_made,
-                    "recommendations_generated": realtime_processor.recommendations_generated,
-                    "anomalies_detected": realtime_processor.anomalies_detected
-                }
-                await websocket.send_json(stats)
+                stats = processor_stats()
+                await websocket.send_json({key: stats[key] for key in ('events_processed', 'predictions_made',
+                                                                       'recommendations_generated', 'anomalies_detected')})
             await asyncio.sleep(5)
     except WebSocketDisconnect:
         logger.info("WebSocket client disconnected")
 
 if __name__ == "__main__":
+    if config.SERVING_WORKERS > 1:
+        serving_workers.run(app)
+        sys.exit(0)
     uvicorn.run(
         "main:app",
         host=config.ML_SERVICE_HOST,
@@ -1,12 +1,14 @@
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers
 from sklearn.ensemble import IsolationForest
 from typing import List, Dict, Any, Optional, Tuple
 import logging
 import os
 from config import config
+from data_pipeline import fit_arrays, min_max_stats
+from utils.weight_file import save_keras_model, load_keras_model, weight_file_path
+from utils.dense_runtime import DenseNetwork
+from models.backends import InferenceBackend, load_backend, default_backend, needs_keras, warm_up
+from utils.threading_policy import n_jobs
 
 logger = logging.getLogger(__name__)
 
@@ -15,13 +17,43 @@ class AnomalyDetectionModel:
     
     def __init__(self, input_dim: int = 50):
         self.input_dim = input_dim
+        self._deferred_path = None  # .h5 loaded on first access of .autoencoder (see load)
         self.autoencoder = None
+        self.runtime = None  # NumPy copy of the autoencoder (numpy/torchscript backends)
+        self.backend = None  # Inference backend (models/backends.py), built on first use
         self.isolation_forest = None
         self.is_trained = False
         self.threshold = config.ANOMALY_THRESHOLD
+        # Training-time calibration (saved next to the model), so a row scores the same alone or in a batch
+        self.feature_min = None  # Column range of the autoencoder input
+        self.feature_max = None
+        self.error_scale = None  # Largest reconstruction error on the training data
+        self.if_score_range = None  # (min, max) IsolationForest score_samples on the training data
+    
+    @property
+    def autoencoder(self):
+        """Keras autoencoder; loaded on first access when load() only mapped the weight file"""
+        if self._autoencoder is None and self._deferred_path is not None:
+            path, self._deferred_path = self._deferred_path, None
+            self._autoencoder, needs_compile = load_keras_model(path)
+            if needs_compile:
+                self.compile_autoencoder()
+        return self._autoencoder
+    
+    @autoencoder.setter
+    def autoencoder(self, value):
+        self._autoencoder = value
+        self._deferred_path = None
+    
+    def has_autoencoder(self) -> bool:
+        """Autoencoder available for inference (without loading a deferred Keras model)"""
+        return self.runtime is not None or self.autoencoder is not None
     
     def build_autoencoder(self, encoding_dim: int = 16):
         """Build autoencoder for anomaly detection"""
+        from tensorflow import keras
+        from tensorflow.keras import layers
+        
         # Input
         input_layer = layers.Input(shape=(self.input_dim,), name='input')
         
@@ -39,32 +71,51 @@ class AnomalyDetectionModel:
         
         # Autoencoder
         self.autoencoder = keras.Model(input_layer, decoded, name='anomaly_autoencoder')
+        self.runtime = None
+        self.backend = None
         
         # Compile
+        self.compile_autoencoder()
+        
+        logger.info("Autoencoder built")
+        return self.autoencoder
+    
+    def compile_autoencoder(self, learning_rate: float = None):
+        """(Re)compile the autoencoder, e.g. with a smaller learning rate for fine-tuning"""
+        from tensorflow import keras
+        
         self.autoencoder.compile(
-            optimizer=keras.optimizers.Adam(learning_rate=config.LEARNING_RATE),
+            optimizer=keras.optimizers.Adam(learning_rate=learning_rate or config.LEARNING_RATE),
             loss='mse',
             metrics=['mae']
         )
+    
+    def evaluate_autoencoder(self, data: np.ndarray) -> float:
+        """Mean reconstruction loss on held-out data"""
+        if self.autoencoder is None:
+            raise Exception("Autoencoder not trained")
         
-        logger.info("Autoencoder built")
-        return self.autoencoder
+        data_normalized = (data - np.min(data, axis=0)) / (np.max(data, axis=0) - np.min(data, axis=0) + 1e-8)
+        results = self.autoencoder.evaluate(data_normalized, data_normalized, verbose=0, return_dict=True)
+        return float(results['loss'])
     
     def train_autoencoder(self,
                          data: np.ndarray,
                          validation_split: float = 0.2,
                          epochs: int = None,
-                         batch_size: int = None):
+                         batch_size: int = None,
+                         extra_callbacks: Optional[list] = None):
         """Train autoencoder"""
+        from tensorflow import keras
+        
         if self.autoencoder is None:
             self.build_autoencoder()
+        self.runtime = None  # Weights change: re-exported on the next inference
+        self.backend = None
         
         epochs = epochs or config.EPOCHS
         batch_size = batch_size or config.BATCH_SIZE
         
-        # Normalize data
-        data_normalized = (data - np.min(data, axis=0)) / (np.max(data, axis=0) - np.min(data, axis=0) + 1e-8)
-        
         # Callbacks
         callbacks = [
             keras.callbacks.EarlyStopping(
@@ -73,18 +124,28 @@ class AnomalyDetectionModel:
                 restore_best_weights=True
             )
         ]
+        callbacks.extend(extra_callbacks or [])
         
-        # Train
-        history = self.autoencoder.fit(
-            data_normalized,
-            data_normalized,  # Autoencoder reconstructs input
+        # Train (autoencoder reconstructs its input, normalized per batch in the pipeline)
+        self.feature_min, self.feature_max = min_max_stats(data)
+        history = fit_arrays(
+            self.autoencoder,
+            {'input': data},
             validation_split=validation_split,
             epochs=epochs,
             batch_size=batch_size,
             callbacks=callbacks,
+            transforms={'input': self.normalize},
             verbose=1
         )
         
+        # Error scale for anomaly scores
+        self.error_scale = 0.0
+        for start in range(0, len(data), 65536):
+            chunk = self.normalize(np.asarray(data[start:start + 65536], dtype=np.float32))
+            reconstructed = self.autoencoder.predict(chunk, batch_size=4096, verbose=0)
+            self.error_scale = max(self.error_scale, float(np.max(np.mean((chunk - reconstructed) ** 2, axis=1))))
+        
         logger.info("Autoencoder trained")
         return history
     
@@ -93,27 +154,74 @@ class AnomalyDetectionModel:
         self.isolation_forest = IsolationForest(
             contamination=contamination,
             random_state=42,
-            n_estimators=100
+            n_estimators=100,
+            n_jobs=n_jobs('training')
         )
         self.isolation_forest.fit(data)
+        scores = self.isolation_forest.score_samples(data)
+        self.if_score_range = (float(np.min(scores)), float(np.max(scores)))
         logger.info("Isolation Forest trained")
     
-    def detect_anomaly_autoencoder(self, data: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-        """Detect anomalies using autoencoder reconstruction error"""
-        if self.autoencoder is None:
+    def _network(self) -> DenseNetwork:
+        if self.runtime is None:
+            self.runtime = DenseNetwork.from_keras(self.autoencoder)
+        return self.runtime
+    
+    def inference_backend(self) -> InferenceBackend:
+        """Configured backend for the autoencoder (numpy by default when NUMPY_INFERENCE is on)"""
+        if self.backend is None:
+            self.backend = load_backend('anomaly', default_backend(config.NUMPY_INFERENCE),
+                                        keras_model=lambda: self.autoencoder, network=self._network)
+        return self.backend
+    
+    def warmup(self) -> float:
+        """Run the inference backend on every batch bucket; returns seconds"""
+        dim = self.runtime.input_dim if self.runtime is not None else self.autoencoder.input_shape[1]
+        return warm_up(self.inference_backend(), lambda n: [np.zeros((n, dim), dtype=np.float32)])
+    
+    def reconstruct(self, data_normalized: np.ndarray) -> np.ndarray:
+        """Autoencoder output through the inference backend"""
+        return self.inference_backend().predict([data_normalized])
+    
+    def normalize(self, data: np.ndarray) -> np.ndarray:
+        """Min-max with the training-time column range (the autoencoder input)
+        
+        Models saved without it fall back to the range of the rows scored together.
+        """
+        if self.feature_min is not None:
+            return (data - self.feature_min) / (self.feature_max - self.feature_min + 1e-8)
+        return (data - np.min(data, axis=0)) / (np.max(data, axis=0) - np.min(data, axis=0) + 1e-8)
+    
+    def is_calibrated(self) -> bool:
+        """Scores of a row do not depend on the other rows scored with it"""
+        return (self.feature_min is not None and self.error_scale is not None
+                and (self.isolation_forest is None or self.if_score_range is not None))
+    
+    def detect_anomaly_autoencoder(self, data: np.ndarray,
+                                   reconstructed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Detect anomalies using autoencoder reconstruction error
+        
+        reconstructed: autoencoder output for normalize(data) computed elsewhere (the online
+        scoring API batches it across requests)
+        """
+        if not self.has_autoencoder():
             raise Exception("Autoencoder not trained")
         
         # Normalize
-        data_normalized = (data - np.min(data, axis=0)) / (np.max(data, axis=0) - np.min(data, axis=0) + 1e-8)
+        data_normalized = self.normalize(data)
         
         # Reconstruct
-        reconstructed = self.autoencoder.predict(data_normalized, verbose=0)
+        if reconstructed is None:
+            reconstructed = self.reconstruct(data_normalized)
         
         # Calculate reconstruction error
         reconstruction_error = np.mean((data_normalized - reconstructed) ** 2, axis=1)
         
-        # Anomaly score (normalized to 0-1)
-        max_error = np.max(reconstruction_error) if len(reconstruction_error) > 0 else 1.0
+        # Anomaly score (normalized to 0-1 by the training error scale, else the batch maximum)
+        if self.error_scale is not None:
+            max_error = self.error_scale
+        else:
+            max_error = np.max(reconstruction_error) if len(reconstruction_error) > 0 else 1.0
         anomaly_scores = reconstruction_error / (max_error + 1e-8)
         anomaly_scores = np.clip(anomaly_scores, 0, 1)
         
@@ -135,18 +243,21 @@ class AnomalyDetectionModel:
         # Isolation Forest returns -1 for anomalies, 1 for normal
         is_anomaly = (predictions == -1).astype(int)
         
-        # Normalize scores to 0-1
-        min_score = np.min(scores)
-        max_score = np.max(scores)
-        anomaly_scores = (scores - min_score) / (max_score - min_score + 1e-8)
+        # Normalize scores to 0-1 (training score range, else the batch range)
+        if self.if_score_range is not None:
+            min_score, max_score = self.if_score_range
+        else:
+            min_score, max_score = np.min(scores), np.max(scores)
+        anomaly_scores = np.clip((scores - min_score) / (max_score - min_score + 1e-8), 0, 1)
         anomaly_scores = 1 - anomaly_scores  # Invert so higher = more anomalous
         
         return anomaly_scores, is_anomaly
     
-    def detect_anomaly_hybrid(self, data: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    def detect_anomaly_hybrid(self, data: np.ndarray,
+                              reconstructed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """Hybrid anomaly detection combining autoencoder and isolation forest"""
         # Autoencoder scores
-        ae_scores, ae_anomalies = self.detect_anomaly_autoencoder(data)
+        ae_scores, ae_anomalies = self.detect_anomaly_autoencoder(data, reconstructed)
         
         # Isolation Forest scores
         if_scores, if_anomalies = self.detect_anomaly_isolation_forest(data)
@@ -203,7 +314,7 @@ class AnomalyDetectionModel:
         
         # Save autoencoder
         autoencoder_path = filepath.replace('.h5', '_autoencoder.h5')
-        self.autoencoder.save(autoencoder_path)
+        save_keras_model(self.autoencoder, autoencoder_path)
         
         # Save isolation forest
         if self.isolation_forest:
@@ -211,22 +322,52 @@ class AnomalyDetectionModel:
             if_path = filepath.replace('.h5', '_isolation_forest.joblib')
             joblib.dump(self.isolation_forest, if_path)
         
+        # Save calibration
+        calibration = {
+            'feature_min': self.feature_min,
+            'feature_max': self.feature_max,
+            'error_scale': self.error_scale,
+            'if_score_range': self.if_score_range
+        }
+        np.savez(filepath.replace('.h5', '_calibration.npz'),
+                 **{key: np.asarray(value) for key, value in calibration.items() if value is not None})
+        
         logger.info(f"Models saved to {filepath}")
     
     def load(self, filepath: str):
         """Load models from file"""
-        # Load autoencoder
+        # Load autoencoder (only its NumPy runtime when serving from a weight file without Keras)
         autoencoder_path = filepath.replace('.h5', '_autoencoder.h5')
-        if not os.path.exists(autoencoder_path):
-            raise FileNotFoundError(f"Model file not found: {autoencoder_path}")
-        
-        self.autoencoder = keras.models.load_model(autoencoder_path)
+        mmw_path = weight_file_path(autoencoder_path)
+        self.backend = None
+        if os.path.exists(mmw_path) and not needs_keras('anomaly', default_backend(config.NUMPY_INFERENCE)):
+            self.autoencoder = None
+            self._deferred_path = autoencoder_path
+            self.runtime = DenseNetwork.from_weight_file(mmw_path)
+        else:
+            self.autoencoder, needs_compile = load_keras_model(autoencoder_path)
+            if needs_compile:
+                self.compile_autoencoder()
+            self.runtime = DenseNetwork.from_weight_file(mmw_path) if os.path.exists(mmw_path) else None
         
-        # Load isolation forest
+        # Load isolation forest (tree arrays memory-mapped, shared between workers)
         if_path = filepath.replace('.h5', '_isolation_forest.joblib')
         if os.path.exists(if_path):
             import joblib
-            self.isolation_forest = joblib.load(if_path)
+            self.isolation_forest = joblib.load(if_path, mmap_mode='r')
+            self.isolation_forest.set_params(n_jobs=n_jobs('serving'))
+        
+        # Load calibration (absent for models saved before it existed: batch-relative scores)
+        calibration_path = filepath.replace('.h5', '_calibration.npz')
+        if os.path.exists(calibration_path):
+            with np.load(calibration_path) as calibration:
+                self.feature_min = calibration['feature_min'] if 'feature_min' in calibration else None
+                self.feature_max = calibration['feature_max'] if 'feature_max' in calibration else None
+                self.error_scale = float(calibration['error_scale']) if 'error_scale' in calibration else None
+                self.if_score_range = (tuple(float(v) for v in calibration['if_score_range'])
+                                       if 'if_score_range' in calibration else None)
+        else:
+            logger.warning(f"No calibration next to {filepath}, anomaly scores are relative to each batch")
         
         self.is_trained = True
         logger.info(f"Models loaded from {filepath}")
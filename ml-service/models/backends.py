@@ -0,0 +1,345 @@
+"""Inference backends: the same trained weights run through Keras, TFLite, TorchScript or NumPy
+
+Every model keeps training with Keras; only inference goes through a backend, chosen per
+model by INFERENCE_BACKEND / MODEL_BACKENDS (see backend_names) and honoring USE_TENSORFLOW
+and USE_PYTORCH. 'auto' uses the per batch size winners that benchmarks/inference_backends.py
+measured on this host.
+
+Shape-specialized backends (keras, tflite) only ever see the BATCH_BUCKETS batch sizes:
+batches are zero-padded up to the next bucket (split above the largest), and warmup() traces
+every bucket at load time, so live traffic never pays for tracing or tensor allocation.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from config import config
+from utils.threading_policy import inference_threads
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('keras', 'tflite', 'torchscript', 'numpy')
+TENSORFLOW_BACKENDS = ('keras', 'tflite')
+SHAPE_SPECIALIZED = ('keras', 'tflite')  # Backends whose cost depends on seeing a new input shape
+MODEL_KEYS = ('purchase', 'recommendation', 'anomaly', 'segmentation')
+
+class InferenceBackend:
+    """predict(inputs) for the model's list of input arrays -> output array"""
+    
+    name = None
+    
+    def predict(self, inputs: List[np.ndarray]) -> np.ndarray:
+        raise NotImplementedError
+    
+    def warmup(self, make_inputs: Callable[[int], List[np.ndarray]], batch_sizes: List[int]):
+        """Run each batch size once so first-call costs are paid before live traffic"""
+        for batch_size in batch_sizes:
+            self.predict(make_inputs(batch_size))
+    
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+class KerasBackend(InferenceBackend):
+    """Keras model behind a tf.function, with one concrete function per warmed-up batch size
+    
+    The concrete functions have fixed input specs and are called directly, skipping both
+    predict()'s per-call data adapter and tf.function's signature matching; other batch
+    sizes go through the tf.function (reduce_retracing, so it settles on a None batch dim).
+    """
+    
+    name = 'keras'
+    
+    def __init__(self, keras_model):
+        import tensorflow as tf
+        
+        self.keras_model = keras_model
+        self._tf = tf
+        self._specs = [(tuple(t.shape[1:]), t.dtype) for t in keras_model.inputs]
+        self._function = tf.function(
+            lambda *xs: keras_model(list(xs) if len(xs) > 1 else xs[0], training=False),
+            reduce_retracing=True
+        )
+        self._concrete = {}  # batch size -> concrete function
+    
+    def _tensors(self, inputs: List[np.ndarray]) -> list:
+        return [self._tf.convert_to_tensor(np.asarray(x).reshape((len(x),) + shape), dtype=dtype)
+                for x, (shape, dtype) in zip(inputs, self._specs)]
+    
+    def compile(self, batch_size: int):
+        """Trace the concrete function for one fixed batch size"""
+        if batch_size not in self._concrete:
+            signature = [self._tf.TensorSpec((batch_size,) + shape, dtype) for shape, dtype in self._specs]
+            self._concrete[batch_size] = self._function.get_concrete_function(*signature)
+    
+    def predict(self, inputs: List[np.ndarray]) -> np.ndarray:
+        tensors = self._tensors(inputs)
+        concrete = self._concrete.get(len(inputs[0]))
+        return (concrete(*tensors) if concrete is not None else self._function(*tensors)).numpy()
+    
+    def warmup(self, make_inputs: Callable[[int], List[np.ndarray]], batch_sizes: List[int]):
+        for batch_size in batch_sizes:
+            self.compile(batch_size)
+        super().warmup(make_inputs, batch_sizes)
+
+class NumpyBackend(InferenceBackend):
+    """DenseNetwork, PurchaseNetwork or RecommendationNetwork (utils/*_runtime)"""
+    
+    name = 'numpy'
+    
+    def __init__(self, network):
+        self.network = network
+    
+    def predict(self, inputs: List[np.ndarray]) -> np.ndarray:
+        return self.network.predict(*inputs)
+
+def tflite_convert(keras_model, quantization: Optional[str] = None) -> bytes:
+    """TFLite flatbuffer of a Keras model; quantization 'int8' (dynamic range) or 'float16'"""
+    import tensorflow as tf
+    
+    def converter(select_ops: bool):
+        converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+        if quantization is not None:
+            converter.optimizations = [tf.lite.Optimize.DEFAULT]
+            if quantization == 'float16':
+                converter.target_spec.supported_types = [tf.float16]
+        if select_ops:
+            converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+            converter._experimental_lower_tensor_list_ops = False
+        return converter
+    
+    try:
+        return converter(False).convert()
+    except Exception as e:
+        # LSTMs with a dynamic batch can need TF ops that have no builtin kernel
+        logger.warning(f"⚠️ TFLite builtin conversion failed ({e}), retrying with TF select ops")
+        return converter(True).convert()
+
+class TFLiteBackend(InferenceBackend):
+    """TFLite interpreter over the converted Keras model (or a saved flatbuffer)
+    
+    Every batch size gets its own interpreter with tensors allocated once (up to
+    MAX_INTERPRETERS; beyond that one interpreter is resized per call), each with the
+    serving role's TF intra-op thread count (utils/threading_policy.inference_threads).
+    Interpreters are not thread-safe: calls are serialized.
+    """
+    
+    name = 'tflite'
+    MAX_INTERPRETERS = 16
+    
+    def __init__(self, keras_model=None, content: Optional[bytes] = None, input_names: Optional[List[str]] = None):
+        import tensorflow as tf
+        
+        if content is None:
+            content = tflite_convert(keras_model)
+            input_names = keras_model.input_names
+        self.size_bytes = len(content)
+        self._new_interpreter = lambda: tf.lite.Interpreter(model_content=content, num_threads=inference_threads())
+        interpreter = self._new_interpreter()
+        
+        # Converted input order is not guaranteed: match the Keras input names
+        details = interpreter.get_input_details()
+        self.inputs = []
+        for i, input_name in enumerate(input_names or [d['name'] for d in details]):
+            match = [d for d in details if input_name in d['name']]
+            self.inputs.append(match[0] if match else details[i])
+        self.output_index = interpreter.get_output_details()[0]['index']
+        self._interpreters = {}  # batch size -> allocated interpreter
+        self._shared = (interpreter, None)  # Resized per call once the cache is full
+        self._lock = threading.Lock()
+    
+    def _interpreter(self, batch_size: int, shapes: list):
+        interpreter = self._interpreters.get(batch_size)
+        if interpreter is not None:
+            return interpreter
+        if len(self._interpreters) < self.MAX_INTERPRETERS:
+            interpreter = self._new_interpreter()
+            self._interpreters[batch_size] = interpreter
+        else:
+            interpreter, allocated = self._shared
+            if allocated == shapes:
+                return interpreter
+            self._shared = (interpreter, shapes)
+        for shape, detail in zip(shapes, self.inputs):
+            interpreter.resize_tensor_input(detail['index'], shape)
+        interpreter.allocate_tensors()
+        return interpreter
+    
+    def predict(self, inputs: List[np.ndarray]) -> np.ndarray:
+        arrays = [np.ascontiguousarray(x, dtype=d['dtype']).reshape((len(x),) + tuple(d['shape'][1:]))
+                  for x, d in zip(inputs, self.inputs)]
+        with self._lock:
+            interpreter = self._interpreter(len(arrays[0]), [a.shape for a in arrays])
+            for array, detail in zip(arrays, self.inputs):
+                interpreter.set_tensor(detail['index'], array)
+            interpreter.invoke()
+            return interpreter.get_tensor(self.output_index).copy()
+    
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name, "size_bytes": self.size_bytes}
+
+class TorchScriptBackend(InferenceBackend):
+    """Frozen TorchScript module rebuilt from the NumPy runtime's weights"""
+    
+    name = 'torchscript'
+    
+    def __init__(self, network):
+        try:
+            from utils import torch_runtime
+        except ImportError as e:
+            raise Exception(f"torchscript backend needs PyTorch: {e}")
+        self._runtime = torch_runtime
+        self.module = torch_runtime.script(network)
+    
+    def predict(self, inputs: List[np.ndarray]) -> np.ndarray:
+        return self._runtime.predict(self.module, inputs)
+
+class RoutedBackend(InferenceBackend):
+    """Batch size dependent choice: the first route whose limit covers the batch, else the last"""
+    
+    name = 'auto'
+    
+    def __init__(self, routes: List[Tuple[int, InferenceBackend]]):
+        self.routes = routes
+    
+    def predict(self, inputs: List[np.ndarray]) -> np.ndarray:
+        n = len(inputs[0])
+        backend = next((b for limit, b in self.routes if n <= limit), self.routes[-1][1])
+        return backend.predict(inputs)
+    
+    def warmup(self, make_inputs: Callable[[int], List[np.ndarray]], batch_sizes: List[int]):
+        for _, backend in self.routes:
+            backend.warmup(make_inputs, batch_sizes)
+    
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name, "routes": [[limit, b.describe()] for limit, b in self.routes]}
+
+class BucketedBackend(InferenceBackend):
+    """Zero-pads every batch to the next bucket size and splits batches above the largest
+    bucket, so the wrapped backend only sees len(buckets) input shapes"""
+    
+    def __init__(self, inner: InferenceBackend, buckets: List[int]):
+        self.inner = inner
+        self.buckets = sorted(buckets)
+        self.name = inner.name
+        self.padded_rows = 0
+    
+    def _bucket(self, n: int) -> int:
+        return next(b for b in self.buckets if b >= n)
+    
+    def predict(self, inputs: List[np.ndarray]) -> np.ndarray:
+        inputs = [np.asarray(x) for x in inputs]
+        n, largest = len(inputs[0]), self.buckets[-1]
+        if n > largest:
+            return np.concatenate([self.predict([x[start:start + largest] for x in inputs])
+                                   for start in range(0, n, largest)])
+        size = self._bucket(n)
+        if size != n:
+            self.padded_rows += size - n
+            inputs = [np.concatenate([x, np.zeros((size - n,) + x.shape[1:], dtype=x.dtype)]) for x in inputs]
+        return self.inner.predict(inputs)[:n]
+    
+    def warmup(self, make_inputs: Callable[[int], List[np.ndarray]], batch_sizes: List[int] = None):
+        self.inner.warmup(make_inputs, self.buckets)
+    
+    def describe(self) -> Dict[str, Any]:
+        return dict(self.inner.describe(), buckets=self.buckets)
+
+def batch_buckets() -> List[int]:
+    """BATCH_BUCKETS as a sorted list (empty: no bucketing)"""
+    return sorted({int(b) for b in config.BATCH_BUCKETS.split(',') if b.strip()})
+
+def parse_overrides(value: str) -> Dict[str, str]:
+    """Backend per model key from e.g. purchase=numpy,recommendation=torchscript"""
+    overrides = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        key, _, name = item.partition('=')
+        overrides[key.strip()] = name.strip()
+    return overrides
+
+def load_profile(path: Optional[str] = None) -> Dict[str, Any]:
+    path = path or config.BACKEND_PROFILE_PATH
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _allowed(name: str) -> bool:
+    if name in TENSORFLOW_BACKENDS:
+        return config.USE_TENSORFLOW
+    if name == 'torchscript':
+        return config.USE_PYTORCH
+    return name == 'numpy'
+
+def backend_names(model_key: str, default: str) -> List[Tuple[int, str]]:
+    """Configured backend for a model as (max batch size, backend) routes
+    
+    MODEL_BACKENDS overrides INFERENCE_BACKEND, which overrides the model's default. Backends
+    the flags rule out (keras/tflite without USE_TENSORFLOW, torchscript without USE_PYTORCH)
+    fall back to the default, or to numpy when that is ruled out too.
+    """
+    name = parse_overrides(config.MODEL_BACKENDS).get(model_key) or config.INFERENCE_BACKEND or default
+    if name == 'auto':
+        routes = load_profile().get('models', {}).get(model_key, {}).get('routes')
+        routes = [(int(limit), b) for limit, b in routes or [] if _allowed(b)]
+        if routes:
+            return routes
+        logger.warning(f"⚠️ No backend profile for {model_key}, using {default} (run benchmarks/inference_backends.py)")
+        name = default
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}' for {model_key} (one of {', '.join(BACKENDS)}, auto)")
+    if not _allowed(name):
+        fallback = default if _allowed(default) else 'numpy'
+        logger.warning(f"⚠️ {name} backend disabled by USE_TENSORFLOW/USE_PYTORCH, {model_key} uses {fallback}")
+        name = fallback
+    return [(0, name)]
+
+def needs_keras(model_key: str, default: str) -> bool:
+    """Whether the configured backend(s) need the Keras model (not just the weight file)"""
+    return any(name in TENSORFLOW_BACKENDS for _, name in backend_names(model_key, default))
+
+def create_backend(name: str, keras_model: Callable[[], Any], network: Callable[[], Any]) -> InferenceBackend:
+    """Build one backend (bucketed if shape specialized); keras_model and network are called
+    only if it needs them"""
+    backend = _create_backend(name, keras_model, network)
+    if name in SHAPE_SPECIALIZED and batch_buckets():
+        backend = BucketedBackend(backend, batch_buckets())
+    return backend
+
+def _create_backend(name: str, keras_model: Callable[[], Any], network: Callable[[], Any]) -> InferenceBackend:
+    if name == 'keras':
+        return KerasBackend(keras_model())
+    if name == 'tflite':
+        return TFLiteBackend(keras_model())
+    if name == 'torchscript':
+        return TorchScriptBackend(network())
+    if name == 'numpy':
+        return NumpyBackend(network())
+    raise ValueError(f"Unknown inference backend '{name}'")
+
+def load_backend(model_key: str, default: str, keras_model: Callable[[], Any],
+                 network: Callable[[], Any]) -> InferenceBackend:
+    """The configured backend for a model (a RoutedBackend when auto picked several)"""
+    routes = backend_names(model_key, default)
+    built = {}
+    for _, name in routes:
+        if name not in built:
+            built[name] = create_backend(name, keras_model, network)
+    if len(built) == 1:
+        backend = next(iter(built.values()))
+    else:
+        backend = RoutedBackend([(limit, built[name]) for limit, name in routes])
+    logger.info(f"🔧 {model_key} inference backend: {backend.describe()}")
+    return backend
+
+def warm_up(backend: InferenceBackend, make_inputs: Callable[[int], List[np.ndarray]]) -> float:
+    """Warm a backend on every batch bucket (batch size 1 without buckets); returns seconds"""
+    start = time.perf_counter()
+    backend.warmup(make_inputs, batch_buckets() or [1])
+    return time.perf_counter() - start
+
+def default_backend(numpy_default: bool = False) -> str:
+    """Model default: numpy where the NumPy runtime is the established path, else keras"""
+    return 'numpy' if numpy_default or not config.USE_TENSORFLOW else 'keras'
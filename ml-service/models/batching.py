@@ -0,0 +1,172 @@
+"""Dynamic request batching for the online scoring API
+
+Concurrent requests for the same model are coalesced into one backend call: the first
+request opens a window of at most max_wait_ms, requests arriving meanwhile join it, and the
+batch is cut early once it holds max_rows rows. While a model call runs, new requests queue
+up and go out together as soon as it returns, so under load batches grow without any extra
+waiting. Model calls run in the default executor (one at a time per batcher) and the rows of
+every request are sliced back out of the batch output.
+
+Only the model call is batched; pre- and post-processing (normalization with the
+training-time ranges, IsolationForest, k-means, top-k) stays with the request, so results
+are the same as calling the model on each request alone.
+
+model_batcher keeps one batcher per served model: the scoring API and the realtime
+processor both score through it, so a backend is never called from two threads at once.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from config import config
+from models.backends import InferenceBackend
+
+logger = logging.getLogger(__name__)
+
+class BatchStats:
+    """Rolling batch size and per-request queueing/model latency"""
+    
+    def __init__(self, window: int = 2000):
+        self.batch_rows = deque(maxlen=window)
+        self.waits = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self.errors = 0
+    
+    @staticmethod
+    def _percentile(values, q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        rows, waits, latencies = list(self.batch_rows), list(self.waits), list(self.latencies)
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "rows": self.rows,
+            "errors": self.errors,
+            "requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "batch_rows": {
+                "avg": round(sum(rows) / len(rows), 1) if rows else 0.0,
+                "p50": self._percentile(rows, 0.5),
+                "max": max(rows) if rows else 0
+            },
+            "queue_wait_ms": {
+                "p50": round(1000 * self._percentile(waits, 0.5), 2),
+                "p99": round(1000 * self._percentile(waits, 0.99), 2)
+            },
+            "latency_ms": {
+                "p50": round(1000 * self._percentile(latencies, 0.5), 2),
+                "p99": round(1000 * self._percentile(latencies, 0.99), 2)
+            }
+        }
+
+class DynamicBatcher:
+    """Coalesces concurrent predict calls on one backend into single model calls"""
+    
+    def __init__(self, backend: InferenceBackend, max_rows: int = 512, max_wait_ms: float = 2.0, name: str = ''):
+        self.backend = backend
+        self.max_rows = max_rows
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self.stats = BatchStats()
+        self._pending = []  # (inputs, rows, future, enqueued_at)
+        self._pending_rows = 0
+        self._ready = deque()  # Cut batches waiting for the model
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._runner: Optional[asyncio.Task] = None
+    
+    async def predict(self, inputs: List[np.ndarray]) -> np.ndarray:
+        """Model output rows for inputs (first axis = rows), computed in a shared batch"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        rows = len(inputs[0])
+        self._pending.append((inputs, rows, future, time.perf_counter()))
+        self._pending_rows += rows
+        self.stats.requests += 1
+        
+        if self._pending_rows >= self.max_rows:
+            self._cut()
+        elif self._running():
+            pass  # Goes out with the next batch as soon as the model call returns
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._cut)
+        return await future
+    
+    def _running(self) -> bool:
+        return self._runner is not None and not self._runner.done()
+    
+    def _cut(self):
+        """Close the open window: move the pending requests to the ready queue and run it"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            self._ready.append(self._pending)
+            self._pending, self._pending_rows = [], 0
+        if self._ready and not self._running():
+            self._runner = asyncio.get_running_loop().create_task(self._run())
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while self._ready or self._pending:
+            if not self._ready:
+                self._cut_pending()
+            batch = [entry for entry in self._ready.popleft() if not entry[2].done()]  # Skip cancelled requests
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                inputs = [np.concatenate([entry[0][i] for entry in batch]) if len(batch) > 1 else batch[0][0][i]
+                          for i in range(len(batch[0][0]))]
+                output = await loop.run_in_executor(None, self.backend.predict, inputs)
+                output = np.asarray(output)
+            except Exception as e:
+                self.stats.errors += 1
+                logger.error(f"❌ Batched {self.name} prediction failed ({len(batch)} requests): {e}")
+                for entry in batch:
+                    if not entry[2].done():
+                        entry[2].set_exception(e)
+                continue
+            
+            finished = time.perf_counter()
+            rows = sum(entry[1] for entry in batch)
+            self.stats.batches += 1
+            self.stats.rows += rows
+            self.stats.batch_rows.append(rows)
+            offset = 0
+            for inputs, count, future, enqueued_at in batch:
+                self.stats.waits.append(started - enqueued_at)
+                self.stats.latencies.append(finished - enqueued_at)
+                if not future.done():
+                    future.set_result(output[offset:offset + count])
+                offset += count
+    
+    def _cut_pending(self):
+        """Requests that queued behind a model call go out right away (they already waited)"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._ready.append(self._pending)
+        self._pending, self._pending_rows = [], 0
+
+_batchers: Dict[str, Tuple[Any, DynamicBatcher]] = {}  # model key -> (served model object, batcher)
+
+def model_batcher(key: str, model) -> DynamicBatcher:
+    """Shared batcher over the served model's backend (a new one after a reload)"""
+    entry = _batchers.get(key)
+    if entry is None or entry[0] is not model:
+        entry = (model, DynamicBatcher(model.inference_backend(), max_rows=config.SCORING_MAX_BATCH_ROWS,
+                                       max_wait_ms=config.SCORING_MAX_WAIT_MS, name=key))
+        _batchers[key] = entry
+    return entry[1]
+
+def batcher_stats() -> Dict[str, Dict[str, Any]]:
+    """Batching stats per model key"""
+    return {key: batcher.stats.to_dict() for key, (_, batcher) in _batchers.items()}
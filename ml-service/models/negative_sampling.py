@@ -0,0 +1,87 @@
+import numpy as np
+from typing import List, Optional
+import logging
+from config import config
+
+logger = logging.getLogger(__name__)
+
+class NegativeSampler:
+    """Popularity-based negative sampler for implicit-feedback recommendation training
+    
+    Seen items are kept in a CSR user -> items index (indptr/indices, items sorted per
+    user). Negatives are drawn from popularity**power with inverse-CDF sampling and
+    seen items are rejected and redrawn in vectorized rounds.
+    """
+    
+    def __init__(self,
+                 user_array: np.ndarray,
+                 product_array: np.ndarray,
+                 num_users: int,
+                 num_products: int,
+                 num_negatives: int = None,
+                 power: float = None,
+                 max_rounds: int = 10):
+        self.num_users = num_users
+        self.num_products = num_products
+        self.num_negatives = num_negatives if num_negatives is not None else config.RECOMMENDATION_NEGATIVES
+        self.power = power if power is not None else config.NEGATIVE_SAMPLING_POWER
+        self.max_rounds = max_rounds
+        
+        users = np.asarray(user_array, dtype=np.int64)
+        products = np.asarray(product_array, dtype=np.int64)
+        
+        # CSR index; keys = user * num_products + item is the same data flattened,
+        # sorted, which makes membership a single searchsorted
+        self._keys = np.unique(users * num_products + products)
+        key_users = self._keys // num_products
+        self.indices = (self._keys - key_users * num_products).astype(np.int32)
+        self.indptr = np.zeros(num_users + 2, dtype=np.int64)
+        np.cumsum(np.bincount(key_users, minlength=num_users + 1), out=self.indptr[1:])
+        
+        # Popularity distribution (word2vec-style smoothing with power < 1)
+        popularity = np.bincount(products, minlength=num_products)[:num_products].astype(np.float64) ** self.power
+        if popularity.sum() == 0:
+            popularity[:] = 1.0
+        self._cdf = np.cumsum(popularity)
+        self._cdf /= self._cdf[-1]
+    
+    def seen_items(self, user: int) -> np.ndarray:
+        """Items the user interacted with (CSR row)"""
+        return self.indices[self.indptr[user]:self.indptr[user + 1]]
+    
+    def is_seen(self, users: np.ndarray, products: np.ndarray) -> np.ndarray:
+        """Vectorized membership test against the CSR index"""
+        if len(self._keys) == 0:
+            return np.zeros(len(users), dtype=bool)
+        keys = users.astype(np.int64) * self.num_products + products
+        pos = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return self._keys[pos] == keys
+    
+    def sample(self, users: np.ndarray, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """num_negatives unseen items per user, shape (len(users), num_negatives)"""
+        rng = rng or np.random.default_rng()
+        users = np.repeat(np.asarray(users, dtype=np.int64), self.num_negatives)
+        negatives = np.searchsorted(self._cdf, rng.random(len(users)), side='right')
+        
+        pending = np.flatnonzero(self.is_seen(users, negatives))
+        for _ in range(self.max_rounds):
+            if len(pending) == 0:
+                break
+            negatives[pending] = np.searchsorted(self._cdf, rng.random(len(pending)), side='right')
+            pending = pending[self.is_seen(users[pending], negatives[pending])]
+        
+        if len(pending) > 0:
+            # Users who have seen most of the popular items: fall back to uniform draws
+            negatives[pending] = rng.integers(0, self.num_products, len(pending))
+        
+        return np.minimum(negatives, self.num_products - 1).astype(np.int32).reshape(-1, self.num_negatives)
+    
+    def augment(self, batch: List[np.ndarray], rng: Optional[np.random.Generator] = None) -> List[np.ndarray]:
+        """[users, products, ratings] positives -> positives followed by their negatives (label 0)"""
+        users, products, ratings = batch
+        negatives = self.sample(users, rng).reshape(-1)
+        return [
+            np.concatenate([users, np.repeat(users, self.num_negatives).astype(users.dtype)]),
+            np.concatenate([products, negatives.astype(products.dtype)]),
+            np.concatenate([ratings, np.zeros(len(negatives), dtype=ratings.dtype)])
+        ]
@@ -1,11 +1,13 @@
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers
 from typing import List, Dict, Any, Optional
 import logging
 import os
 from config import config
+from data_pipeline import fit_arrays
+from utils.weight_file import save_keras_model, load_keras_model, weight_file_path
+from utils.lstm_runtime import PurchaseNetwork
+from models.backends import InferenceBackend, load_backend, default_backend, needs_keras, warm_up
+from models.variants import load_variant, remove_variants
 
 logger = logging.getLogger(__name__)
 
@@ -15,11 +17,37 @@ class PurchasePredictionModel:
     def __init__(self, sequence_length: int = 20, embedding_dim: int = 64):
         self.sequence_length = sequence_length
         self.embedding_dim = embedding_dim
+        self._deferred_path = None  # .h5 loaded on first access of .model (see load)
         self.model = None
+        self.network = None  # NumPy copy for the numpy/torchscript backends
+        self.backend = None  # Inference backend for predict (models/backends.py), built on first use
+        self.variant = None  # Quantized variant backend served instead (models/variants.py)
         self.is_trained = False
     
+    @property
+    def model(self):
+        """Keras model; loaded on first access when load() only mapped the weight file"""
+        if self._model is None and self._deferred_path is not None:
+            path, self._deferred_path = self._deferred_path, None
+            self._model, needs_compile = load_keras_model(path)
+            if needs_compile:
+                self.compile_model()
+        return self._model
+    
+    @model.setter
+    def model(self, value):
+        self._model = value
+        self._deferred_path = None
+    
+    def has_model(self) -> bool:
+        """Model available for inference (without loading a deferred Keras model)"""
+        return self.variant is not None or self.network is not None or self.model is not None
+    
     def build_model(self, num_event_types: int = 10, feature_dim: int = 50):
         """Build LSTM-based purchase prediction model"""
+        from tensorflow import keras
+        from tensorflow.keras import layers
+        
         # Input for event sequence
         sequence_input = layers.Input(shape=(self.sequence_length, num_event_types), name='sequence_input')
         
@@ -50,10 +78,20 @@ class PurchasePredictionModel:
             outputs=output,
             name='purchase_prediction_model'
         )
+        self.network = self.backend = self.variant = None
         
         # Compile model
+        self.compile_model()
+        
+        logger.info("Purchase prediction model built")
+        return self.model
+    
+    def compile_model(self, learning_rate: float = None):
+        """(Re)compile the model, e.g. with a smaller learning rate for fine-tuning"""
+        from tensorflow import keras
+        
         self.model.compile(
-            optimizer=keras.optimizers.Adam(learning_rate=config.LEARNING_RATE),
+            optimizer=keras.optimizers.Adam(learning_rate=learning_rate or config.LEARNING_RATE),
             loss='binary_crossentropy',
             metrics=[
                 'accuracy',
@@ -61,9 +99,13 @@ class PurchasePredictionModel:
                 keras.metrics.Recall(name='recall')
             ]
         )
-        
-        logger.info("Purchase prediction model built")
-        return self.model
+    
+    def accepts_input(self, sequences: np.ndarray, features: np.ndarray) -> bool:
+        """Check whether data matches the built model's input shapes"""
+        if self.model is None:
+            return False
+        sequence_shape, feature_shape = self.model.input_shape
+        return tuple(sequence_shape[1:]) == sequences.shape[1:] and tuple(feature_shape[1:]) == features.shape[1:]
     
     def train(self, 
               sequences: np.ndarray, 
@@ -71,12 +113,16 @@ class PurchasePredictionModel:
               labels: np.ndarray,
               validation_split: float = 0.2,
               epochs: int = None,
-              batch_size: int = None):
+              batch_size: int = None,
+              extra_callbacks: Optional[list] = None):
         """Train the model"""
+        from tensorflow import keras
+        
         if self.model is None:
             num_event_types = sequences.shape[2] if len(sequences.shape) > 2 else 10
             feature_dim = features.shape[1] if len(features.shape) > 1 else 50
             self.build_model(num_event_types, feature_dim)
+        self.network = self.backend = self.variant = None  # Built from the old weights
         
         epochs = epochs or config.EPOCHS
         batch_size = batch_size or config.BATCH_SIZE
@@ -95,10 +141,12 @@ class PurchasePredictionModel:
                 min_lr=1e-7
             )
         ]
+        callbacks.extend(extra_callbacks or [])
         
         # Train
-        history = self.model.fit(
-            [sequences, features],
+        history = fit_arrays(
+            self.model,
+            {'sequence_input': sequences, 'feature_input': features},
             labels,
             validation_split=validation_split,
             epochs=epochs,
@@ -111,9 +159,17 @@ class PurchasePredictionModel:
         logger.info("Purchase prediction model trained")
         return history
     
+    def evaluate(self, sequences: np.ndarray, features: np.ndarray, labels: np.ndarray) -> Dict[str, float]:
+        """Evaluate loss and metrics on held-out data"""
+        if self.model is None:
+            raise Exception("Model not built or loaded")
+        
+        results = self.model.evaluate([sequences, features], labels, verbose=0, return_dict=True)
+        return {k: float(v) for k, v in results.items()}
+    
     def predict(self, sequences: np.ndarray, features: np.ndarray) -> np.ndarray:
         """Predict purchase probability"""
-        if self.model is None:
+        if not self.has_model():
             raise Exception("Model not built or loaded")
         
         # Ensure correct shape
@@ -122,8 +178,35 @@ class PurchasePredictionModel:
         if len(features.shape) == 1:
             features = np.expand_dims(features, axis=0)
         
-        predictions = self.model.predict([sequences, features], verbose=0)
-        return predictions.flatten()
+        predictions = self.inference_backend().predict([sequences, features])
+        return np.asarray(predictions).flatten()
+    
+    def _network(self) -> PurchaseNetwork:
+        if self.network is None:
+            if self.model is None:
+                raise Exception("Model not built or loaded")
+            self.network = PurchaseNetwork.from_keras(self.model)
+        return self.network
+    
+    def inference_backend(self) -> InferenceBackend:
+        """Configured backend for full-window predictions (the quantized variant if loaded)"""
+        if self.variant is not None:
+            return self.variant
+        if self.backend is None:
+            self.backend = load_backend('purchase', default_backend(), keras_model=lambda: self.model,
+                                        network=self._network)
+        return self.backend
+    
+    def warmup(self) -> float:
+        """Run the predict backend on every batch bucket; returns seconds"""
+        if self.network is not None:
+            length = self.network.window_length or self.sequence_length
+            event_types = self.network.lstm_layers[0].kernel.shape[0]
+            feature_dim = self.network.feature_branch.input_dim
+        else:
+            (_, length, event_types), (_, feature_dim) = self.model.input_shape
+        return warm_up(self.inference_backend(), lambda n: [np.zeros((n, length, event_types), dtype=np.float32),
+                                                            np.zeros((n, feature_dim), dtype=np.float32)])
     
     def predict_churn_risk(self, sequences: np.ndarray, features: np.ndarray) -> np.ndarray:
         """Predict churn risk (inverse of engagement)"""
@@ -146,15 +229,29 @@ class PurchasePredictionModel:
             raise Exception("No model to save")
         
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        self.model.save(filepath)
+        save_keras_model(self.model, filepath)
+        remove_variants(filepath)
         logger.info(f"Model saved to {filepath}")
     
     def load(self, filepath: str):
-        """Load model from file"""
-        if not os.path.exists(filepath):
-            raise FileNotFoundError(f"Model file not found: {filepath}")
+        """Load model from file
         
-        self.model = keras.models.load_model(filepath)
+        With a weight file next to the .h5 and a predict backend that does not need Keras, only the NumPy network is built (no TensorFlow import); the
+        Keras model is loaded when something accesses it.
+        """
+        mmw_path = weight_file_path(filepath)
+        self.backend = None
+        self.variant = load_variant(filepath, PurchaseNetwork.from_weight_file, ['sequence_input', 'feature_input'])
+        keras_free = self.variant is not None or not needs_keras('purchase', default_backend())
+        if os.path.exists(mmw_path) and keras_free:
+            self.model = None
+            self._deferred_path = filepath
+            self.network = PurchaseNetwork.from_weight_file(mmw_path)
+        else:
+            self.model, needs_compile = load_keras_model(filepath)
+            if needs_compile:
+                self.compile_model()
+            self.network = None
         self.is_trained = True
         logger.info(f"Model loaded from {filepath}")
 
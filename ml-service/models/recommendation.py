@@ -1,11 +1,15 @@
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers
 from typing import List, Dict, Any, Optional, Tuple
 import logging
 import os
 from config import config
+from data_pipeline import fit_arrays
+from models.negative_sampling import NegativeSampler
+from utils.id_map import IdMap
+from utils.weight_file import save_keras_model, load_keras_model, weight_file_path
+from utils.ncf_runtime import RecommendationNetwork
+from models.backends import InferenceBackend, load_backend, default_backend, needs_keras, warm_up
+from models.variants import load_variant, remove_variants
 
 logger = logging.getLogger(__name__)
 
@@ -16,20 +20,51 @@ class RecommendationModel:
         self.num_users = num_users
         self.num_products = num_products
         self.embedding_dim = embedding_dim
+        self._deferred_path = None  # .h5 loaded on first access of .model (see load)
         self.model = None
+        self.network = None  # NumPy copy for the numpy/torchscript backends
+        self.backend = None  # Inference backend (models/backends.py), built on first use
+        self.variant = None  # Quantized variant backend served instead (models/variants.py)
         self.is_trained = False
         self.user_encoder = None
         self.product_encoder = None
+        # Raw id -> embedding row maps; ids they don't know resolve to the
+        # extra last row of each table (cold-start row)
+        self.user_map: Optional[IdMap] = None
+        self.product_map: Optional[IdMap] = None
+    
+    @property
+    def model(self):
+        """Keras model; loaded on first access when load() only mapped the weight file"""
+        if self._model is None and self._deferred_path is not None:
+            path, self._deferred_path = self._deferred_path, None
+            self._model, needs_compile = load_keras_model(path)
+            if needs_compile:
+                self.compile_model()
+        return self._model
+    
+    @model.setter
+    def model(self, value):
+        self._model = value
+        self._deferred_path = None
+    
+    def has_model(self) -> bool:
+        """Model available for inference (without loading a deferred Keras model)"""
+        return self.variant is not None or self.network is not None or self.model is not None
     
     def build_model(self):
         """Build Neural Collaborative Filtering model"""
+        from tensorflow import keras
+        from tensorflow.keras import layers
+        
         # User embedding
         user_input = layers.Input(shape=(1,), name='user_input')
         user_embedding = layers.Embedding(
             self.num_users + 1,
             self.embedding_dim,
             embeddings_initializer='he_normal',
-            embeddings_regularizer=keras.regularizers.l2(1e-6)
+            embeddings_regularizer=keras.regularizers.l2(1e-6),
+            name='user_embedding'
         )(user_input)
         user_vec = layers.Flatten()(user_embedding)
         
@@ -39,7 +74,8 @@ class RecommendationModel:
             self.num_products + 1,
             self.embedding_dim,
             embeddings_initializer='he_normal',
-            embeddings_regularizer=keras.regularizers.l2(1e-6)
+            embeddings_regularizer=keras.regularizers.l2(1e-6),
+            name='product_embedding'
         )(product_input)
         product_vec = layers.Flatten()(product_embedding)
         
@@ -62,10 +98,20 @@ class RecommendationModel:
             outputs=output,
             name='neural_collaborative_filtering'
         )
+        self.network = self.backend = self.variant = None
         
         # Compile model
+        self.compile_model()
+        
+        logger.info("Recommendation model built")
+        return self.model
+    
+    def compile_model(self, learning_rate: float = None):
+        """(Re)compile the model, e.g. with a smaller learning rate for fine-tuning"""
+        from tensorflow import keras
+        
         self.model.compile(
-            optimizer=keras.optimizers.Adam(learning_rate=config.LEARNING_RATE),
+            optimizer=keras.optimizers.Adam(learning_rate=learning_rate or config.LEARNING_RATE),
             loss='binary_crossentropy',
             metrics=[
                 'accuracy',
@@ -73,9 +119,41 @@ class RecommendationModel:
                 keras.metrics.Recall(name='recall')
             ]
         )
+    
+    def grow_embeddings(self, num_users: int, num_products: int):
+        """Enlarge the embedding tables for new users/products, keeping trained rows"""
+        from tensorflow.keras import layers
         
-        logger.info("Recommendation model built")
-        return self.model
+        if self.model is None:
+            raise Exception("Model not built or loaded")
+        if num_users < self.num_users or num_products < self.num_products:
+            raise ValueError("Embedding tables can only grow")
+        
+        old_model = self.model
+        old_sizes = (self.num_users, self.num_products)
+        self.num_users = num_users
+        self.num_products = num_products
+        self.build_model()
+        
+        # Same architecture, so layers line up one to one
+        embedding_sizes = {
+            'user_embedding': (old_sizes[0], num_users),
+            'product_embedding': (old_sizes[1], num_products)
+        }
+        for old_layer, new_layer in zip(old_model.layers, self.model.layers):
+            old_weights = old_layer.get_weights()
+            if not old_weights:
+                continue
+            if isinstance(new_layer, layers.Embedding):
+                old_n, new_n = embedding_sizes[new_layer.name]
+                table = new_layer.get_weights()[0]
+                table[:old_n] = old_weights[0][:old_n]
+                table[new_n] = old_weights[0][old_n]  # Cold-start row moves to the end
+                new_layer.set_weights([table])
+            else:
+                new_layer.set_weights(old_weights)
+        
+        logger.info(f"Recommendation embeddings grown: users {old_sizes[0]} -> {num_users}, products {old_sizes[1]} -> {num_products}")
     
     def train(self,
               user_ids: np.ndarray,
@@ -83,10 +161,19 @@ class RecommendationModel:
               ratings: np.ndarray,
               validation_split: float = 0.2,
               epochs: int = None,
-              batch_size: int = None):
-        """Train the recommendation model"""
+              batch_size: int = None,
+              extra_callbacks: Optional[list] = None,
+              negative_sampler: Optional[NegativeSampler] = None):
+        """Train the recommendation model
+        
+        With a negative_sampler every batch of positives is extended with freshly sampled
+        negatives (label 0) each epoch; batch_size counts positives.
+        """
+        from tensorflow import keras
+        
         if self.model is None:
             self.build_model()
+        self.network = self.backend = self.variant = None  # Weights change: re-exported on the next inference
         
         epochs = epochs or config.EPOCHS
         batch_size = batch_size or config.BATCH_SIZE
@@ -105,15 +192,18 @@ class RecommendationModel:
                 min_lr=1e-7
             )
         ]
+        callbacks.extend(extra_callbacks or [])
         
         # Train
-        history = self.model.fit(
-            [user_ids, product_ids],
+        history = fit_arrays(
+            self.model,
+            {'user_input': user_ids, 'product_input': product_ids},
             ratings,
             validation_split=validation_split,
             epochs=epochs,
             batch_size=batch_size,
             callbacks=callbacks,
+            batch_fn=negative_sampler.augment if negative_sampler is not None else None,
             verbose=1
         )
         
@@ -121,17 +211,48 @@ class RecommendationModel:
         logger.info("Recommendation model trained")
         return history
     
+    def evaluate(self, user_ids: np.ndarray, product_ids: np.ndarray, ratings: np.ndarray,
+                 negative_sampler: Optional[NegativeSampler] = None) -> Dict[str, float]:
+        """Evaluate loss and metrics on held-out interactions (plus seeded negatives if given)"""
+        if self.model is None:
+            raise Exception("Model not built or loaded")
+        
+        if negative_sampler is not None:
+            # Fixed seed so two models are compared on the same negatives
+            user_ids, product_ids, ratings = negative_sampler.augment(
+                [np.asarray(user_ids), np.asarray(product_ids), np.asarray(ratings)],
+                rng=np.random.default_rng(0)
+            )
+        
+        results = self.model.evaluate([user_ids, product_ids], ratings, verbose=0, return_dict=True)
+        return {k: float(v) for k, v in results.items()}
+    
     def predict(self, user_id: int, product_ids: np.ndarray) -> np.ndarray:
         """Predict ratings for user-product pairs"""
-        if self.model is None:
+        if not self.has_model():
             raise Exception("Model not built or loaded")
         
         user_ids = np.full(len(product_ids), user_id)
-        predictions = self.model.predict(
-            [user_ids, product_ids],
-            verbose=0
-        )
-        return predictions.flatten()
+        predictions = self.inference_backend().predict([user_ids, np.asarray(product_ids)])
+        return np.asarray(predictions).flatten()
+    
+    def _network(self) -> RecommendationNetwork:
+        if self.network is None:
+            self.network = RecommendationNetwork.from_keras(self.model)
+        return self.network
+    
+    def inference_backend(self) -> InferenceBackend:
+        """Configured backend for scoring user-product pairs (the quantized variant if loaded)"""
+        if self.variant is not None:
+            return self.variant
+        if self.backend is None:
+            self.backend = load_backend('recommendation', default_backend(), keras_model=lambda: self.model,
+                                        network=self._network)
+        return self.backend
+    
+    def warmup(self) -> float:
+        """Run the inference backend on every batch bucket; returns seconds"""
+        return warm_up(self.inference_backend(), lambda n: [np.zeros(n, dtype=np.int64), np.zeros(n, dtype=np.int64)])
     
     def recommend(self, user_id: int, product_ids: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
         """Get top-k recommendations for user"""
@@ -144,6 +265,36 @@ class RecommendationModel:
         
         return top_products, top_scores
     
+    def user_row(self, raw_user_id) -> int:
+        """Embedding row for a raw user id (cold-start row for unknown users)"""
+        if self.user_map is None:
+            return self.num_users
+        return self.user_map.lookup_one(raw_user_id)
+    
+    def candidate_rows(self, candidate_product_ids: Optional[np.ndarray] = None) -> np.ndarray:
+        """Embedding rows of the known candidates; the trained catalog by default"""
+        if self.product_map is None:
+            raise Exception("Model has no product id map")
+        
+        if candidate_product_ids is None:
+            return np.arange(self.num_products, dtype=np.int32)
+        candidate_rows = self.product_map.lookup(candidate_product_ids)
+        return candidate_rows[candidate_rows != self.product_map.unknown_row]
+    
+    def top_products(self, candidate_rows: np.ndarray, scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k raw product ids and scores from the scores of candidate_rows"""
+        top_indices = np.argsort(scores)[::-1][:top_k]
+        return self.product_map.row_ids[candidate_rows[top_indices]], scores[top_indices]
+    
+    def recommend_for_user(self, raw_user_id, candidate_product_ids: Optional[np.ndarray] = None,
+                           top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k raw product ids for a raw user id; candidates default to the trained catalog"""
+        candidate_rows = self.candidate_rows(candidate_product_ids)
+        if len(candidate_rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        
+        return self.top_products(candidate_rows, self.predict(self.user_row(raw_user_id), candidate_rows), top_k)
+    
     def recommend_hybrid(self,
                         user_id: int,
                         product_ids: np.ndarray,
@@ -179,15 +330,54 @@ class RecommendationModel:
             raise Exception("No model to save")
         
         os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        self.model.save(filepath)
+        save_keras_model(self.model, filepath)
+        remove_variants(filepath)
+        
+        # Save id maps so serving and later versions use the training-time rows
+        if self.user_map is not None and self.product_map is not None:
+            self.user_map.save(filepath.replace('.h5', '_user_map'))
+            self.product_map.save(filepath.replace('.h5', '_product_map'))
         logger.info(f"Model saved to {filepath}")
     
     def load(self, filepath: str):
-        """Load model from file"""
-        if not os.path.exists(filepath):
-            raise FileNotFoundError(f"Model file not found: {filepath}")
+        """Load model from file
+        
+        With a weight file next to the .h5 and a backend that does not need Keras (or an
+        accepted quantized variant), only the NumPy network is built (no TensorFlow import);
+        the Keras model is loaded on first access.
+        """
+        mmw_path = weight_file_path(filepath)
+        self.backend = None
+        self.variant = load_variant(filepath, RecommendationNetwork.from_weight_file, ['user_input', 'product_input'])
+        if os.path.exists(mmw_path) and (self.variant is not None or not needs_keras('recommendation', default_backend())):
+            self.model = None
+            self._deferred_path = filepath
+            self.network = RecommendationNetwork.from_weight_file(mmw_path)
+            # Table sizes come from the saved model, not the constructor defaults
+            self.num_users = self.network.num_users
+            self.num_products = self.network.num_products
+        else:
+            from tensorflow.keras import layers
+            
+            self.model, needs_compile = load_keras_model(filepath)
+            if needs_compile:
+                self.compile_model()
+            self.network = None
+            
+            # Table sizes come from the saved model, not the constructor defaults
+            embedding_layers = [l for l in self.model.layers if isinstance(l, layers.Embedding)]
+            if len(embedding_layers) == 2:
+                self.num_users = embedding_layers[0].input_dim - 1
+                self.num_products = embedding_layers[1].input_dim - 1
+        
+        user_map_path = filepath.replace('.h5', '_user_map')
+        product_map_path = filepath.replace('.h5', '_product_map')
+        if IdMap.exists(user_map_path) and IdMap.exists(product_map_path):
+            self.user_map = IdMap.load(user_map_path)
+            self.product_map = IdMap.load(product_map_path)
+        else:
+            logger.warning(f"No id maps next to {filepath}, every user will get the cold-start row")
         
-        self.model = keras.models.load_model(filepath)
         self.is_trained = True
         logger.info(f"Model loaded from {filepath}")
 
@@ -1,12 +1,14 @@
 import numpy as np
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers
 from sklearn.cluster import KMeans, DBSCAN
 from typing import List, Dict, Any, Optional, Tuple
 import logging
 import os
 from config import config
+from data_pipeline import fit_arrays, min_max_stats
+from utils.weight_file import save_keras_model, load_keras_model, weight_file_path
+from utils.dense_runtime import DenseNetwork
+from models.backends import InferenceBackend, load_backend, default_backend, needs_keras, warm_up
+from utils.threading_policy import n_jobs
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +20,15 @@ class SegmentationModel:
         self.embedding_dim = embedding_dim
         self.kmeans = None
         self.dbscan = None
+        self._deferred_path = None  # .h5 loaded on first access of .autoencoder (see load)
         self.autoencoder = None
+        self.encoder_runtime = None  # NumPy copy of the encoder half (numpy/torchscript backends)
+        self.backend = None  # Inference backend for the encoder (models/backends.py), built on first use
         self.is_trained = False
+        # Training-time calibration (saved next to the model), so a user gets the same segment alone or in a batch
+        self.feature_min = None  # Column range of the encoder input
+        self.feature_max = None
+        self.distance_scale = None  # Largest centroid distance of a training row (confidence 0)
         self.base_segment_names = [
             'VIP Müşteriler',
             'Aktif Alıcılar',
@@ -29,8 +38,30 @@ class SegmentationModel:
         ]
         self.segment_names = self.base_segment_names[:num_segments]
     
+    @property
+    def autoencoder(self):
+        """Keras autoencoder; loaded on first access when load() only mapped the weight file"""
+        if self._autoencoder is None and self._deferred_path is not None:
+            path, self._deferred_path = self._deferred_path, None
+            self._autoencoder, needs_compile = load_keras_model(path)
+            if needs_compile:
+                self.compile_autoencoder()
+        return self._autoencoder
+    
+    @autoencoder.setter
+    def autoencoder(self, value):
+        self._autoencoder = value
+        self._deferred_path = None
+    
+    def has_autoencoder(self) -> bool:
+        """Autoencoder available for inference (without loading a deferred Keras model)"""
+        return self.encoder_runtime is not None or self.autoencoder is not None
+    
     def build_autoencoder(self, input_dim: int = 50):
         """Build autoencoder for feature extraction"""
+        from tensorflow import keras
+        from tensorflow.keras import layers
+        
         # Input
         input_layer = layers.Input(shape=(input_dim,), name='input')
         
@@ -46,61 +77,112 @@ class SegmentationModel:
         
         # Autoencoder
         self.autoencoder = keras.Model(input_layer, decoded, name='segmentation_autoencoder')
+        self.encoder_runtime = None
+        self.backend = None
         
         # Compile
+        self.compile_autoencoder()
+        
+        logger.info("Segmentation autoencoder built")
+        return self.autoencoder
+    
+    def compile_autoencoder(self, learning_rate: float = None):
+        """(Re)compile the autoencoder, e.g. with a smaller learning rate for fine-tuning"""
+        from tensorflow import keras
+        
         self.autoencoder.compile(
-            optimizer=keras.optimizers.Adam(learning_rate=config.LEARNING_RATE),
+            optimizer=keras.optimizers.Adam(learning_rate=learning_rate or config.LEARNING_RATE),
             loss='mse'
         )
+    
+    def evaluate_autoencoder(self, data: np.ndarray) -> float:
+        """Mean reconstruction loss on held-out data"""
+        if self.autoencoder is None:
+            raise Exception("Autoencoder not trained")
         
-        logger.info("Segmentation autoencoder built")
-        return self.autoencoder
+        data_normalized = (data - np.min(data, axis=0)) / (np.max(data, axis=0) - np.min(data, axis=0) + 1e-8)
+        return float(self.autoencoder.evaluate(data_normalized, data_normalized, verbose=0))
     
     def train_autoencoder(self,
                          data: np.ndarray,
                          epochs: int = None,
-                         batch_size: int = None):
+                         batch_size: int = None,
+                         extra_callbacks: Optional[list] = None):
         """Train autoencoder for feature extraction"""
         if self.autoencoder is None:
             self.build_autoencoder(data.shape[1])
+        self.encoder_runtime = None  # Weights change: re-exported on the next inference
+        self.backend = None
         
         epochs = epochs or 30
         batch_size = batch_size or config.BATCH_SIZE
         
-        # Normalize
-        data_normalized = (data - np.min(data, axis=0)) / (np.max(data, axis=0) - np.min(data, axis=0) + 1e-8)
-        
-        # Train
-        self.autoencoder.fit(
-            data_normalized,
-            data_normalized,
+        # Train (normalized per batch in the input pipeline)
+        self.feature_min, self.feature_max = min_max_stats(data)
+        fit_arrays(
+            self.autoencoder,
+            {'input': data},
             epochs=epochs,
             batch_size=batch_size,
+            callbacks=extra_callbacks or [],
+            transforms={'input': self.normalize},
             verbose=0
         )
         
         logger.info("Autoencoder trained")
     
+    def normalize(self, data: np.ndarray) -> np.ndarray:
+        """Min-max with the training-time column range (the encoder input)
+        
+        Models saved without it fall back to the range of the rows encoded together.
+        """
+        if self.feature_min is not None:
+            return (data - self.feature_min) / (self.feature_max - self.feature_min + 1e-8)
+        return (data - np.min(data, axis=0)) / (np.max(data, axis=0) - np.min(data, axis=0) + 1e-8)
+    
+    def is_calibrated(self) -> bool:
+        """Segments and confidence of a row do not depend on the other rows scored with it"""
+        return self.distance_scale is not None and (self.feature_min is not None or not self.has_autoencoder())
+    
     def extract_features(self, data: np.ndarray) -> np.ndarray:
         """Extract features using autoencoder encoder"""
-        if self.autoencoder is None:
+        if not self.has_autoencoder():
             return data  # Return original if autoencoder not trained
         
-        # Normalize
-        data_normalized = (data - np.min(data, axis=0)) / (np.max(data, axis=0) - np.min(data, axis=0) + 1e-8)
+        # Extract features
+        features = self.inference_backend().predict([self.normalize(data)])
+        return features
+    
+    def _encoder(self):
+        """Keras encoder half of the autoencoder"""
+        from tensorflow import keras
         
-        # Get encoder
-        encoder = keras.Model(
+        return keras.Model(
             self.autoencoder.input,
             self.autoencoder.get_layer('encoded').output
         )
-        
-        # Extract features
-        features = encoder.predict(data_normalized, verbose=0)
-        return features
     
-    def train_kmeans(self, data: np.ndarray, use_autoencoder: bool = True):
-        """Train K-means clustering"""
+    def _network(self) -> DenseNetwork:
+        if self.encoder_runtime is None:
+            self.encoder_runtime = DenseNetwork.from_keras(self.autoencoder, output_layer='encoded')
+        return self.encoder_runtime
+    
+    def inference_backend(self) -> InferenceBackend:
+        """Configured backend for the encoder (numpy by default when NUMPY_INFERENCE is on)"""
+        if self.backend is None:
+            self.backend = load_backend('segmentation', default_backend(config.NUMPY_INFERENCE),
+                                        keras_model=self._encoder, network=self._network)
+        return self.backend
+    
+    def warmup(self) -> float:
+        """Run the encoder backend on every batch bucket; returns seconds"""
+        if not self.has_autoencoder():
+            return 0.0
+        dim = self.encoder_runtime.input_dim if self.encoder_runtime is not None else self.autoencoder.input_shape[1]
+        return warm_up(self.inference_backend(), lambda n: [np.zeros((n, dim), dtype=np.float32)])
+    
+    def train_kmeans(self, data: np.ndarray, use_autoencoder: bool = True, init_centers: Optional[np.ndarray] = None):
+        """Train K-means clustering (optionally warm-started from previous centroids)"""
         # Extract features if using autoencoder
         if use_autoencoder and self.autoencoder is not None:
             features = self.extract_features(data)
@@ -120,13 +202,22 @@ class SegmentationModel:
             logger.warning(f"Reducing clusters from {self.num_segments} to {n_clusters} (only {n_samples} samples available)")
         
         # Train K-means
-        self.kmeans = KMeans(
-            n_clusters=n_clusters,
-            random_state=42,
-            n_init=10,
-            max_iter=300
-        )
+        if init_centers is not None and len(init_centers) == n_clusters and init_centers.shape[1] == features.shape[1]:
+            self.kmeans = KMeans(
+                n_clusters=n_clusters,
+                init=init_centers,
+                n_init=1,
+                max_iter=300
+            )
+        else:
+            self.kmeans = KMeans(
+                n_clusters=n_clusters,
+                random_state=42,
+                n_init=10,
+                max_iter=300
+            )
         self.kmeans.fit(features)
+        self.distance_scale = float(np.max(np.min(self.kmeans.transform(features), axis=1)))
         
         # Update num_segments to match actual clusters
         self.num_segments = n_clusters
@@ -149,19 +240,20 @@ class SegmentationModel:
             features = data
         
         # Train DBSCAN
-        self.dbscan = DBSCAN(eps=eps, min_samples=min_samples)
+        self.dbscan = DBSCAN(eps=eps, min_samples=min_samples, n_jobs=n_jobs('training'))
         self.dbscan.fit(features)
         
         logger.info("DBSCAN clustering trained")
     
-    def predict_kmeans(self, data: np.ndarray, use_autoencoder: bool = True) -> Tuple[np.ndarray, np.ndarray]:
-        """Predict segments using K-means"""
+    def predict_kmeans(self, data: np.ndarray, use_autoencoder: bool = True,
+                       encoded: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Predict segments using K-means (encoded: encoder output for data computed elsewhere)"""
         if self.kmeans is None:
             raise Exception("K-means not trained")
         
         # Extract features
-        if use_autoencoder and self.autoencoder is not None:
-            features = self.extract_features(data)
+        if use_autoencoder and self.has_autoencoder():
+            features = encoded if encoded is not None else self.extract_features(data)
         else:
             features = data
         
@@ -171,7 +263,10 @@ class SegmentationModel:
         # Calculate distances to centroids (confidence)
         distances = self.kmeans.transform(features)
         min_distances = np.min(distances, axis=1)
-        max_distance = np.max(min_distances) if len(min_distances) > 0 else 1.0
+        if self.distance_scale is not None:
+            max_distance = self.distance_scale
+        else:
+            max_distance = np.max(min_distances) if len(min_distances) > 0 else 1.0
         confidence = 1 - (min_distances / (max_distance + 1e-8))
         confidence = np.clip(confidence, 0, 1)
         
@@ -183,7 +278,7 @@ class SegmentationModel:
             raise Exception("DBSCAN not trained")
         
         # Extract features
-        if use_autoencoder and self.autoencoder is not None:
+        if use_autoencoder and self.has_autoencoder():
             features = self.extract_features(data)
         else:
             features = data
@@ -237,7 +332,7 @@ class SegmentationModel:
         # Save autoencoder
         if self.autoencoder:
             ae_path = filepath.replace('.h5', '_autoencoder.h5')
-            self.autoencoder.save(ae_path)
+            save_keras_model(self.autoencoder, ae_path)
         
         # Save K-means
         if self.kmeans:
@@ -251,26 +346,56 @@ class SegmentationModel:
             db_path = filepath.replace('.h5', '_dbscan.joblib')
             joblib.dump(self.dbscan, db_path)
         
+        # Save calibration
+        calibration = {
+            'feature_min': self.feature_min,
+            'feature_max': self.feature_max,
+            'distance_scale': self.distance_scale
+        }
+        np.savez(filepath.replace('.h5', '_calibration.npz'),
+                 **{key: np.asarray(value) for key, value in calibration.items() if value is not None})
+        
         logger.info(f"Models saved to {filepath}")
     
     def load(self, filepath: str):
         """Load models from file"""
         import joblib
         
-        # Load autoencoder
+        # Load autoencoder (only its NumPy encoder when serving from a weight file without Keras)
         ae_path = filepath.replace('.h5', '_autoencoder.h5')
-        if os.path.exists(ae_path):
-            self.autoencoder = keras.models.load_model(ae_path)
-        
-        # Load K-means
+        mmw_path = weight_file_path(ae_path)
+        self.backend = None
+        if os.path.exists(mmw_path) and not needs_keras('segmentation', default_backend(config.NUMPY_INFERENCE)):
+            self.autoencoder = None
+            self._deferred_path = ae_path
+            self.encoder_runtime = DenseNetwork.from_weight_file(mmw_path, output_layer='encoded')
+        elif os.path.exists(ae_path) or os.path.exists(mmw_path):
+            self.autoencoder, needs_compile = load_keras_model(ae_path)
+            if needs_compile:
+                self.compile_autoencoder()
+            self.encoder_runtime = (DenseNetwork.from_weight_file(mmw_path, output_layer='encoded')
+                                    if os.path.exists(mmw_path) else None)
+        
+        # Load K-means (arrays memory-mapped, shared between workers)
         km_path = filepath.replace('.h5', '_kmeans.joblib')
         if os.path.exists(km_path):
-            self.kmeans = joblib.load(km_path)
+            self.kmeans = joblib.load(km_path, mmap_mode='r')
         
         # Load DBSCAN
         db_path = filepath.replace('.h5', '_dbscan.joblib')
         if os.path.exists(db_path):
-            self.dbscan = joblib.load(db_path)
+            self.dbscan = joblib.load(db_path, mmap_mode='r')
+            self.dbscan.set_params(n_jobs=n_jobs('serving'))
+        
+        # Load calibration (absent for models saved before it existed: batch-relative input and confidence)
+        calibration_path = filepath.replace('.h5', '_calibration.npz')
+        if os.path.exists(calibration_path):
+            with np.load(calibration_path) as calibration:
+                self.feature_min = calibration['feature_min'] if 'feature_min' in calibration else None
+                self.feature_max = calibration['feature_max'] if 'feature_max' in calibration else None
+                self.distance_scale = float(calibration['distance_scale']) if 'distance_scale' in calibration else None
+        else:
+            logger.warning(f"No calibration next to {filepath}, segments are relative to each batch")
         
         self.is_trained = True
         logger.info(f"Models loaded from {filepath}")
@@ -0,0 +1,46 @@
+from tensorflow import keras
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class JobProgressCallback(keras.callbacks.Callback):
+    """Report per-epoch progress to a training job and honour cancellation"""
+    
+    def __init__(self, job, model_name: str):
+        super().__init__()
+        self.job = job
+        self.model_name = model_name
+    
+    def on_train_begin(self, logs=None):
+        self.job.start_fit(self.model_name, self.params.get('epochs'))
+    
+    def on_train_batch_end(self, batch, logs=None):
+        # Stop within the current epoch instead of waiting for it to finish
+        if self.job.cancel_requested:
+            self.model.stop_training = True
+    
+    def on_epoch_end(self, epoch, logs=None):
+        self.job.report_epoch(epoch + 1, logs or {})
+        if self.job.cancel_requested:
+            logger.info(f"Cancellation requested, stopping {self.model_name} training after epoch {epoch + 1}")
+            self.model.stop_training = True
+
+class ThroughputCallback(keras.callbacks.Callback):
+    """Log training throughput (samples/s) for every epoch"""
+    
+    def __init__(self, num_samples: int):
+        super().__init__()
+        self.num_samples = num_samples
+        self._epoch_start = None
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_start = time.perf_counter()
+    
+    def on_epoch_end(self, epoch, logs=None):
+        elapsed = time.perf_counter() - self._epoch_start
+        samples_per_second = self.num_samples / elapsed if elapsed > 0 else 0.0
+        if logs is not None:
+            # Shared logs dict, so History and job progress pick it up too
+            logs['samples_per_second'] = samples_per_second
+        logger.info(f"⚡ Epoch {epoch + 1}: {samples_per_second:.0f} samples/s ({self.num_samples} samples, {elapsed:.1f}s)")
@@ -0,0 +1,150 @@
+"""Quantized model variants: built after training, kept only if they pass the accuracy gate
+
+Modes (QUANTIZATION, per model like MODEL_BACKENDS):
+  int8            embedding tables as int8 with per-row scales (NumPy runtime, <model>.int8.mmw)
+  float16         embedding tables as float16 (NumPy runtime, <model>.float16.mmw)
+  tflite_int8     TFLite dynamic range quantization (int8 weights, <model>.tflite_int8.tflite)
+  tflite_float16  TFLite float16 weights (<model>.tflite_float16.tflite)
+
+A variant is written next to the model only when its holdout AUC and accuracy stay within
+QUANTIZATION_TOLERANCE of the float model; load() then serves it (SERVE_QUANTIZED).
+"""
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+from config import config
+from models.backends import (InferenceBackend, NumpyBackend, TFLiteBackend, BucketedBackend, batch_buckets,
+                             parse_overrides, tflite_convert)
+from utils.quantization import quantize_weight_file
+from utils.weight_file import weight_file_path
+
+logger = logging.getLogger(__name__)
+
+TABLE_MODES = ('int8', 'float16')
+TFLITE_MODES = ('tflite_int8', 'tflite_float16')
+MODES = TABLE_MODES + TFLITE_MODES
+
+def quantization_mode(model_key: str) -> Optional[str]:
+    mode = parse_overrides(config.QUANTIZATION).get(model_key) or None
+    if mode is not None and mode not in MODES:
+        raise ValueError(f"Unknown quantization '{mode}' for {model_key} (one of {', '.join(MODES)})")
+    return mode
+
+def variant_path(h5_path: str, mode: str) -> str:
+    base = h5_path[:-3] if h5_path.endswith('.h5') else h5_path
+    return f"{base}.{mode}.{'mmw' if mode in TABLE_MODES else 'tflite'}"
+
+def remove_variants(h5_path: str):
+    """Drop variants of an earlier save so a stale one is never served with new weights"""
+    for mode in MODES:
+        path = variant_path(h5_path, mode)
+        if os.path.exists(path):
+            os.remove(path)
+
+def load_variant(h5_path: str, network_from_file: Callable[[str], Any],
+                 input_names: List[str]) -> Optional[InferenceBackend]:
+    """Backend for the accepted variant next to h5_path, if any and SERVE_QUANTIZED is on"""
+    if not config.SERVE_QUANTIZED:
+        return None
+    for mode in MODES:
+        path = variant_path(h5_path, mode)
+        if not os.path.exists(path):
+            continue
+        if mode in TFLITE_MODES:
+            if not config.USE_TENSORFLOW:
+                continue
+            with open(path, 'rb') as f:
+                backend = TFLiteBackend(content=f.read(), input_names=input_names)
+            if batch_buckets():
+                backend = BucketedBackend(backend, batch_buckets())
+        else:
+            backend = NumpyBackend(network_from_file(path))
+        backend.variant = mode
+        logger.info(f"🗜️ Serving quantized variant {mode} from {path}")
+        return backend
+    return None
+
+def auc(labels: np.ndarray, scores: np.ndarray) -> Optional[float]:
+    """ROC AUC (None with a single class)"""
+    from sklearn.metrics import roc_auc_score
+    
+    labels = np.asarray(labels).ravel()
+    if len(np.unique(labels)) < 2:
+        return None
+    return float(roc_auc_score(labels, np.asarray(scores).ravel()))
+
+def _metrics(labels: np.ndarray, scores: np.ndarray) -> Dict[str, Optional[float]]:
+    scores = np.asarray(scores).ravel()
+    return {"auc": auc(labels, scores), "accuracy": float(np.mean((scores >= 0.5) == (np.asarray(labels).ravel() >= 0.5)))}
+
+def _latency_ms(backend: InferenceBackend, inputs: List[np.ndarray], repeats: int = 10) -> float:
+    """Median ms per call on (up to) 512 holdout rows, after one warm-up call"""
+    batch = [x[:512] for x in inputs]
+    backend.predict(batch)
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        backend.predict(batch)
+        samples.append(1000 * (time.perf_counter() - start))
+    return float(np.median(samples))
+
+def build_variant(model_key: str, model, h5_path: str, inputs: List[np.ndarray], labels: np.ndarray,
+                  network_from_file: Callable[[str], Any], mode: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Quantize a saved model, compare it with the float model on the holdout and keep it if
+    the AUC/accuracy drop is within QUANTIZATION_TOLERANCE
+    
+    model is the trained model object (model.model is Keras, model.inference_backend() the
+    float backend). Returns the report stored in the version metadata, None when off.
+    """
+    mode = mode or quantization_mode(model_key)
+    if mode is None:
+        return None
+    remove_variants(h5_path)
+    path = variant_path(h5_path, mode)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    
+    if mode in TABLE_MODES:
+        source = weight_file_path(h5_path)
+        if not os.path.exists(source):
+            logger.warning(f"⚠️ {model_key}: {mode} quantization needs the .mmw weight file (MODEL_SAVE_MMW)")
+            return None
+        if quantize_weight_file(source, tmp_path, mode) == 0:
+            logger.warning(f"⚠️ {model_key}: no embedding tables to quantize, {mode} skipped")
+            return None
+        variant = NumpyBackend(network_from_file(tmp_path))
+        baseline_bytes = os.path.getsize(source)
+    else:
+        content = tflite_convert(model.model, 'int8' if mode == 'tflite_int8' else 'float16')
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        variant = TFLiteBackend(content=content, input_names=model.model.input_names)
+        baseline_bytes = len(tflite_convert(model.model))
+    
+    baseline = model.inference_backend()
+    before = _metrics(labels, baseline.predict(inputs))
+    after = _metrics(labels, variant.predict(inputs))
+    deltas = {k: (after[k] - before[k]) if after[k] is not None and before[k] is not None else None for k in before}
+    accepted = all(d is None or d >= -config.QUANTIZATION_TOLERANCE for d in deltas.values())
+    variant_bytes = os.path.getsize(tmp_path)
+    report = {
+        "mode": mode,
+        "accepted": accepted,
+        "tolerance": config.QUANTIZATION_TOLERANCE,
+        "holdout_samples": int(len(labels)),
+        "baseline": before,
+        "quantized": after,
+        "deltas": deltas,
+        "size_bytes": {"baseline": baseline_bytes, "quantized": variant_bytes},
+        "size_ratio": round(variant_bytes / max(baseline_bytes, 1), 4),
+        "latency_ms": {"baseline": _latency_ms(baseline, inputs), "quantized": _latency_ms(variant, inputs)}
+    }
+    
+    if accepted:
+        os.replace(tmp_path, path)
+        logger.info(f"🗜️ {model_key} {mode} variant accepted: size x{report['size_ratio']}, deltas {deltas}")
+    else:
+        os.remove(tmp_path)
+        logger.warning(f"⚠️ {model_key} {mode} variant rejected (tolerance {config.QUANTIZATION_TOLERANCE}): deltas {deltas}")
+    return report
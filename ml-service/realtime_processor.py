@@ -1,7 +1,10 @@
 import asyncio
 import json
 import logging
-from typing import List, Dict, Any, Optional
+import sys
+import time
+import zlib
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import numpy as np
 from config import config
@@ -12,14 +15,26 @@ from models.purchase_prediction import PurchasePredictionModel
 from models.recommendation import RecommendationModel
 from models.anomaly_detection import AnomalyDetectionModel
 from models.segmentation import SegmentationModel
+from models.batching import model_batcher
 from utils.model_loader import ModelLoader
+from utils.event_rollups import EventRollups
+from utils.worker_stats import WorkerStats
 
 logger = logging.getLogger(__name__)
 
 class RealtimeProcessor:
     """Real-time event processor for ML predictions"""
     
-    def __init__(self, redis_connector: RedisConnector, db_connector: DBConnector):
+    # attribute -> (registry name, model class)
+    MODELS = {
+        'purchase_model': ('purchase_model', PurchasePredictionModel),
+        'recommendation_model': ('recommendation_model', RecommendationModel),
+        'anomaly_model': ('anomaly_model', AnomalyDetectionModel),
+        'segmentation_model': ('segmentation_model', SegmentationModel)
+    }
+    
+    def __init__(self, redis_connector: RedisConnector, db_connector: DBConnector, shard: int = 0, shards: int = 1,
+                 preloaded: Optional[Dict[str, Tuple[str, Any]]] = None, worker_stats: Optional[WorkerStats] = None):
         self.redis = redis_connector
         self.db = db_connector
         self.data_processor = DataProcessor(
@@ -27,6 +42,12 @@ class RealtimeProcessor:
             embedding_dim=config.EMBEDDING_DIM
         )
         self.model_loader = ModelLoader()
+        self.rollups = EventRollups(
+            redis_connector,
+            backend=config.ROLLUP_BACKEND,
+            retention_days=config.ROLLUP_RETENTION_DAYS,
+            local_path=config.ROLLUP_LOCAL_PATH
+        ) if config.ROLLUPS_ENABLED else None
         
         # Models
         self.purchase_model = None
@@ -40,53 +61,116 @@ class RealtimeProcessor:
         self.recommendations_generated = 0
         self.anomalies_detected = 0
         self.segments_updated = 0
+        self.events_forwarded = 0  # Popped from the shared queue but owned by another worker
+        
+        # Multi-process serving (serving_workers.py): this worker owns the users of its shard
+        self.shard = shard
+        self.shards = shards
+        self.preloaded = preloaded or {}
+        self.worker_stats = worker_stats
+        if worker_stats is not None:
+            for name, value in worker_stats.restore(shard).items():
+                setattr(self, name, value)
         
         # State
         self.running = False
         self.event_buffer = []
         self.user_sequences = {}  # Store user event sequences
         self.user_features_cache = {}  # Cache user features
+        self.served_versions = {}  # registry name -> loaded version
+        self._registry_version = None
+        self._last_registry_check = time.monotonic()
         
+        # Readiness: registry name -> {"status": pending|loading|ready|missing|failed, ...}
+        self.model_status = {model_name: {"status": "pending"} for model_name, _ in self.MODELS.values()}
+        self.models_settled = asyncio.Event()  # Initial loading finished (every model ready, missing or failed)
+        self.models_available = asyncio.Event()  # At least one model served, or loading settled without any
+        self._load_task = None
+    
+    @property
+    def ready(self) -> bool:
+        return self.models_settled.is_set()
+    
     async def load_models(self):
-        """Load ML models"""
-        try:
-            # Load purchase prediction model
-            purchase_path = self.model_loader.get_model_path('purchase_model', 'latest')
-            if self.model_loader.model_exists('purchase_model', 'latest'):
-                self.purchase_model = PurchasePredictionModel()
-                self.purchase_model.load(purchase_path)
-                logger.info("Purchase prediction model loaded")
-            
-            # Load recommendation model
-            rec_path = self.model_loader.get_model_path('recommendation_model', 'latest')
-            if self.model_loader.model_exists('recommendation_model', 'latest'):
-                self.recommendation_model = RecommendationModel()
-                self.recommendation_model.load(rec_path)
-                logger.info("Recommendation model loaded")
-            
-            # Load anomaly detection model
-            anomaly_path = self.model_loader.get_model_path('anomaly_model', 'latest')
-            if self.model_loader.model_exists('anomaly_model', 'latest'):
-                self.anomaly_model = AnomalyDetectionModel()
-                self.anomaly_model.load(anomaly_path)
-                logger.info("Anomaly detection model loaded")
-            
-            # Load segmentation model
-            seg_path = self.model_loader.get_model_path('segmentation_model', 'latest')
-            if self.model_loader.model_exists('segmentation_model', 'latest'):
-                self.segmentation_model = SegmentationModel()
-                self.segmentation_model.load(seg_path)
-                logger.info("Segmentation model loaded")
-            
-        except Exception as e:
-            logger.error(f"Error loading models: {e}")
+        """Load the deployed (else latest) version of every model whose version changed
+        
+        Models load in parallel in the default executor (MODEL_LOAD_CONCURRENCY at a time), so
+        the event loop keeps serving; each one is served as soon as it is loaded and warmed up.
+        """
+        self._registry_version = self.model_loader.manifest_version()
+        semaphore = asyncio.Semaphore(max(1, config.MODEL_LOAD_CONCURRENCY))
+        await asyncio.gather(*(self._load_model(attr, model_name, model_class, semaphore)
+                               for attr, (model_name, model_class) in self.MODELS.items()))
+        self.models_settled.set()
+        self.models_available.set()
+    
+    async def _load_model(self, attr: str, model_name: str, model_class, semaphore: asyncio.Semaphore):
+        status = self.model_status[model_name]
+        async with semaphore:
+            if model_name not in self.served_versions:
+                status["status"] = "loading"
+            try:
+                loaded = await asyncio.get_running_loop().run_in_executor(
+                    None, self._load_blocking, attr, model_name, model_class)
+            except Exception as e:
+                logger.error(f"Error loading {model_name}: {e}")
+                if model_name not in self.served_versions:
+                    status.update(status="failed", error=str(e))
+                return
+        if loaded is None:
+            if model_name not in self.served_versions:
+                status["status"] = "missing"  # Not trained yet
+            return
+        version, model, seconds = loaded
+        setattr(self, attr, model)
+        self.served_versions[model_name] = version
+        status.update(status="ready", version=version, load_seconds=round(seconds, 2), error=None)
+        self.models_available.set()
+        logger.info(f"{model_name} v{version} loaded in {seconds:.2f}s")
+    
+    def _load_blocking(self, attr: str, model_name: str, model_class) -> Optional[Tuple[str, Any, float]]:
+        """Load (or take the preloaded copy of) and warm up one model in an executor thread"""
+        start = time.perf_counter()
+        if attr in self.preloaded:
+            version, model = self.preloaded.pop(attr)
+        else:
+            version = self.model_loader.resolve_version(model_name, "deployed")
+            if version is None or self.served_versions.get(model_name) == version:
+                return None
+            model = model_class()
+            model.load(self.model_loader.get_model_path(model_name, version))
+        if config.WARMUP_ON_LOAD:
+            try:
+                logger.info(f"🔥 {model_name} warmed up in {model.warmup():.2f}s")
+            except Exception as e:
+                logger.warning(f"⚠️ {model_name} warm-up failed: {e}")
+        return version, model, time.perf_counter() - start
+    
+    def _reload_models_if_changed(self):
+        """Pick up newly trained or deployed versions in the background (one stat call when nothing changed)"""
+        now = time.monotonic()
+        if now - self._last_registry_check < config.MODEL_RELOAD_INTERVAL:
+            return
+        self._last_registry_check = now
+        if self._load_task is not None and not self._load_task.done():
+            return
+        if self.model_loader.manifest_version() != self._registry_version:
+            self._load_task = asyncio.create_task(self.load_models())
     
     async def start(self):
-        """Start real-time processing"""
+        """Start real-time processing
+        
+        Returns right away: models load in the background and event consumption starts as
+        soon as the first one is served (see model_status / ready).
+        """
         self.running = True
+        self._load_task = asyncio.create_task(self.load_models())
         
-        # Load models
-        await self.load_models()
+        if self.rollups:
+            try:
+                self.rollups.load()
+            except Exception as e:
+                logger.error(f"Event rollup snapshot could not be loaded: {e}")
         
         # Start processing loop
         asyncio.create_task(self._process_events_loop())
@@ -98,25 +182,68 @@ class RealtimeProcessor:
         # Process remaining events
         if self.event_buffer:
             await self._process_batch(self.event_buffer)
+            self.event_buffer = []
+        if self.worker_stats is not None:
+            self.worker_stats.publish(self.shard, self.stats())
+        if self.rollups:
+            try:
+                self.rollups.save()
+            except Exception as e:
+                logger.error(f"Event rollup snapshot could not be saved: {e}")
         logger.info("Real-time processor stopped")
     
+    @property
+    def queues(self) -> List[str]:
+        """Own shard queue first (events routed here by other workers), then the shared queue"""
+        if self.shards == 1:
+            return [config.REDIS_QUEUE_NAME]
+        return [shard_queue(self.shard), config.REDIS_QUEUE_NAME]
+    
+    def shard_of(self, event: Dict[str, Any]) -> int:
+        """Worker owning the event's user (per-user sequences and LSTM state live there); anonymous events stay"""
+        user_id = event.get('userId')
+        if self.shards == 1 or not user_id:
+            return self.shard
+        return zlib.crc32(str(user_id).encode()) % self.shards
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            "events_processed": self.events_processed,
+            "events_forwarded": self.events_forwarded,
+            "predictions_made": self.predictions_made,
+            "recommendations_generated": self.recommendations_generated,
+            "anomalies_detected": self.anomalies_detected,
+            "segments_updated": self.segments_updated,
+            "buffer_size": len(self.event_buffer)
+        }
+    
     async def _process_events_loop(self):
         """Main event processing loop"""
-        logger.info(f"🔄 Event processing loop started, listening on queue: {config.REDIS_QUEUE_NAME}")
-        logger.info(f"   Models status - Purchase: {self.purchase_model is not None and self.purchase_model.is_trained if self.purchase_model else False}")
-        logger.info(f"   Models status - Anomaly: {self.anomaly_model is not None and self.anomaly_model.is_trained if self.anomaly_model else False}")
-        logger.info(f"   Models status - Recommendation: {self.recommendation_model is not None and self.recommendation_model.is_trained if self.recommendation_model else False}")
-        logger.info(f"   Models status - Segmentation: {self.segmentation_model is not None and self.segmentation_model.is_trained if self.segmentation_model else False}")
+        # Models still loading are skipped per batch until they are served
+        await self.models_available.wait()
+        logger.info(f"🔄 Event processing loop started, listening on queue(s): {', '.join(self.queues)}")
+        for model_name, status in self.model_status.items():
+            logger.info(f"   Models status - {model_name}: {status['status']}")
         
         while self.running:
             try:
+                if self.worker_stats is not None:
+                    self.worker_stats.publish(self.shard, self.stats())
+                self._reload_models_if_changed()
+                
                 # Get event from Redis queue
-                result = await self.redis.brpop(config.REDIS_QUEUE_NAME, timeout=config.PROCESSING_INTERVAL)
+                result = await self.redis.brpop(self.queues, timeout=config.PROCESSING_INTERVAL)
                 
                 if result:
                     queue_name, event_json = result
                     try:
                         event = json.loads(event_json)
+                        owner = self.shard_of(event)
+                        if owner != self.shard:
+                            # Same queue order as the producers (LPUSH, consumed with BRPOP)
+                            await self.redis.lpush(shard_queue(owner), event_json)
+                            self.events_forwarded += 1
+                            continue
                         logger.info(f"📥 Received event: {event.get('eventType')} from user {event.get('userId')}")
                         
                         # Add to buffer
@@ -147,11 +274,116 @@ class RealtimeProcessor:
                 logger.error(f"❌ Error in event processing loop: {e}", exc_info=True)
                 await asyncio.sleep(1)
     
+    async def _score_user(self, user_id: Any, user_event_list: List[Dict[str, Any]],
+                          predictions: List, anomalies: List, segments: List):
+        """Purchase, anomaly and segment results of one user's new events (model calls go through
+        the shared batchers, models/batching.model_batcher, off the event loop)"""
+        # Get user sequence and features
+        sequence = self.data_processor.create_user_sequence(self.user_sequences[user_id])
+        features = self.data_processor.create_user_features(self.user_sequences[user_id])
+        
+        # Purchase prediction
+        if self.purchase_model and self.purchase_model.is_trained:
+            try:
+                output = await model_batcher('purchase', self.purchase_model).predict(
+                    [np.expand_dims(sequence, axis=0), np.expand_dims(features, axis=0)]
+                )
+                purchase_prob = float(np.asarray(output).ravel()[0])
+                
+                predictions.append(purchase_prediction(user_id, user_event_list, purchase_prob))
+                self.predictions_made += 1
+            except Exception as e:
+                logger.error(f"Purchase prediction error: {e}")
+        
+        # Anomaly detection
+        if self.anomaly_model and self.anomaly_model.is_trained:
+            try:
+                user_features = np.expand_dims(features, axis=0)
+                reconstructed = await model_batcher('anomaly', self.anomaly_model).predict(
+                    [self.anomaly_model.normalize(user_features)]
+                )
+                anomaly_scores, is_anomaly, anomaly_types = self.anomaly_model.detect_anomaly_hybrid(
+                    user_features, reconstructed
+                )
+                
+                # Process each event in the batch
+                for i, event in enumerate(user_event_list):
+                    # Use the first anomaly result for the user's feature vector
+                    if i == 0 and is_anomaly[0] == 1:
+                        # If classify_anomaly_type is needed for more detail, use it
+                        # Otherwise use the type from detect_anomaly_hybrid
+                        anomaly_type = anomaly_types[0] if len(anomaly_types) > 0 else 'unusual_behavior'
+                        
+                        # For more detailed classification, use the method
+                        if anomaly_type == 'normal':
+                            anomaly_type = self.anomaly_model.classify_anomaly_type(
+                                event.get('eventData', {}),
+                                float(anomaly_scores[0])
+                            )
+                        
+                        anomalies.append({
+                            'eventId': event.get('id'),
+                            'userId': user_id,
+                            'tenantId': event.get('tenantId', 1),
+                            'anomalyScore': float(anomaly_scores[0]),
+                            'anomalyType': anomaly_type,
+                            'metadata': json.dumps(event.get('eventData', {}))
+                        })
+                        self.anomalies_detected += 1
+            except Exception as e:
+                logger.error(f"Anomaly detection error: {e}")
+        
+        # Segmentation (periodic, not for every event)
+        if len(self.user_sequences[user_id]) % 10 == 0:  # Every 10 events
+            if self.segmentation_model and self.segmentation_model.is_trained:
+                try:
+                    user_features = np.expand_dims(features, axis=0)
+                    encoded = None
+                    if self.segmentation_model.has_autoencoder():
+                        encoded = await model_batcher('segmentation', self.segmentation_model).predict(
+                            [self.segmentation_model.normalize(user_features)]
+                        )
+                    segment_ids, confidence = self.segmentation_model.predict_kmeans(user_features, encoded=encoded)
+                    
+                    segments.append({
+                        'userId': user_id,
+                        'tenantId': event_tenant(user_event_list),
+                        'segmentId': int(segment_ids[0]),
+                        'segmentName': self.segmentation_model.get_segment_name(int(segment_ids[0])),
+                        'confidence': float(confidence[0]),
+                        'metadata': json.dumps({})
+                    })
+                    self.segments_updated += 1
+                except Exception as e:
+                    logger.error(f"Segmentation error: {e}")
+    
+    async def _recommend(self, user_id: Any, top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k products for a user through the shared recommendation batcher
+        
+        Training-time id maps: unknown users get the cold-start row, candidates are the
+        products the model was trained on.
+        """
+        model = self.recommendation_model
+        candidates = model.candidate_rows().astype(np.int64)
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = await model_batcher('recommendation', model).predict(
+            [np.full(len(candidates), model.user_row(user_id), dtype=np.int64), candidates]
+        )
+        return model.top_products(candidates, np.asarray(scores).ravel(), top_k)
+    
     async def _process_batch(self, events: List[Dict[str, Any]]):
         """Process a batch of events"""
         if not events:
             return
         
+        # Dashboard counters see every event, including anonymous ones
+        if self.rollups:
+            try:
+                await self.rollups.record(events)
+            except Exception as e:
+                logger.error(f"❌ Error updating event rollups: {e}")
+        
         try:
             # Group events by user
             user_events = {}
@@ -162,7 +394,7 @@ class RealtimeProcessor:
                         user_events[user_id] = []
                     user_events[user_id].append(event)
             
-            # Process each user's events
+            # Process each user's events (model calls of all users share batches)
             predictions = []
             recommendations = []
             anomalies = []
@@ -176,102 +408,30 @@ class RealtimeProcessor:
                 self.user_sequences[user_id].extend(user_event_list)
                 # Keep only last N events
                 self.user_sequences[user_id] = self.user_sequences[user_id][-config.SEQUENCE_LENGTH * 2:]
-                
-                # Get user sequence and features
-                sequence = self.data_processor.create_user_sequence(self.user_sequences[user_id])
-                features = self.data_processor.create_user_features(self.user_sequences[user_id])
-                
-                # Purchase prediction
-                if self.purchase_model and self.purchase_model.is_trained:
-                    try:
-                        purchase_prob = self.purchase_model.predict(
-                            np.expand_dims(sequence, axis=0),
-                            np.expand_dims(features, axis=0)
-                        )[0]
-                        
-                        predictions.append({
-                            'userId': user_id,
-                            'tenantId': 1,  # TODO: Get from event
-                            'predictionType': 'purchase',
-                            'probability': float(purchase_prob),
-                            'metadata': json.dumps({'eventCount': len(user_event_list)})
-                        })
-                        self.predictions_made += 1
-                    except Exception as e:
-                        logger.error(f"Purchase prediction error: {e}")
-                
-                # Anomaly detection
-                if self.anomaly_model and self.anomaly_model.is_trained:
-                    try:
-                        anomaly_scores, is_anomaly, anomaly_types = self.anomaly_model.detect_anomaly_hybrid(
-                            np.expand_dims(features, axis=0)
-                        )
-                        
-                        # Process each event in the batch
-                        for i, event in enumerate(user_event_list):
-                            # Use the first anomaly result for the user's feature vector
-                            if i == 0 and is_anomaly[0] == 1:
-                                # If classify_anomaly_type is needed for more detail, use it
-                                # Otherwise use the type from detect_anomaly_hybrid
-                                anomaly_type = anomaly_types[0] if len(anomaly_types) > 0 else 'unusual_behavior'
-                                
-                                # For more detailed classification, use the method
-                                if anomaly_type == 'normal':
-                                    anomaly_type = self.anomaly_model.classify_anomaly_type(
-                                        event.get('eventData', {}),
-                                        float(anomaly_scores[0])
-                                    )
-                                
-                                anomalies.append({
-                                    'eventId': event.get('id'),
-                                    'userId': user_id,
-                                    'tenantId': 1,
-                                    'anomalyScore': float(anomaly_scores[0]),
-                                    'anomalyType': anomaly_type,
-                                    'metadata': json.dumps(event.get('eventData', {}))
-                                })
-                                self.anomalies_detected += 1
-                    except Exception as e:
-                        logger.error(f"Anomaly detection error: {e}")
-                
-                # Segmentation (periodic, not for every event)
-                if len(self.user_sequences[user_id]) % 10 == 0:  # Every 10 events
-                    if self.segmentation_model and self.segmentation_model.is_trained:
-                        try:
-                            segment_ids, confidence = self.segmentation_model.predict_kmeans(
-                                np.expand_dims(features, axis=0)
-                            )
-                            
-                            segments.append({
-                                'userId': user_id,
-                                'tenantId': 1,
-                                'segmentId': int(segment_ids[0]),
-                                'segmentName': self.segmentation_model.get_segment_name(int(segment_ids[0])),
-                                'confidence': float(confidence[0]),
-                                'metadata': json.dumps({})
-                            })
-                            self.segments_updated += 1
-                        except Exception as e:
-                            logger.error(f"Segmentation error: {e}")
+            
+            await asyncio.gather(*(
+                self._score_user(user_id, user_event_list, predictions, anomalies, segments)
+                for user_id, user_event_list in user_events.items()
+            ))
             
             # Save to database
             try:
                 if predictions:
-                    await self.db.insert_predictions(predictions)
+                    await self.db.insert_predictions(predictions, workload='realtime')
                     logger.info(f"💾 Saved {len(predictions)} predictions to database")
             except Exception as e:
                 logger.error(f"❌ Error saving predictions: {e}", exc_info=True)
             
             try:
                 if anomalies:
-                    await self.db.insert_anomalies(anomalies)
+                    await self.db.insert_anomalies(anomalies, workload='realtime')
                     logger.info(f"💾 Saved {len(anomalies)} anomalies to database")
             except Exception as e:
                 logger.error(f"❌ Error saving anomalies: {e}", exc_info=True)
             
             try:
                 if segments:
-                    await self.db.insert_segments(segments)
+                    await self.db.insert_segments(segments, workload='realtime')
                     logger.info(f"💾 Saved {len(segments)} segments to database")
             except Exception as e:
                 logger.error(f"❌ Error saving segments: {e}", exc_info=True)
@@ -280,30 +440,18 @@ class RealtimeProcessor:
             if self.recommendation_model and self.recommendation_model.is_trained:
                 # Get active users
                 active_users = list(user_events.keys())[:10]  # Limit to 10 users per batch
+                scored = await asyncio.gather(*(self._recommend(user_id) for user_id in active_users),
+                                              return_exceptions=True)
                 
-                for user_id in active_users:
+                for user_id, result in zip(active_users, scored):
                     try:
-                        # Get product IDs (would come from database in real scenario)
-                        # For now, use placeholder
-                        product_ids = np.array([1, 2, 3, 4, 5])  # TODO: Get from database
-                        
-                        # Map user_id to model's expected range (0 to num_users)
-                        # Note: This is a simplified approach. In production, you should
-                        # save and load the user_id mapping from training time
-                        mapped_user_id = int(user_id) % (self.recommendation_model.num_users + 1)
-                        
-                        # Ensure product_ids are within model's expected range
-                        mapped_product_ids = (product_ids % (self.recommendation_model.num_products + 1)).astype(int)
-                        
-                        top_products, top_scores = self.recommendation_model.recommend(
-                            mapped_user_id,
-                            mapped_product_ids,
-                            top_k=5
-                        )
+                        if isinstance(result, Exception):
+                            raise result
+                        top_products, top_scores = result
                         
                         recommendations.append({
                             'userId': user_id,  # Store original user_id
-                            'tenantId': 1,
+                            'tenantId': event_tenant(user_events[user_id]),
                             'productIds': top_products.tolist(),
                             'scores': top_scores.tolist(),
                             'metadata': json.dumps({})
@@ -314,7 +462,7 @@ class RealtimeProcessor:
                 
                 try:
                     if recommendations:
-                        await self.db.insert_recommendations(recommendations)
+                        await self.db.insert_recommendations(recommendations, workload='realtime')
                         logger.info(f"💾 Saved {len(recommendations)} recommendations to database")
                 except Exception as e:
                     logger.error(f"❌ Error saving recommendations: {e}", exc_info=True)
@@ -325,3 +473,54 @@ class RealtimeProcessor:
         except Exception as e:
             logger.error(f"Error processing batch: {e}", exc_info=True)
 
+def event_tenant(events: List[Dict[str, Any]]) -> int:
+    """Tenant of a user's events (the latest one carrying it), 1 when none does"""
+    for event in reversed(events):
+        if event.get('tenantId') is not None:
+            return event['tenantId']
+    return 1
+
+def purchase_prediction(user_id: Any, events: List[Dict[str, Any]], probability: float) -> Dict[str, Any]:
+    """Prediction row for a purchase score of user_id computed on this batch's events"""
+    return {
+        'userId': user_id,
+        'tenantId': event_tenant(events),
+        'predictionType': 'purchase',
+        'probability': float(probability),
+        'metadata': json.dumps({'eventCount': len(events)})
+    }
+
+def shard_queue(shard: int) -> str:
+    return f"{config.REDIS_QUEUE_NAME}:shard:{shard}"
+
+def preload_models(model_loader: Optional[ModelLoader] = None) -> Dict[str, Tuple[str, Any]]:
+    """Load the served version of every model that loads without TensorFlow (attr -> (version, model))
+    
+    Called by the serving parent before it forks the workers, which then share the loaded
+    weights copy-on-write. TensorFlow's thread pools do not survive fork(), so its import is
+    blocked here: a model that needs Keras at load time fails with ImportError and every
+    worker loads it itself after the fork. No warm-up here, backends are built in the workers.
+    """
+    model_loader = model_loader or ModelLoader()
+    blocked = 'tensorflow' not in sys.modules
+    if blocked:
+        sys.modules['tensorflow'] = None  # import tensorflow raises ImportError
+    preloaded = {}
+    try:
+        for attr, (model_name, model_class) in RealtimeProcessor.MODELS.items():
+            version = model_loader.resolve_version(model_name, "deployed")
+            if version is None:
+                continue
+            try:
+                model = model_class()
+                model.load(model_loader.get_model_path(model_name, version))
+                preloaded[attr] = (version, model)
+                logger.info(f"📦 {model_name} v{version} preloaded")
+            except ImportError:
+                logger.info(f"⏭️ {model_name} needs TensorFlow to load, every worker loads it after fork")
+            except Exception as e:
+                logger.error(f"Error preloading {model_name}: {e}")
+    finally:
+        if blocked:
+            sys.modules.pop('tensorflow', None)
+    return preloaded
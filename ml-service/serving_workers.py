@@ -0,0 +1,147 @@
+"""Multi-process serving: models loaded once in a parent process, workers forked to share them
+
+python main.py with SERVING_WORKERS > 1:
+  1. the parent preloads every model that loads without TensorFlow (realtime_processor
+     preload_models) and creates the shared stats table and the listening socket
+  2. gc.freeze() moves the loaded objects out of the garbage collector's reach, so the
+     collector does not write to (and copy) their pages in the workers
+  3. SERVING_WORKERS workers are forked; each runs the FastAPI app on the shared socket and
+     consumes shard <index> of the realtime events (per-user state stays in one worker)
+  4. unless SERVING_ONLY, a training process is forked as well: the trainer and job manager
+     on 127.0.0.1:TRAINER_PORT with the training thread policy; the workers forward the
+     /api/models training and job endpoints to it (jobs live in one process)
+  5. the parent restarts workers that die and forwards SIGTERM/SIGINT to them
+"""
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
+import uvicorn
+from config import config
+from utils.threading_policy import apply_process_policy, pin_worker
+from utils.worker_stats import WorkerStats
+
+logger = logging.getLogger(__name__)
+
+TRAINER = -1  # Child index of the training process
+
+# Set in the parent before the fork, read by the worker's startup handler
+worker_index = 0
+worker_count = 1
+role = 'serving'  # 'training' in the training process
+trainer_url: Optional[str] = None
+preloaded: Dict[str, Tuple[str, Any]] = {}
+stats: Optional[WorkerStats] = None
+
+def run(app):
+    """Preload, fork SERVING_WORKERS workers serving app and supervise them (returns on shutdown)"""
+    global worker_count, trainer_url, preloaded, stats
+    from realtime_processor import preload_models
+    
+    if config.ROLLUPS_ENABLED and config.ROLLUP_BACKEND == 'local':
+        # Each worker would count only its own shard and overwrite the others' snapshot
+        raise ValueError("ROLLUP_BACKEND=local is per process; use ROLLUP_BACKEND=redis with SERVING_WORKERS > 1")
+    
+    worker_count = config.SERVING_WORKERS
+    start = time.time()
+    preloaded = preload_models()
+    stats = WorkerStats(worker_count)
+    logger.info(f"📦 {len(preloaded)} model(s) preloaded in {time.time() - start:.2f}s, forking {worker_count} workers")
+    
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((config.ML_SERVICE_HOST, config.ML_SERVICE_PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    trainer_port = config.TRAINER_PORT or config.ML_SERVICE_PORT + 1
+    trainer_url = None if config.SERVING_ONLY else f"http://127.0.0.1:{trainer_port}"
+    
+    gc.collect()
+    gc.freeze()
+    
+    children = {}  # pid -> worker index
+    stopping = False
+    
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            if index == TRAINER:
+                _trainer(app, sock, trainer_port)
+            _worker(app, sock, index)
+        children[pid] = index
+    
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    if trainer_url:
+        spawn(TRAINER)
+    for index in range(worker_count):
+        spawn(index)
+    
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        name = 'Training process' if index == TRAINER else f'Worker {index}'
+        logger.warning(f"⚠️ {name} (pid {pid}) exited with status {status}, restarting")
+        time.sleep(1)
+        spawn(index)
+    sock.close()
+    logger.info("✅ All serving workers stopped")
+
+def _worker(app, sock: socket.socket, index: int):
+    """Forked child: serve app on the inherited socket as worker index, then exit"""
+    global worker_index
+    worker_index = index
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    np.random.seed()  # Forked workers would otherwise share the parent's NumPy random state
+    cpus = pin_worker(index, worker_count) if config.WORKER_CPU_PINNING else None
+    logger.info(f"👷 Worker {index}/{worker_count} started (pid {os.getpid()}{f', CPUs {cpus}' if cpus else ''})")
+    
+    code = 0
+    try:
+        server = uvicorn.Server(uvicorn.Config(app, log_level=config.LOG_LEVEL.lower()))
+        server.run(sockets=[sock])
+    except BaseException as e:
+        logger.error(f"❌ Worker {index} failed: {e}")
+        code = 1
+    finally:
+        os._exit(code)
+
+def _trainer(app, sock: socket.socket, port: int):
+    """Forked child: the app with the trainer and job manager only, on a loopback port, then exit"""
+    global role
+    role = 'training'
+    sock.close()  # Serving traffic stays with the workers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    np.random.seed()
+    apply_process_policy('training')  # Before TensorFlow loads in this process
+    logger.info(f"🏋️ Training process started (pid {os.getpid()}, 127.0.0.1:{port})")
+    
+    code = 0
+    try:
+        server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level=config.LOG_LEVEL.lower()))
+        server.run()
+    except BaseException as e:
+        logger.error(f"❌ Training process failed: {e}")
+        code = 1
+    finally:
+        os._exit(code)
@@ -1,17 +1,25 @@
 import numpy as np
-import pandas as pd
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import asyncio
+import functools
 from config import config
 from utils.db_connector import DBConnector
 from data_processor import DataProcessor
+from data_pipeline import TrainingDataCache
 from models.purchase_prediction import PurchasePredictionModel
 from models.recommendation import RecommendationModel
+from models.negative_sampling import NegativeSampler
 from models.anomaly_detection import AnomalyDetectionModel
 from models.segmentation import SegmentationModel
+from utils.threading_policy import training_threads
+from models.variants import quantization_mode, build_variant
+from utils.lstm_runtime import PurchaseNetwork
+from utils.ncf_runtime import RecommendationNetwork
 from utils.model_loader import ModelLoader
+from utils.id_map import IdMap
+from training_jobs import JobCancelled
 
 logger = logging.getLogger(__name__)
 
@@ -26,89 +34,159 @@ class ModelTrainer:
         )
         self.model_loader = ModelLoader()
     
+    def _set_stage(self, job, stage: str):
+        """Report stage to the training job, if any (also a cancellation point)"""
+        if job is not None:
+            job.set_stage(stage)
+    
+    def _job_callbacks(self, job, model_name: str) -> list:
+        """Keras callbacks reporting epoch progress to the training job"""
+        if job is None:
+            return []
+        from models.training_callbacks import JobProgressCallback
+        return [JobProgressCallback(job, model_name)]
+    
+    async def _run_blocking(self, func, *args, **kwargs):
+        """Run CPU-bound training code off the event loop, with the training BLAS/OpenMP threads"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(self._with_training_threads, func, *args, **kwargs))
+    
+    @staticmethod
+    def _with_training_threads(func, *args, **kwargs):
+        with training_threads():
+            return func(*args, **kwargs)
+    
+    def _load_previous(self, model_name: str, model) -> Optional[str]:
+        """Load the latest saved version into model for warm-start; returns its version"""
+        version = self.model_loader.get_latest_version(model_name)
+        if version is None:
+            logger.warning(f"⚠️ {model_name} için önceki versiyon yok, tam eğitim yapılacak")
+            return None
+        try:
+            model.load(self.model_loader.get_model_path(model_name, version))
+        except Exception as e:
+            logger.warning(f"⚠️ {model_name} v{version} yüklenemedi, tam eğitim yapılacak: {e}")
+            return None
+        logger.info(f"♻️ {model_name} v{version} üzerinden artımlı eğitim yapılacak")
+        return version
+    
+    @staticmethod
+    def _holdout_split(n: int) -> Tuple[slice, slice]:
+        """Split rows into fine-tuning and holdout parts for version comparison"""
+        holdout = max(1, int(n * config.INCREMENTAL_HOLDOUT_FRACTION))
+        return slice(0, n - holdout), slice(n - holdout, n)
+    
+    def _incremental_summary(self, model_name: str, base_version: str,
+                             previous_loss: Optional[float], new_loss: float) -> Dict[str, Any]:
+        """Compare holdout loss with the previous version and decide whether to promote"""
+        if previous_loss is None:
+            promoted = True
+        else:
+            promoted = new_loss <= previous_loss * (1 + config.INCREMENTAL_MAX_REGRESSION)
+        
+        previous_str = f"{previous_loss:.4f}" if previous_loss is not None else "n/a"
+        msg = f"{model_name} holdout loss: v{base_version}={previous_str}, yeni={new_loss:.4f}"
+        if promoted:
+            logger.info(f"✅ {msg} -> kaydediliyor")
+        else:
+            logger.warning(f"⚠️ {msg} -> önceki versiyondan kötü, kaydedilmiyor")
+        
+        return {
+            "incremental": True,
+            "base_version": base_version,
+            "previous_holdout_loss": previous_loss,
+            "holdout_loss": new_loss,
+            "promoted": promoted
+        }
+    
+    async def _iter_user_event_chunks(self, days: int):
+        """Yield {userId: events} for the window, PIPELINE_CHUNK_USERS users at a time
+        
+        Events are streamed from a server-side cursor ordered by user, so memory stays
+        bounded by one chunk and every user's events arrive complete within a single chunk.
+        """
+        query = """
+            SELECT 
+                ube.userId,
+                ube.eventType,
+                ube.eventData,
+                ube.timestamp,
+                ube.sessionId
+            FROM user_behavior_events ube
+            WHERE ube.timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
+                AND ube.userId IS NOT NULL
+            ORDER BY ube.userId, ube.timestamp
+        """
+        user_events = {}
+        async for rows in self.db.stream(query, (days,), chunk_size=config.DB_STREAM_CHUNK_SIZE,
+                                         timeout=config.DB_STREAM_TIMEOUT, workload='batch'):
+            for event in rows:
+                user_id = event['userId']
+                if user_id not in user_events and len(user_events) >= config.PIPELINE_CHUNK_USERS:
+                    yield user_events
+                    user_events = {}
+                user_events.setdefault(user_id, []).append(event)
+        if user_events:
+            yield user_events
+    
+    def _encode_purchase_chunk(self, user_events: Dict[Any, list], purchasing_users: set) -> Dict[str, np.ndarray]:
+        """Sequences, features and labels for one chunk of users"""
+        sequences = [self.data_processor.create_user_sequence(events) for events in user_events.values()]
+        features = [self.data_processor.create_user_features(events) for events in user_events.values()]
+        labels = [1.0 if user_id in purchasing_users else 0.0 for user_id in user_events]
+        return {
+            "sequences": np.asarray(sequences, dtype=np.float32),
+            "features": np.asarray(features, dtype=np.float32),
+            "labels": np.asarray(labels, dtype=np.float32)
+        }
+    
     async def prepare_training_data_purchase(self, days: int = 30) -> tuple:
-        """Prepare training data for purchase prediction"""
+        """Prepare training data for purchase prediction
+        
+        Users are read and encoded in chunks into the on-disk cache; the returned arrays
+        are memory maps, so the window does not have to fit in RAM.
+        """
         try:
-            print(f"🔍 Veritabanından event verileri çekiliyor (son {days} gün)...", flush=True)
-            logger.info(f"🔍 Veritabanından event verileri çekiliyor (son {days} gün)...")
-            
-            # Get events from database
-            query = """
-                SELECT 
-                    ube.userId,
-                    ube.eventType,
-                    ube.eventData,
-                    ube.timestamp,
-                    ube.sessionId
-                FROM user_behavior_events ube
-                WHERE ube.timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
-                    AND ube.userId IS NOT NULL
-                ORDER BY ube.userId, ube.timestamp
-            """
-            events = await self.db.execute(query, (days,))
-            
-            print(f"📥 {len(events)} event veritabanından çekildi", flush=True)
-            logger.info(f"📥 {len(events)} event veritabanından çekildi")
-            
             # Get purchase labels
             print("🔍 Satın alma verileri çekiliyor...", flush=True)
             logger.info("🔍 Satın alma verileri çekiliyor...")
             
             purchase_query = """
-                SELECT 
-                    userId,
-                    createdAt as purchaseDate
+                SELECT DISTINCT userId
                 FROM orders
                 WHERE createdAt >= DATE_SUB(NOW(), INTERVAL %s DAY)
                     AND status = 'completed'
             """
-            purchases = await self.db.execute(purchase_query, (days,))
-            
-            print(f"📥 {len(purchases)} satın alma kaydı bulundu", flush=True)
-            logger.info(f"📥 {len(purchases)} satın alma kaydı bulundu")
-            
-            # Group events by user
-            print("📊 Event'ler kullanıcılara göre gruplandırılıyor...", flush=True)
-            logger.info("📊 Event'ler kullanıcılara göre gruplandırılıyor...")
-            
-            user_events = {}
-            for event in events:
-                user_id = event['userId']
-                if user_id not in user_events:
-                    user_events[user_id] = []
-                user_events[user_id].append(event)
-            
-            print(f"👥 {len(user_events)} benzersiz kullanıcı bulundu", flush=True)
-            logger.info(f"👥 {len(user_events)} benzersiz kullanıcı bulundu")
-            
-            # Create sequences and labels
-            print("🔧 Sequence ve feature'lar oluşturuluyor...", flush=True)
-            logger.info("🔧 Sequence ve feature'lar oluşturuluyor...")
-            
-            sequences = []
-            features = []
-            labels = []
-            
-            purchase_count = 0
-            for user_id, events_list in user_events.items():
-                # Check if user made purchase
-                user_purchases = [p for p in purchases if p['userId'] == user_id]
-                has_purchase = len(user_purchases) > 0
-                if has_purchase:
-                    purchase_count += 1
-                
-                # Create sequence
-                sequence = self.data_processor.create_user_sequence(events_list)
-                feature = self.data_processor.create_user_features(events_list)
-                
-                sequences.append(sequence)
-                features.append(feature)
-                labels.append(1 if has_purchase else 0)
+            purchases = await self.db.execute(purchase_query, (days,), workload='batch')
+            purchasing_users = {p['userId'] for p in purchases}
+            
+            print(f"📥 {len(purchasing_users)} satın alan kullanıcı bulundu", flush=True)
+            logger.info(f"📥 {len(purchasing_users)} satın alan kullanıcı bulundu")
+            
+            print(f"🔍 Veritabanından event verileri parça parça çekiliyor (son {days} gün)...", flush=True)
+            logger.info(f"🔍 Veritabanından event verileri parça parça çekiliyor (son {days} gün)...")
+            
+            cache = TrainingDataCache('purchase_prediction')
+            event_count = 0
+            async for user_events in self._iter_user_event_chunks(days):
+                event_count += sum(len(events) for events in user_events.values())
+                chunk = await self._run_blocking(self._encode_purchase_chunk, user_events, purchasing_users)
+                cache.append(**chunk)
+            
+            arrays = cache.finalize(
+                sequences=('float32', (config.SEQUENCE_LENGTH, len(self.data_processor.event_weights))),
+                features=('float32', (50,)),
+                labels=('float32', ())
+            )
+            sequences, features, labels = arrays['sequences'], arrays['features'], arrays['labels']
+            purchase_count = int(np.sum(labels))
             
+            print(f"📥 {event_count} event veritabanından çekildi", flush=True)
+            logger.info(f"📥 {event_count} event veritabanından çekildi")
             print(f"✅ Veri hazırlandı: {len(sequences)} örnek, {purchase_count} satın alma etiketi", flush=True)
             logger.info(f"✅ Veri hazırlandı: {len(sequences)} örnek, {purchase_count} satın alma etiketi")
             
-            return np.array(sequences), np.array(features), np.array(labels)
+            return sequences, features, labels
             
         except Exception as e:
             import traceback
@@ -116,14 +194,19 @@ class ModelTrainer:
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
-    async def prepare_training_data_recommendation(self, days: int = 30) -> tuple:
-        """Prepare training data for recommendation"""
+    async def prepare_training_data_recommendation(self, days: int = 30,
+                                                   known_user_map: Optional[IdMap] = None,
+                                                   known_product_map: Optional[IdMap] = None) -> tuple:
+        """Prepare training data for recommendation
+        
+        Ids known to a previous version (known_*_map) keep their rows; new ids get new rows.
+        """
         try:
-            # Get user-product interactions
+            # Get user-product interactions, streamed as numpy columns
             query = """
                 SELECT DISTINCT
                     ube.userId,
-                    JSON_EXTRACT(ube.eventData, '$.productId') as productId,
+                    JSON_UNQUOTE(JSON_EXTRACT(ube.eventData, '$.productId')) as productId,
                     CASE 
                         WHEN ube.eventType = 'purchase' THEN 1
                         WHEN ube.eventType = 'add_to_cart' THEN 0.7
@@ -132,37 +215,48 @@ class ModelTrainer:
                     END as rating
                 FROM user_behavior_events ube
                 WHERE ube.timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
-                    AND ube.userId IS NOT NULL
-                    AND JSON_EXTRACT(ube.eventData, '$.productId') IS NOT NULL
-            """
-            interactions = await self.db.execute(query, (days,))
-            
-            if not interactions:
+                    AND ube.userId REGEXP '^[0-9]{1,18}$'
+                    AND JSON_UNQUOTE(JSON_EXTRACT(ube.eventData, '$.productId')) REGEXP '^[0-9]{1,18}$'
+            """  # Numeric ids only (int64 columns below); 'null', empty or text ids are skipped
+            raw_cache = TrainingDataCache('recommendation_raw')
+            async for columns in self.db.stream(query, (days,), chunk_size=config.DB_STREAM_CHUNK_SIZE * 10,
+                                                row_format='numpy', timeout=config.DB_STREAM_TIMEOUT, workload='batch'):
+                users = columns['userId'].astype(np.int64)
+                products = columns['productId'].astype(np.int64)
+                valid = (users != 0) & (products != 0)
+                raw_cache.append(
+                    users=users[valid],
+                    products=products[valid],
+                    ratings=columns['rating'].astype(np.float32)[valid]
+                )
+            
+            raw = raw_cache.finalize(users=('int64', ()), products=('int64', ()), ratings=('float32', ()))
+            if len(raw['users']) == 0:
                 logger.warning("No recommendation training data available")
                 return None, None, None, 0, 0
             
             # Create mappings
-            user_ids = sorted(list(set([int(i['userId']) for i in interactions if i['userId']])))
-            product_ids = sorted(list(set([int(i['productId']) for i in interactions if i['productId']])))
-            
-            if not user_ids or not product_ids:
-                logger.warning("Insufficient recommendation training data (no users or products)")
-                return None, None, None, 0, 0
-            
-            user_map = {uid: idx for idx, uid in enumerate(user_ids)}
-            product_map = {pid: idx for idx, pid in enumerate(product_ids)}
-            
-            # Create arrays
-            user_array = np.array([user_map[int(i['userId'])] for i in interactions if i['userId'] and i['productId']])
-            product_array = np.array([product_map[int(i['productId'])] for i in interactions if i['userId'] and i['productId']])
-            ratings = np.array([float(i['rating']) for i in interactions if i['userId'] and i['productId']])
-            
-            num_users = len(user_ids)
-            num_products = len(product_ids)
+            user_map = (known_user_map or IdMap.empty()).extended(np.unique(raw['users']))
+            product_map = (known_product_map or IdMap.empty()).extended(np.unique(raw['products']))
+            
+            # Create arrays, mapped chunk by chunk into the cache
+            cache = TrainingDataCache('recommendation')
+            step = config.PIPELINE_CHUNK_USERS * 100
+            for start in range(0, len(raw['users']), step):
+                cache.append(
+                    users=user_map.lookup(raw['users'][start:start + step]),
+                    products=product_map.lookup(raw['products'][start:start + step]),
+                    ratings=raw['ratings'][start:start + step]
+                )
+            arrays = cache.finalize()
+            user_array, product_array, ratings = arrays['users'], arrays['products'], arrays['ratings']
+            
+            num_users = len(user_map)
+            num_products = len(product_map)
             
             logger.info(f"Recommendation data prepared: {len(user_array)} interactions, {num_users} users, {num_products} products")
             
-            return user_array, product_array, ratings, num_users, num_products
+            return user_array, product_array, ratings, num_users, num_products, user_map, product_map
             
         except Exception as e:
             import traceback
@@ -170,28 +264,67 @@ class ModelTrainer:
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
+    @staticmethod
+    def _stratum_rates(counts: Dict[Any, int], sample_size: int, min_per_stratum: int) -> Dict[Any, float]:
+        """Per-stratum sampling rates: proportional allocation, small strata topped up to min_per_stratum"""
+        total = sum(counts.values())
+        if total <= sample_size:
+            return {stratum: 1.0 for stratum in counts}
+        
+        rates = {}
+        for stratum, count in counts.items():
+            target = max(sample_size * count / total, min(count, min_per_stratum))
+            rates[stratum] = min(1.0, target / count)
+        return rates
+    
     async def prepare_training_data_anomaly(self, days: int = 30) -> np.ndarray:
-        """Prepare training data for anomaly detection"""
+        """Prepare training data for anomaly detection
+        
+        Events of the whole window are sampled per eventType stratum (about ANOMALY_SAMPLE_SIZE
+        in total, rare types kept up to ANOMALY_MIN_PER_STRATUM) in id-range chunks, and each
+        chunk is encoded in one vectorized pass into the on-disk cache. Sampling is a Bernoulli
+        filter per row, so the sample size is approximate (binomial around the target).
+        """
         try:
-            # Get normal events (non-anomalous)
-            query = """
-                SELECT 
-                    ube.eventData,
-                    ube.eventType
-                FROM user_behavior_events ube
-                WHERE ube.timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
-                    AND ube.userId IS NOT NULL
-                LIMIT 10000
+            window = "timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY) AND userId IS NOT NULL"
+            strata = await self.db.execute(
+                f"SELECT eventType, COUNT(*) AS count, MIN(id) AS min_id, MAX(id) AS max_id "
+                f"FROM user_behavior_events WHERE {window} GROUP BY eventType",
+                (days,),
+                workload='batch'
+            )
+            if not strata:
+                return np.empty((0, 50), dtype=np.float32)
+            
+            rates = self._stratum_rates({row['eventType']: int(row['count']) for row in strata},
+                                        config.ANOMALY_SAMPLE_SIZE, config.ANOMALY_MIN_PER_STRATUM)
+            min_id = min(int(row['min_id']) for row in strata)
+            max_id = max(int(row['max_id']) for row in strata)
+            
+            # One Bernoulli filter with a per-type rate, evaluated in a single scan
+            typed = [(event_type, rate) for event_type, rate in rates.items() if event_type is not None]
+            rate_case = "CASE eventType " + " ".join("WHEN %s THEN %s" for _ in typed) + " ELSE %s END" if typed else "%s"
+            rate_params = tuple(v for pair in typed for v in pair) + (rates.get(None, 0.0),)
+            query = f"""
+                SELECT eventData, eventType
+                FROM user_behavior_events
+                WHERE id BETWEEN %s AND %s
+                    AND {window}
+                    AND RAND() < {rate_case}
             """
-            events = await self.db.execute(query, (days,))
             
-            # Create features
-            features = []
-            for event in events:
-                feature = self.data_processor.create_user_features([event])
-                features.append(feature)
+            logger.info(f"Anomaly sampling rates: { {str(k): round(v, 4) for k, v in rates.items()} }")
+            
+            cache = TrainingDataCache('anomaly_detection')
+            step = config.ANOMALY_SCAN_CHUNK
+            for lo in range(min_id, max_id + 1, step):
+                events = await self.db.execute(query, (lo, min(lo + step - 1, max_id), days) + rate_params, workload='batch')
+                if events:
+                    cache.append(features=await self._run_blocking(self.data_processor.create_event_features, events))
             
-            return np.array(features)
+            features = cache.finalize(features=('float32', (50,)))['features']
+            logger.info(f"Anomaly data prepared: {len(features)} sampled events from {sum(int(r['count']) for r in strata)}")
+            return features
             
         except Exception as e:
             import traceback
@@ -199,38 +332,21 @@ class ModelTrainer:
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
+    def _encode_feature_chunk(self, user_events: Dict[Any, list]) -> np.ndarray:
+        """Per-user feature vectors for one chunk of users"""
+        return np.asarray([self.data_processor.create_user_features(events) for events in user_events.values()],
+                          dtype=np.float32)
+    
     async def prepare_training_data_segmentation(self, days: int = 30) -> np.ndarray:
         """Prepare training data for segmentation"""
         try:
-            # Get user features
-            query = """
-                SELECT 
-                    ube.userId,
-                    ube.eventType,
-                    ube.eventData,
-                    ube.timestamp
-                FROM user_behavior_events ube
-                WHERE ube.timestamp >= DATE_SUB(NOW(), INTERVAL %s DAY)
-                    AND ube.userId IS NOT NULL
-                ORDER BY ube.userId, ube.timestamp
-            """
-            events = await self.db.execute(query, (days,))
-            
-            # Group by user
-            user_events = {}
-            for event in events:
-                user_id = event['userId']
-                if user_id not in user_events:
-                    user_events[user_id] = []
-                user_events[user_id].append(event)
+            # Get user features, chunk by chunk into the on-disk cache
+            cache = TrainingDataCache('segmentation')
+            async for user_events in self._iter_user_event_chunks(days):
+                features = await self._run_blocking(self._encode_feature_chunk, user_events)
+                cache.append(features=features)
             
-            # Create features
-            features = []
-            for user_id, events_list in user_events.items():
-                feature = self.data_processor.create_user_features(events_list)
-                features.append(feature)
-            
-            return np.array(features)
+            return cache.finalize(features=('float32', (50,)))['features']
             
         except Exception as e:
             import traceback
@@ -238,14 +354,18 @@ class ModelTrainer:
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
-    async def train_purchase_model(self, version: str = None):
-        """Train purchase prediction model"""
+    async def train_purchase_model(self, version: str = None, days: int = 30, epochs: int = None,
+                                   batch_size: int = None, job=None, incremental: bool = False) -> Optional[Dict[str, Any]]:
+        """Train purchase prediction model (incremental=True fine-tunes the latest version)"""
         try:
             print("🔍 Veri hazırlanıyor...", flush=True)
             logger.info("🔍 Veri hazırlanıyor...")
+            self._set_stage(job, 'preparing_data')
             
             # Prepare data
-            sequences, features, labels = await self.prepare_training_data_purchase()
+            sequences, features, labels = await self.prepare_training_data_purchase(
+                config.INCREMENTAL_DAYS if incremental else days
+            )
             
             print(f"📊 Veri hazırlandı: {len(sequences)} örnek bulundu", flush=True)
             logger.info(f"📊 Veri hazırlandı: {len(sequences)} örnek bulundu")
@@ -254,7 +374,7 @@ class ModelTrainer:
                 warning_msg = "⚠️ Eğitim verisi bulunamadı!"
                 print(warning_msg, flush=True)
                 logger.warning(warning_msg)
-                return
+                return None
             
             # Check minimum data requirements
             purchase_count = int(np.sum(labels))
@@ -276,6 +396,7 @@ class ModelTrainer:
             
             print("🏗️ Model oluşturuluyor...", flush=True)
             logger.info("🏗️ Model oluşturuluyor...")
+            self._set_stage(job, 'building_model')
             
             # Create model
             model = PurchasePredictionModel(
@@ -283,25 +404,60 @@ class ModelTrainer:
                 embedding_dim=config.EMBEDDING_DIM
             )
             
-            num_event_types = sequences.shape[2] if len(sequences.shape) > 2 else 10
-            feature_dim = features.shape[1] if len(features.shape) > 1 else 50
-            model.build_model(num_event_types, feature_dim)
-            
-            print(f"✅ Model oluşturuldu - Event types: {num_event_types}, Feature dim: {feature_dim}", flush=True)
-            logger.info(f"✅ Model oluşturuldu - Event types: {num_event_types}, Feature dim: {feature_dim}")
+            base_version = self._load_previous('purchase_model', model) if incremental else None
+            if base_version and not model.accepts_input(sequences, features):
+                logger.warning("⚠️ Önceki purchase modeli veri boyutlarıyla uyumsuz, tam eğitim yapılacak")
+                base_version = None
+            
+            # A quantized variant is gated on a holdout too, so it is split off in full training as well
+            quantization = quantization_mode('purchase')
+            train_part, holdout = slice(None), None
+            if base_version or quantization:
+                train_part, holdout = self._holdout_split(len(sequences))
+            if base_version:
+                previous_metrics = await self._run_blocking(
+                    model.evaluate, sequences[holdout], features[holdout], labels[holdout]
+                )
+                model.compile_model(config.INCREMENTAL_LEARNING_RATE)
+                epochs = epochs or config.INCREMENTAL_EPOCHS
+            else:
+                # build_model replaces anything left from a rejected previous version
+                num_event_types = sequences.shape[2] if len(sequences.shape) > 2 else 10
+                feature_dim = features.shape[1] if len(features.shape) > 1 else 50
+                model.build_model(num_event_types, feature_dim)
+                
+                print(f"✅ Model oluşturuldu - Event types: {num_event_types}, Feature dim: {feature_dim}", flush=True)
+                logger.info(f"✅ Model oluşturuldu - Event types: {num_event_types}, Feature dim: {feature_dim}")
             
             print("🎓 Model eğitimi başlatılıyor...", flush=True)
             logger.info("🎓 Model eğitimi başlatılıyor...")
             
             # Train
-            history = model.train(sequences, features, labels)
+            history = await self._run_blocking(
+                model.train, sequences[train_part], features[train_part], labels[train_part],
+                epochs=epochs, batch_size=batch_size,
+                extra_callbacks=self._job_callbacks(job, 'purchase_model')
+            )
             
             final_accuracy = float(history.history.get('accuracy', [0])[-1])
             final_loss = float(history.history.get('loss', [0])[-1])
             print(f"📊 Eğitim tamamlandı - Accuracy: {final_accuracy:.4f}, Loss: {final_loss:.4f}", flush=True)
             logger.info(f"📊 Eğitim tamamlandı - Accuracy: {final_accuracy:.4f}, Loss: {final_loss:.4f}")
             
+            incremental_info = {}
+            if base_version:
+                self._set_stage(job, 'validating')
+                new_metrics = await self._run_blocking(
+                    model.evaluate, sequences[holdout], features[holdout], labels[holdout]
+                )
+                incremental_info = self._incremental_summary(
+                    'purchase_model', base_version, previous_metrics['loss'], new_metrics['loss']
+                )
+                if not incremental_info['promoted']:
+                    return {"model_type": "purchase_prediction", "version": None, **incremental_info}
+            
             # Save model
+            self._set_stage(job, 'saving')
             version = version or f"v{int(datetime.now().timestamp())}"
             model_path = self.model_loader.get_model_path('purchase_model', version)
             
@@ -310,6 +466,15 @@ class ModelTrainer:
             
             model.save(model_path)
             
+            quantization_info = {}
+            if quantization:
+                self._set_stage(job, 'quantizing')
+                report = await self._run_blocking(
+                    build_variant, 'purchase', model, model_path,
+                    [sequences[holdout], features[holdout]], labels[holdout], PurchaseNetwork.from_weight_file
+                )
+                quantization_info = {"quantization": report} if report else {}
+            
             # Save metadata
             metadata = {
                 "model_type": "purchase_prediction",
@@ -317,76 +482,167 @@ class ModelTrainer:
                 "trained_at": datetime.now().isoformat(),
                 "training_samples": len(sequences),
                 "accuracy": float(history.history.get('accuracy', [0])[-1]),
-                "loss": float(history.history.get('loss', [0])[-1])
+                "loss": float(history.history.get('loss', [0])[-1]),
+                **incremental_info,
+                **quantization_info
             }
             self.model_loader.save_model_metadata('purchase_model', version, metadata)
             
             success_msg = f"✅ Purchase prediction modeli başarıyla eğitildi ve kaydedildi (v{version})"
             print(success_msg, flush=True)
             logger.info(success_msg)
+            return metadata
             
+        except JobCancelled:
+            raise
         except Exception as e:
             import traceback
             logger.error(f"Error training purchase model: {e}")
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
-    async def train_recommendation_model(self, version: str = None):
-        """Train recommendation model"""
+    async def train_recommendation_model(self, version: str = None, days: int = 30, epochs: int = None,
+                                         batch_size: int = None, job=None, incremental: bool = False) -> Optional[Dict[str, Any]]:
+        """Train recommendation model (incremental=True grows and fine-tunes the latest version)"""
         try:
             logger.info("Starting recommendation model training...")
+            self._set_stage(job, 'preparing_data')
+            
+            previous = None
+            base_version = None
+            if incremental:
+                previous = RecommendationModel(embedding_dim=config.EMBEDDING_DIM)
+                base_version = self._load_previous('recommendation_model', previous)
+                if base_version and previous.user_map is None:
+                    logger.warning("⚠️ Önceki recommendation modelinde id eşlemesi yok, tam eğitim yapılacak")
+                    base_version = None
+                if not base_version:
+                    previous = None
             
             # Prepare data
-            result = await self.prepare_training_data_recommendation()
+            result = await self.prepare_training_data_recommendation(
+                config.INCREMENTAL_DAYS if previous else days,
+                known_user_map=previous.user_map if previous else None,
+                known_product_map=previous.product_map if previous else None
+            )
             
             # Eğer result None ise veya yetersiz veri varsa
             if result is None:
                 logger.warning("No training data available for recommendation model")
-                return
+                return None
             
             # Result'un uzunluğunu kontrol et (3 veya 5 değer olabilir)
             if len(result) < 3:
                 logger.warning("Recommendation model: yetersiz veri")
-                return
+                return None
             
             # Eğer 3 değer döndürülmüşse (eski format), otomatik hesapla
             if len(result) == 3:
                 user_ids, product_ids, ratings = result
                 if user_ids is None or product_ids is None or ratings is None:
                     logger.warning("Recommendation model: yetersiz veri")
-                    return
+                    return None
                 # Otomatik değer ataması
                 num_users = len(set(user_ids)) if len(user_ids) > 0 else 0
                 num_products = len(set(product_ids)) if len(product_ids) > 0 else 0
             else:
-                # 5 değer döndürülmüşse (yeni format)
-                user_ids, product_ids, ratings, num_users, num_products = result
+                # 5 veya 7 değer döndürülmüşse (yeni format, 7'de id eşlemeleri de var)
+                user_ids, product_ids, ratings, num_users, num_products = result[:5]
+            user_map, product_map = result[5:7] if len(result) >= 7 else (None, None)
             
             # Veri kontrolü
             if result[0] is None or num_users == 0 or num_products == 0:
                 logger.warning("No training data available for recommendation model")
-                return
+                return None
             
             if len(user_ids) == 0 or len(product_ids) == 0:
                 logger.warning("Insufficient training data for recommendation model")
-                return
+                return None
+            
+            # Negatives exclude everything the user interacted with, holdout included
+            negative_sampler = None
+            if config.RECOMMENDATION_NEGATIVES > 0:
+                negative_sampler = await self._run_blocking(
+                    NegativeSampler, user_ids, product_ids, num_users, num_products
+                )
             
             # Create model
-            model = RecommendationModel(
-                num_users=num_users,
-                num_products=num_products,
-                embedding_dim=config.EMBEDDING_DIM
-            )
-            model.build_model()
+            self._set_stage(job, 'building_model')
+            quantization = quantization_mode('recommendation')
+            train_part = slice(None)
+            if previous is None and quantization:
+                train_part, holdout = self._holdout_split(len(user_ids))
+            if previous is not None:
+                model = previous
+                train_part, holdout = self._holdout_split(len(user_ids))
+                # The previous version can only score users/products it already had rows for
+                known = (user_ids[holdout] < model.num_users) & (product_ids[holdout] < model.num_products)
+                holdout_data = (user_ids[holdout][known], product_ids[holdout][known], ratings[holdout][known])
+                eval_sampler = None
+                if negative_sampler is not None:
+                    # Negatives for the comparison must also come from the previous catalog
+                    known_all = (user_ids < model.num_users) & (product_ids < model.num_products)
+                    eval_sampler = await self._run_blocking(
+                        NegativeSampler, user_ids[known_all], product_ids[known_all], model.num_users, model.num_products
+                    )
+                previous_metrics = None
+                if known.any():
+                    previous_metrics = await self._run_blocking(model.evaluate, *holdout_data, negative_sampler=eval_sampler)
+                model.grow_embeddings(num_users, num_products)
+                model.compile_model(config.INCREMENTAL_LEARNING_RATE)
+                epochs = epochs or config.INCREMENTAL_EPOCHS
+            else:
+                model = RecommendationModel(
+                    num_users=num_users,
+                    num_products=num_products,
+                    embedding_dim=config.EMBEDDING_DIM
+                )
+                model.build_model()
+            model.user_map = user_map
+            model.product_map = product_map
             
             # Train
-            history = model.train(user_ids, product_ids, ratings)
+            history = await self._run_blocking(
+                model.train, user_ids[train_part], product_ids[train_part], ratings[train_part],
+                epochs=epochs, batch_size=batch_size,
+                extra_callbacks=self._job_callbacks(job, 'recommendation_model'),
+                negative_sampler=negative_sampler
+            )
+            
+            incremental_info = {}
+            if previous is not None:
+                self._set_stage(job, 'validating')
+                new_loss = None
+                if known.any():
+                    new_loss = (await self._run_blocking(model.evaluate, *holdout_data, negative_sampler=eval_sampler))['loss']
+                incremental_info = self._incremental_summary(
+                    'recommendation_model', base_version,
+                    previous_metrics['loss'] if previous_metrics else None,
+                    new_loss if new_loss is not None else float(history.history.get('loss', [0])[-1])
+                )
+                if not incremental_info['promoted']:
+                    return {"model_type": "recommendation", "version": None, **incremental_info}
             
             # Save model
+            self._set_stage(job, 'saving')
             version = version or f"v{int(datetime.now().timestamp())}"
             model_path = self.model_loader.get_model_path('recommendation_model', version)
             model.save(model_path)
             
+            quantization_info = {}
+            if quantization:
+                self._set_stage(job, 'quantizing')
+                # Held-out positives plus seeded sampled negatives, so AUC has two classes
+                gate_data = [user_ids[holdout], product_ids[holdout], ratings[holdout]]
+                if negative_sampler is not None:
+                    gate_data = negative_sampler.augment(gate_data, rng=np.random.default_rng(0))
+                report = await self._run_blocking(
+                    build_variant, 'recommendation', model, model_path,
+                    [np.asarray(gate_data[0]), np.asarray(gate_data[1])], np.asarray(gate_data[2]),
+                    RecommendationNetwork.from_weight_file
+                )
+                quantization_info = {"quantization": report} if report else {}
+            
             # Save metadata
             metadata = {
                 "model_type": "recommendation",
@@ -395,41 +651,78 @@ class ModelTrainer:
                 "training_samples": len(user_ids),
                 "num_users": num_users,
                 "num_products": num_products,
-                "accuracy": float(history.history.get('accuracy', [0])[-1])
+                "negatives_per_positive": config.RECOMMENDATION_NEGATIVES,
+                "accuracy": float(history.history.get('accuracy', [0])[-1]),
+                **incremental_info,
+                **quantization_info
             }
             self.model_loader.save_model_metadata('recommendation_model', version, metadata)
             
             logger.info("Recommendation model trained successfully")
+            return metadata
             
+        except JobCancelled:
+            raise
         except Exception as e:
             import traceback
             logger.error(f"Error training recommendation model: {e}")
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
-    async def train_anomaly_model(self, version: str = None):
-        """Train anomaly detection model"""
+    async def train_anomaly_model(self, version: str = None, days: int = 30, epochs: int = None,
+                                  batch_size: int = None, job=None, incremental: bool = False) -> Optional[Dict[str, Any]]:
+        """Train anomaly detection model (incremental=True fine-tunes the latest autoencoder)"""
         try:
             logger.info("Starting anomaly detection model training...")
+            self._set_stage(job, 'preparing_data')
             
             # Prepare data
-            data = await self.prepare_training_data_anomaly()
+            data = await self.prepare_training_data_anomaly(config.INCREMENTAL_DAYS if incremental else days)
             
             if len(data) == 0:
                 logger.warning("No training data available")
-                return
+                return None
             
             # Create model
+            self._set_stage(job, 'building_model')
             model = AnomalyDetectionModel(input_dim=data.shape[1])
-            model.build_autoencoder()
+            base_version = self._load_previous('anomaly_model', model) if incremental else None
+            if base_version and model.autoencoder.input_shape[1] != data.shape[1]:
+                logger.warning("⚠️ Önceki anomaly modeli veri boyutlarıyla uyumsuz, tam eğitim yapılacak")
+                base_version = None
+            
+            train_part = slice(None)
+            if base_version:
+                train_part, holdout = self._holdout_split(len(data))
+                previous_loss = await self._run_blocking(model.evaluate_autoencoder, data[holdout])
+                model.compile_autoencoder(config.INCREMENTAL_LEARNING_RATE)
+                epochs = epochs or config.INCREMENTAL_EPOCHS
+            else:
+                model = AnomalyDetectionModel(input_dim=data.shape[1])
+                model.build_autoencoder()
             
             # Train autoencoder
-            model.train_autoencoder(data)
+            await self._run_blocking(
+                model.train_autoencoder, data[train_part],
+                epochs=epochs, batch_size=batch_size,
+                extra_callbacks=self._job_callbacks(job, 'anomaly_autoencoder')
+            )
+            
+            incremental_info = {}
+            if base_version:
+                self._set_stage(job, 'validating')
+                new_loss = await self._run_blocking(model.evaluate_autoencoder, data[holdout])
+                incremental_info = self._incremental_summary('anomaly_model', base_version, previous_loss, new_loss)
+                if not incremental_info['promoted']:
+                    return {"model_type": "anomaly_detection", "version": None, **incremental_info}
             
-            # Train isolation forest
-            model.train_isolation_forest(data)
+            # Train isolation forest (an incremental run keeps the previous forest)
+            if not base_version or model.isolation_forest is None:
+                self._set_stage(job, 'training_isolation_forest')
+                await self._run_blocking(model.train_isolation_forest, data)
             
             # Save model
+            self._set_stage(job, 'saving')
             version = version or f"v{int(datetime.now().timestamp())}"
             model_path = self.model_loader.get_model_path('anomaly_model', version)
             model.save(model_path)
@@ -439,40 +732,77 @@ class ModelTrainer:
                 "model_type": "anomaly_detection",
                 "version": version,
                 "trained_at": datetime.now().isoformat(),
-                "training_samples": len(data)
+                "training_samples": len(data),
+                **incremental_info
             }
             self.model_loader.save_model_metadata('anomaly_model', version, metadata)
             
             logger.info("Anomaly detection model trained successfully")
+            return metadata
             
+        except JobCancelled:
+            raise
         except Exception as e:
             import traceback
             logger.error(f"Error training anomaly model: {e}")
             logger.error(f"Traceback: {traceback.format_exc()}")
             raise
     
-    async def train_segmentation_model(self, version: str = None):
-        """Train segmentation model"""
+    async def train_segmentation_model(self, version: str = None, days: int = 30, epochs: int = None,
+                                       batch_size: int = None, job=None, incremental: bool = False) -> Optional[Dict[str, Any]]:
+        """Train segmentation model (incremental=True fine-tunes the latest autoencoder and centroids)"""
         try:
             logger.info("Starting segmentation model training...")
+            self._set_stage(job, 'preparing_data')
             
             # Prepare data
-            data = await self.prepare_training_data_segmentation()
+            data = await self.prepare_training_data_segmentation(config.INCREMENTAL_DAYS if incremental else days)
             
             if len(data) == 0:
                 logger.warning("No training data available")
-                return
+                return None
             
             # Create model
+            self._set_stage(job, 'building_model')
             model = SegmentationModel(num_segments=config.NUM_SEGMENTS)
+            base_version = self._load_previous('segmentation_model', model) if incremental else None
+            if base_version and (model.autoencoder is None or model.autoencoder.input_shape[1] != data.shape[1]):
+                logger.warning("⚠️ Önceki segmentation modeli veri boyutlarıyla uyumsuz, tam eğitim yapılacak")
+                base_version = None
+            
+            train_part = slice(None)
+            init_centers = None
+            if base_version:
+                train_part, holdout = self._holdout_split(len(data))
+                previous_loss = await self._run_blocking(model.evaluate_autoencoder, data[holdout])
+                model.compile_autoencoder(config.INCREMENTAL_LEARNING_RATE)
+                epochs = epochs or config.INCREMENTAL_EPOCHS
+                if model.kmeans is not None:
+                    init_centers = model.kmeans.cluster_centers_
+            else:
+                model = SegmentationModel(num_segments=config.NUM_SEGMENTS)
             
             # Train autoencoder
-            model.train_autoencoder(data)
+            await self._run_blocking(
+                model.train_autoencoder, data[train_part],
+                epochs=epochs, batch_size=batch_size,
+                extra_callbacks=self._job_callbacks(job, 'segmentation_autoencoder')
+            )
+            
+            incremental_info = {}
+            if base_version:
+                self._set_stage(job, 'validating')
+                new_loss = await self._run_blocking(model.evaluate_autoencoder, data[holdout])
+                incremental_info = self._incremental_summary('segmentation_model', base_version, previous_loss, new_loss)
+                if not incremental_info['promoted']:
+                    return {"model_type": "segmentation", "version": None, **incremental_info}
             
             # Train K-means
-            model.train_kmeans(data, use_autoencoder=True)
+            self._set_stage(job, 'training_kmeans')
+            await self._run_blocking(model.train_kmeans, data, use_autoencoder=True, init_centers=init_centers)
             
             # Save model
+            self._set_stage(job, 'saving')
             version = version or f"v{int(datetime.now().timestamp())}"
             model_path = self.model_loader.get_model_path('segmentation_model', version)
             model.save(model_path)
@@ -483,12 +813,16 @@ class ModelTrainer:
                 "version": version,
                 "trained_at": datetime.now().isoformat(),
                 "training_samples": len(data),
-                "num_segments": config.NUM_SEGMENTS
+                "num_segments": config.NUM_SEGMENTS,
+                **incremental_info
             }
             self.model_loader.save_model_metadata('segmentation_model', version, metadata)
             
             logger.info("Segmentation model trained successfully")
+            return metadata
             
+        except JobCancelled:
+            raise
         except Exception as e:
             import traceback
             logger.error(f"Error training segmentation model: {e}")
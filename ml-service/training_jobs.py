@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+from config import config
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    """Raised inside a training run when its job has been cancelled"""
+    pass
+
+class TrainingJob:
+    """State and progress of a single training run"""
+    
+    ACTIVE_STATES = ('queued', 'running')
+    
+    def __init__(self, model_type: str, days: int = 30, epochs: int = None, batch_size: int = None,
+                 incremental: bool = False):
+        self.id = uuid.uuid4().hex[:12]
+        self.model_type = model_type
+        self.days = days
+        self.epochs = epochs
+        self.batch_size = batch_size
+        self.incremental = incremental
+        
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.current_model = None
+        self.epoch = 0
+        self.total_epochs = None
+        self.metrics = {}
+        self.result = None
+        self.error = None
+        
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self._started_monotonic = None
+        self._fit_started_monotonic = None
+        self._finished_monotonic = None
+        
+        self._cancel_event = threading.Event()  # Read from Keras callbacks in worker threads
+        self._subscribers = set()
+        self._loop = asyncio.get_event_loop()
+        self.task: Optional[asyncio.Task] = None
+    
+    @property
+    def is_active(self) -> bool:
+        return self.status in self.ACTIVE_STATES
+    
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_event.is_set()
+    
+    def request_cancel(self):
+        """Ask the run to stop at the next epoch or stage boundary"""
+        self._cancel_event.set()
+        self._publish()
+    
+    def raise_if_cancelled(self):
+        if self.cancel_requested:
+            raise JobCancelled(f"Training job {self.id} cancelled")
+    
+    def set_stage(self, stage: str):
+        """Move to a new stage; stage boundaries are cancellation points"""
+        self.raise_if_cancelled()
+        self.stage = stage
+        self._publish()
+    
+    def mark_running(self):
+        self.status = 'running'
+        self.started_at = datetime.now()
+        self._started_monotonic = time.monotonic()
+        self._publish()
+    
+    def start_fit(self, model_name: str, total_epochs: Optional[int]):
+        self.current_model = model_name
+        self.stage = 'training'
+        self.epoch = 0
+        self.total_epochs = total_epochs
+        self._fit_started_monotonic = time.monotonic()
+        self._publish()
+    
+    def report_epoch(self, epoch: int, logs: Dict[str, Any]):
+        self.epoch = epoch
+        self.metrics = {k: float(v) for k, v in logs.items() if isinstance(v, (int, float))}
+        self._publish()
+    
+    def finish(self, status: str, result: Any = None, error: Optional[str] = None):
+        self.status = status
+        self.stage = status
+        self.result = result
+        self.error = error
+        self.finished_at = datetime.now()
+        self._finished_monotonic = time.monotonic()
+        self._publish()
+    
+    @property
+    def progress(self) -> float:
+        if self.status == 'completed':
+            return 1.0
+        if not self.total_epochs:
+            return 0.0
+        return min(1.0, self.epoch / self.total_epochs)
+    
+    @property
+    def elapsed_seconds(self) -> float:
+        if self._started_monotonic is None:
+            return 0.0
+        end = self._finished_monotonic or time.monotonic()
+        return end - self._started_monotonic
+    
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """Remaining fit time extrapolated from the average epoch duration so far"""
+        if not self.is_active or not self.epoch or not self.total_epochs or self._fit_started_monotonic is None:
+            return None
+        per_epoch = (time.monotonic() - self._fit_started_monotonic) / self.epoch
+        # Early stopping can only shorten this
+        return max(0.0, per_epoch * (self.total_epochs - self.epoch))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        eta = self.eta_seconds
+        return {
+            "job_id": self.id,
+            "model_type": self.model_type,
+            "status": self.status,
+            "stage": self.stage,
+            "current_model": self.current_model,
+            "days": self.days,
+            "incremental": self.incremental,
+            "epoch": self.epoch,
+            "total_epochs": self.total_epochs,
+            "progress": round(self.progress, 4),
+            "metrics": self.metrics,
+            "elapsed_seconds": round(self.elapsed_seconds, 2),
+            "eta_seconds": round(eta, 2) if eta is not None else None,
+            "cancel_requested": self.cancel_requested,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "result": self.result,
+            "error": self.error
+        }
+    
+    def subscribe(self) -> asyncio.Queue:
+        """Register a progress listener; receives a snapshot on every update"""
+        queue = asyncio.Queue(maxsize=100)
+        self._subscribers.add(queue)
+        queue.put_nowait(self.to_dict())
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+    
+    def _publish(self):
+        if not self._subscribers:
+            return
+        snapshot = self.to_dict()
+        for queue in list(self._subscribers):
+            # Progress is reported from training threads, so hop onto the loop
+            self._loop.call_soon_threadsafe(self._offer, queue, snapshot)
+    
+    @staticmethod
+    def _offer(queue: asyncio.Queue, snapshot: Dict[str, Any]):
+        if queue.full():
+            # Slow consumer: drop the oldest snapshot, only the latest matters
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        queue.put_nowait(snapshot)
+
+class TrainingJobManager:
+    """Runs training jobs with a concurrency limit and per-model coalescing"""
+    
+    TRAIN_METHODS = {
+        'purchase_prediction': 'train_purchase_model',
+        'recommendation': 'train_recommendation_model',
+        'anomaly_detection': 'train_anomaly_model',
+        'segmentation': 'train_segmentation_model'
+    }
+    
+    def __init__(self, trainer, max_concurrent: int = None, history_size: int = None):
+        self.trainer = trainer
+        self.max_concurrent = max_concurrent or config.TRAINING_MAX_CONCURRENT_JOBS
+        self.history_size = history_size or config.TRAINING_JOB_HISTORY
+        self.jobs: "OrderedDict[str, TrainingJob]" = OrderedDict()
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+    
+    def submit(self, model_type: str, days: int = 30, epochs: int = None, batch_size: int = None,
+               incremental: bool = False) -> Tuple[TrainingJob, bool]:
+        """Queue a training job; returns (job, created) where created is False if coalesced"""
+        if model_type not in self.TRAIN_METHODS:
+            raise ValueError(f"Unknown model type: {model_type}")
+        
+        existing = self.active_job_for(model_type)
+        if existing:
+            logger.info(f"🔁 Training request for {model_type} coalesced into running job {existing.id}")
+            return existing, False
+        
+        job = TrainingJob(model_type, days=days, epochs=epochs, batch_size=batch_size, incremental=incremental)
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job))
+        logger.info(f"📋 Training job {job.id} queued for {model_type}")
+        return job, True
+    
+    def submit_all(self, days: int = 30, epochs: int = None, batch_size: int = None,
+                   incremental: bool = False) -> List[Tuple[TrainingJob, bool]]:
+        """Queue one job per model type"""
+        return [self.submit(model_type, days, epochs, batch_size, incremental) for model_type in self.TRAIN_METHODS]
+    
+    def active_job_for(self, model_type: str) -> Optional[TrainingJob]:
+        for job in self.jobs.values():
+            if job.model_type == model_type and job.is_active:
+                return job
+        return None
+    
+    def get(self, job_id: str) -> Optional[TrainingJob]:
+        return self.jobs.get(job_id)
+    
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        return [job.to_dict() for job in reversed(self.jobs.values())]
+    
+    def cancel(self, job_id: str) -> Optional[TrainingJob]:
+        job = self.jobs.get(job_id)
+        if not job or not job.is_active:
+            return job
+        
+        job.request_cancel()
+        if job.status == 'queued' and job.task:
+            # Not started yet, nothing to unwind
+            job.task.cancel()
+        logger.info(f"🛑 Cancellation requested for training job {job.id} ({job.model_type})")
+        return job
+    
+    async def shutdown(self):
+        """Cancel all active jobs and wait for them to unwind"""
+        active = [job for job in self.jobs.values() if job.is_active]
+        for job in active:
+            self.cancel(job.id)
+        tasks = [job.task for job in active if job.task]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _run(self, job: TrainingJob):
+        try:
+            async with self._semaphore:
+                job.raise_if_cancelled()
+                job.mark_running()
+                logger.info(f"🚀 Training job {job.id} started: {job.model_type} (son {job.days} gün)")
+                
+                train = getattr(self.trainer, self.TRAIN_METHODS[job.model_type])
+                result = await train(days=job.days, epochs=job.epochs, batch_size=job.batch_size,
+                                     job=job, incremental=job.incremental)
+            
+            if result is None:
+                job.finish('skipped', error="No training data available")
+                logger.warning(f"⚠️ Training job {job.id} skipped: no training data")
+            else:
+                job.finish('completed', result=result)
+                logger.info(f"✅ Training job {job.id} completed in {job.elapsed_seconds:.1f}s")
+        except (JobCancelled, asyncio.CancelledError):
+            job.finish('cancelled')
+            logger.info(f"🛑 Training job {job.id} cancelled")
+        except Exception as e:
+            job.finish('failed', error=str(e))
+            logger.error(f"❌ Training job {job.id} failed: {e}", exc_info=True)
+        finally:
+            self._prune_history()
+    
+    def _prune_history(self):
+        finished = [job_id for job_id, job in self.jobs.items() if not job.is_active]
+        for job_id in finished[:max(0, len(finished) - self.history_size)]:
+            del self.jobs[job_id]
@@ -1,257 +1,670 @@
+import aiomysql
+import numpy as np
 import pymysql
-import pymysql.cursors
+import pymysql.converters
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable
 import asyncio
-from contextlib import contextmanager
-import threading
+import os
+import random
+import re
+import tempfile
+import time
+from collections import deque
+from contextlib import asynccontextmanager
 
 logger = logging.getLogger(__name__)
 
+# Errors after which a connection is not trusted any more (a timed-out statement may still be running on it)
+CONNECTION_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError, ConnectionError, OSError, asyncio.TimeoutError)
+
+def _sql_literal(value: Any) -> str:
+    """Escaped SQL literal for a Python or numpy scalar"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    return pymysql.converters.escape_item(value, 'utf8mb4')
+
+def _load_data_field(value: Any) -> str:
+    """Field for LOAD DATA ... FIELDS ENCLOSED BY '"' ESCAPED BY '\\'"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, bool):
+        value = int(value)
+    text = str(value)
+    for char, escaped in (('\\', '\\\\'), ('"', '\\"'), ('\n', '\\n'), ('\r', '\\r'), ('\0', '\\0')):
+        text = text.replace(char, escaped)
+    return f'"{text}"'
+
+class PoolTimeout(Exception):
+    """No connection became available within the acquire timeout"""
+    pass
+
+class QueryStats:
+    """Rolling query latency and pool wait metrics"""
+    
+    def __init__(self, window: int = 1000):
+        self.latencies = deque(maxlen=window)
+        self.waits = deque(maxlen=window)
+        self.queries = 0
+        self.errors = 0
+        self.timeouts = 0
+    
+    def record(self, latency: float, wait: float, ok: bool = True):
+        self.queries += 1
+        if not ok:
+            self.errors += 1
+        self.latencies.append(latency)
+        self.waits.append(wait)
+    
+    @staticmethod
+    def _percentile(values, q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = list(self.latencies)
+        waits = list(self.waits)
+        return {
+            "queries": self.queries,
+            "errors": self.errors,
+            "acquire_timeouts": self.timeouts,
+            "latency_ms": {
+                "avg": round(1000 * sum(latencies) / len(latencies), 2) if latencies else 0.0,
+                "p50": round(1000 * self._percentile(latencies, 0.5), 2),
+                "p95": round(1000 * self._percentile(latencies, 0.95), 2),
+                "max": round(1000 * max(latencies), 2) if latencies else 0.0
+            },
+            "acquire_wait_ms": {
+                "avg": round(1000 * sum(waits) / len(waits), 2) if waits else 0.0,
+                "p95": round(1000 * self._percentile(waits, 0.95), 2)
+            }
+        }
+
+class AsyncConnectionPool:
+    """Bounded asyncio pool of aiomysql connections
+    
+    Idle connections are validated with a ping only when they sat unused for longer
+    than validate_interval, instead of on every checkout.
+    """
+    
+    def __init__(self, connect_kwargs: Dict[str, Any], maxsize: int = 5, acquire_timeout: float = 10.0,
+                 validate_interval: float = 30.0):
+        self.connect_kwargs = connect_kwargs
+        self.maxsize = maxsize
+        self.acquire_timeout = acquire_timeout
+        self.validate_interval = validate_interval
+        self._free = deque()  # (connection, last_used monotonic), most recently used last
+        self._size = 0
+        self._cond = asyncio.Condition()
+        self._closed = False
+    
+    @property
+    def size(self) -> int:
+        return self._size
+    
+    @property
+    def free(self) -> int:
+        return len(self._free)
+    
+    async def _connect(self):
+        return await aiomysql.connect(**self.connect_kwargs)
+    
+    async def acquire(self, timeout: float = None):
+        """Check out a connection, waiting at most timeout seconds for a free slot"""
+        if self._closed:
+            raise Exception("Connection pool is closed")
+        timeout = self.acquire_timeout if timeout is None else timeout
+        
+        conn, last_used = None, None
+        async with self._cond:
+            deadline = time.monotonic() + timeout
+            while True:
+                if self._free:
+                    conn, last_used = self._free.pop()
+                    break
+                if self._size < self.maxsize:
+                    self._size += 1  # Reserve the slot, connect outside the lock
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No database connection available within {timeout}s (pool size {self.maxsize})")
+                try:
+                    await asyncio.wait_for(self._cond.wait(), remaining)
+                except asyncio.TimeoutError:
+                    raise PoolTimeout(f"No database connection available within {timeout}s (pool size {self.maxsize})")
+        
+        try:
+            if conn is not None and time.monotonic() - last_used > self.validate_interval:
+                try:
+                    await conn.ping(reconnect=False)
+                except Exception:
+                    conn.close()
+                    conn = None
+            if conn is None:
+                conn = await self._connect()
+            return conn
+        except BaseException:
+            if conn is not None:
+                conn.close()
+            await self._forget()
+            raise
+    
+    async def release(self, conn, discard: bool = False):
+        """Return a connection; discarded (or closed) connections free their slot"""
+        if discard or conn.closed or self._closed:
+            conn.close()
+            await self._forget()
+            return
+        async with self._cond:
+            self._free.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    async def _forget(self):
+        async with self._cond:
+            self._size -= 1
+            self._cond.notify()
+    
+    @asynccontextmanager
+    async def connection(self, timeout: float = None):
+        conn = await self.acquire(timeout)
+        discard = False
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            discard = True
+            raise
+        except asyncio.CancelledError:
+            # Query state unknown after cancellation
+            discard = True
+            raise
+        finally:
+            await self.release(conn, discard=discard)
+    
+    async def close(self):
+        self._closed = True
+        async with self._cond:
+            while self._free:
+                conn, _ = self._free.pop()
+                try:
+                    await conn.ensure_closed()
+                except Exception:
+                    conn.close()
+                self._size -= 1
+            self._cond.notify_all()
+
+class WorkloadPool:
+    """Connection pools, limits and metrics of one workload (realtime, batch, analytics, ...)
+    
+    pool goes to the primary; read_pool is a separate pool on the replica when reads of
+    this workload are routed there, otherwise the same pool.
+    """
+    
+    def __init__(self, name: str, pool: AsyncConnectionPool, read_pool: AsyncConnectionPool,
+                 query_timeout: float, priority: int):
+        self.name = name
+        self.pool = pool
+        self.read_pool = read_pool
+        self.query_timeout = query_timeout
+        self.priority = priority
+        self.stats = QueryStats()
+        self.waiting = 0  # Callers currently waiting for a connection
+    
+    @property
+    def pools(self) -> List[AsyncConnectionPool]:
+        return [self.pool] if self.read_pool is self.pool else [self.pool, self.read_pool]
+    
+    def to_dict(self) -> Dict[str, Any]:
+        pool_info = lambda pool: {"size": pool.size, "free": pool.free, "max": pool.maxsize}
+        return {
+            **self.stats.to_dict(),
+            "priority": self.priority,
+            "waiting": self.waiting,
+            "pool": pool_info(self.pool),
+            "replica_pool": pool_info(self.read_pool) if self.read_pool is not self.pool else None
+        }
+
+# Statements that may run on a read replica
+_READ_STATEMENT = re.compile(r'^\s*(\(\s*)*(SELECT|WITH|SHOW|DESCRIBE|EXPLAIN)\b', re.IGNORECASE)
+
 class DBConnector:
-    def __init__(self, host: str, port: int, user: str, password: str, database: str, pool_size: int = 5):
+    """Async MySQL access with one connection pool per workload
+    
+    workloads maps a name to its settings: pool_size, acquire_timeout, query_timeout,
+    priority (higher first) and use_replica (route reads to replica_host). Every call
+    takes a workload name; unknown or missing names use default_workload. Without
+    workloads there is a single 'default' workload built from pool_size and the timeouts.
+    
+    Predictions and recommendations are written as latest state per user (upserts) plus
+    an append-only history that keeps history_sample_rate of the rows.
+    """
+    
+    def __init__(self, host: str, port: int, user: str, password: str, database: str, pool_size: int = 5,
+                 acquire_timeout: float = 10.0, query_timeout: float = 30.0, validate_interval: float = 30.0,
+                 max_streams: int = 2, local_infile: bool = False, bulk_max_statement_bytes: int = 1024 * 1024,
+                 bulk_load_threshold: int = 50000, bulk_load_chunk_rows: int = 100000,
+                 workloads: Optional[Dict[str, Dict[str, Any]]] = None, default_workload: Optional[str] = None,
+                 replica_host: Optional[str] = None, replica_port: Optional[int] = None,
+                 history_sample_rate: float = 1.0):
         self.host = host
         self.port = port
         self.user = user
         self.password = password
         self.database = database
         self.pool_size = pool_size
-        self.pool = []
-        self.pool_lock = threading.Lock()
-        self._create_pool()
-    
-    def _create_pool(self):
-        """Create connection pool"""
-        self.pool = []
-        for _ in range(self.pool_size):
-            try:
-                conn = pymysql.connect(
-                    host=self.host,
-                    port=self.port,
-                    user=self.user,
-                    password=self.password,
-                    database=self.database,
-                    charset='utf8mb4',
-                    cursorclass=pymysql.cursors.DictCursor,
-                    autocommit=False,
-                    connect_timeout=10,
-                    read_timeout=30,
-                    write_timeout=30
-                )
-                self.pool.append(conn)
-            except Exception as e:
-                logger.error(f"Error creating connection in pool: {e}")
-                raise
+        self.query_timeout = query_timeout
+        self.local_infile = local_infile
+        self.bulk_max_statement_bytes = bulk_max_statement_bytes
+        self.bulk_load_threshold = bulk_load_threshold
+        self.bulk_load_chunk_rows = bulk_load_chunk_rows
+        self.history_sample_rate = history_sample_rate
+        self.replica_host = replica_host or None
+        self.replica_port = replica_port or port
+        
+        connect_kwargs = dict(
+            host=host,
+            port=port,
+            user=user,
+            password=password,
+            db=database,
+            charset='utf8mb4',
+            cursorclass=aiomysql.DictCursor,
+            autocommit=False,
+            connect_timeout=10,
+            local_infile=local_infile
+        )
+        replica_kwargs = {**connect_kwargs, 'host': self.replica_host, 'port': self.replica_port, 'local_infile': False}
+        
+        if not workloads:
+            workloads = {'default': {}}
+        self.workloads: Dict[str, WorkloadPool] = {}
+        for name, spec in workloads.items():
+            size = spec.get('pool_size', pool_size)
+            timeout = spec.get('acquire_timeout', acquire_timeout)
+            pool = AsyncConnectionPool(connect_kwargs, maxsize=size, acquire_timeout=timeout,
+                                       validate_interval=validate_interval)
+            read_pool = pool
+            if spec.get('use_replica') and self.replica_host:
+                read_pool = AsyncConnectionPool(replica_kwargs, maxsize=spec.get('replica_pool_size', size),
+                                                acquire_timeout=timeout, validate_interval=validate_interval)
+            self.workloads[name] = WorkloadPool(name, pool, read_pool, spec.get('query_timeout', query_timeout),
+                                                spec.get('priority', 0))
+        self.default_workload = default_workload if default_workload in self.workloads else next(iter(self.workloads))
+        
+        self._priority_cond = asyncio.Condition()
+        self._stream_slots = asyncio.Semaphore(max_streams)
     
-    def _get_connection(self):
-        """Get connection from pool"""
-        with self.pool_lock:
-            # Try to get a valid connection from pool
-            while self.pool:
-                conn = self.pool.pop()
-                try:
-                    # Check if connection is still alive
-                    conn.ping(reconnect=True)
-                    return conn
-                except:
-                    # Connection is dead, close it and try next
-                    try:
-                        conn.close()
-                    except:
-                        pass
-                    continue
-            
-            # Pool is empty or all connections are dead, create new one
-            return pymysql.connect(
-                host=self.host,
-                port=self.port,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor,
-                autocommit=False,
-                connect_timeout=10,
-                read_timeout=30,
-                write_timeout=30
-            )
+    @property
+    def pool(self) -> AsyncConnectionPool:
+        """Primary pool of the default workload"""
+        return self.workloads[self.default_workload].pool
     
-    def _return_connection(self, conn):
-        """Return connection to pool"""
-        if not conn:
-            return
-        
-        with self.pool_lock:
-            try:
-                # Check if connection is still alive before returning to pool
-                conn.ping(reconnect=False)
-                if len(self.pool) < self.pool_size:
-                    self.pool.append(conn)
-                else:
-                    conn.close()
-            except:
-                # Connection is dead, close it instead of returning to pool
-                try:
-                    conn.close()
-                except:
-                    pass
+    def _workload(self, name: Optional[str]) -> WorkloadPool:
+        return self.workloads.get(name) or self.workloads[self.default_workload]
     
     async def connect(self):
-        """Create database connection pool"""
+        """Open the connection pools (one connection each to verify settings)"""
         try:
-            # Test connection
-            test_conn = self._get_connection()
-            test_conn.ping()
-            self._return_connection(test_conn)
-            logger.info(f"✅ Database connected (pool size: {self.pool_size})")
+            for workload in self.workloads.values():
+                for pool in workload.pools:
+                    async with pool.connection() as conn:
+                        await conn.ping(reconnect=False)
+            sizes = ", ".join(f"{w.name}={w.pool.maxsize}" + (f"+{w.read_pool.maxsize} replica" if w.read_pool is not w.pool else "")
+                              for w in self.workloads.values())
+            logger.info(f"✅ Database connected (pools: {sizes})")
         except Exception as e:
             logger.error(f"❌ Database connection error: {e}")
             raise
     
     async def close(self):
-        """Close database connection pool"""
-        with self.pool_lock:
-            for conn in self.pool:
-                try:
-                    conn.close()
-                except:
-                    pass
-            self.pool = []
-        logger.info("Database connection pool closed")
+        """Close database connection pools"""
+        for workload in self.workloads.values():
+            for pool in workload.pools:
+                await pool.close()
+        logger.info("Database connection pools closed")
     
     async def ping(self) -> bool:
         """Check database connection"""
         try:
-            conn = self._get_connection()
-            try:
-                conn.ping()
-                return True
-            finally:
-                self._return_connection(conn)
-        except:
+            async with self.pool.connection() as conn:
+                await conn.ping(reconnect=False)
+            return True
+        except Exception:
             return False
     
-    def _execute(self, query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
-        """Execute query synchronously (will be run in thread pool)"""
+    def get_stats(self) -> Dict[str, Any]:
+        """Query latency and pool wait metrics per workload"""
+        return {
+            "replica": f"{self.replica_host}:{self.replica_port}" if self.replica_host else None,
+            "workloads": {name: workload.to_dict() for name, workload in self.workloads.items()}
+        }
+    
+    async def _yield_to_higher_priority(self, workload: WorkloadPool):
+        """Hold back while a higher-priority workload has callers waiting for a connection
+        
+        Bounded by the workload's acquire timeout so lower priorities are slowed, never starved.
+        """
+        def blocked() -> bool:
+            return any(w.waiting > 0 and w.priority > workload.priority for w in self.workloads.values())
+        
+        if not blocked():
+            return
+        async with self._priority_cond:
+            try:
+                await asyncio.wait_for(self._priority_cond.wait_for(lambda: not blocked()),
+                                       workload.pool.acquire_timeout)
+            except asyncio.TimeoutError:
+                pass
+    
+    @asynccontextmanager
+    async def _checkout(self, workload: WorkloadPool, read: bool):
+        """Connection from the workload's (read) pool, yields (conn, seconds waited)"""
+        wait_start = time.perf_counter()
+        await self._yield_to_higher_priority(workload)
+        pool = workload.read_pool if read else workload.pool
+        workload.waiting += 1
+        try:
+            conn = await pool.acquire()
+        finally:
+            workload.waiting -= 1
+            async with self._priority_cond:
+                self._priority_cond.notify_all()
+        wait = time.perf_counter() - wait_start
+        
+        discard = False
+        try:
+            yield conn, wait
+        except CONNECTION_ERRORS + (asyncio.CancelledError,):
+            discard = True
+            raise
+        finally:
+            await pool.release(conn, discard=discard)
+    
+    @staticmethod
+    async def _rollback(conn):
+        try:
+            await conn.rollback()
+        except Exception:
+            pass
+    
+    async def _run(self, operation, description: str, workload: Optional[str] = None, read: bool = False,
+                   idempotent: bool = True):
+        """Run operation(conn) on a workload's pool with retries on connection errors and latency accounting
+        
+        The connection is closed after any connection error or timeout. Timeouts are retried
+        for reads only: a write that timed out may still commit, and running it again would
+        apply it twice. With idempotent=False a write is not retried at all once it was sent,
+        only when getting the connection failed.
+        """
+        workload = self._workload(workload)
         max_retries = 3
         retry_count = 0
         
-        while retry_count < max_retries:
-            conn = None
+        while True:
+            sent = False
             try:
-                conn = self._get_connection()
-                # Ensure connection is alive
-                conn.ping(reconnect=True)
-                
-                with conn.cursor() as cursor:
-                    cursor.execute(query, params or ())
-                    if query.strip().upper().startswith('SELECT'):
-                        result = cursor.fetchall()
-                        self._return_connection(conn)
-                        return result
-                    else:
-                        conn.commit()
-                        self._return_connection(conn)
-                        return []
-            except (pymysql.Error, ConnectionError, OSError) as e:
-                if conn:
+                async with self._checkout(workload, read) as (conn, wait):
+                    query_start = time.perf_counter()
+                    sent = True
                     try:
-                        conn.close()
-                    except:
-                        pass
-                
+                        result = await asyncio.wait_for(operation(conn), workload.query_timeout)
+                    except asyncio.TimeoutError:
+                        # No rollback: the statement is still running; _checkout closes the connection
+                        workload.stats.record(time.perf_counter() - query_start, wait, ok=False)
+                        raise
+                    except Exception:
+                        # Connection errors too (deadlocks and lock wait timeouts are OperationalErrors)
+                        workload.stats.record(time.perf_counter() - query_start, wait, ok=False)
+                        await self._rollback(conn)
+                        raise
+                    workload.stats.record(time.perf_counter() - query_start, wait)
+                    return result
+            except PoolTimeout:
+                workload.stats.timeouts += 1
+                logger.error(f"Database pool '{workload.name}' exhausted: {description}")
+                raise
+            except CONNECTION_ERRORS as e:
+                if isinstance(e, asyncio.TimeoutError) and not read:
+                    logger.error(f"Database write timed out after {workload.query_timeout}s, not retried: {description}")
+                    raise
+                if sent and not read and not idempotent:
+                    logger.error(f"Database write failed after it was sent, not retried: {e}, {description}")
+                    raise
                 retry_count += 1
                 if retry_count >= max_retries:
-                    logger.error(f"Database query error after {max_retries} retries: {e}, query: {query[:100]}")
+                    logger.error(f"Database query error after {max_retries} retries: {e}, {description}")
                     raise
-                else:
-                    logger.warning(f"Database query error (retry {retry_count}/{max_retries}): {e}")
-                    import time
-                    time.sleep(0.5 * retry_count)  # Exponential backoff
+                logger.warning(f"Database query error (retry {retry_count}/{max_retries}): {e}")
+                await asyncio.sleep(0.5 * retry_count)  # Backoff
             except Exception as e:
-                if conn:
-                    try:
-                        conn.rollback()
-                        self._return_connection(conn)
-                    except:
-                        if conn:
-                            try:
-                                conn.close()
-                            except:
-                                pass
-                logger.error(f"Database query error: {e}, query: {query[:100]}")
+                logger.error(f"Database query error: {e}, {description}")
                 raise
     
-    async def execute(self, query: str, params: Optional[tuple] = None) -> List[Dict[str, Any]]:
-        """Execute query asynchronously"""
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._execute, query, params)
+    async def execute(self, query: str, params: Optional[tuple] = None, workload: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Execute query asynchronously (reads may go to the workload's replica pool)"""
+        async def operation(conn):
+            async with conn.cursor() as cursor:
+                await cursor.execute(query, params or ())
+                if cursor.description is not None:
+                    rows = await cursor.fetchall()
+                    await conn.commit()  # End the read snapshot so the next query sees fresh data
+                    return list(rows)
+                await conn.commit()
+                return []
+        
+        return await self._run(operation, f"query: {query.strip()[:100]}", workload,
+                               read=bool(_READ_STATEMENT.match(query)))
     
-    async def execute_many(self, query: str, params_list: List[tuple]) -> int:
+    async def execute_many(self, query: str, params_list: List[tuple], workload: Optional[str] = None) -> int:
         """Execute many queries"""
-        max_retries = 3
-        retry_count = 0
+        async def operation(conn):
+            async with conn.cursor() as cursor:
+                affected = await cursor.executemany(query, params_list)
+                await conn.commit()
+                return affected
+        
+        return await self._run(operation, f"executemany: {query.strip()[:100]}", workload)
+    
+    async def stream(self, query: str, params: Optional[tuple] = None, chunk_size: int = 5000,
+                     row_format: str = 'dict', timeout: Optional[float] = None,
+                     total_timeout: Optional[float] = None, workload: Optional[str] = None):
+        """Stream a result set in chunks from an unbuffered server-side cursor
         
-        while retry_count < max_retries:
-            conn = None
+        async for chunk in db.stream(...) yields lists of dicts (row_format='dict'), lists of
+        tuples ('tuple') or {column: np.ndarray} ('numpy'). The next chunk is read while the
+        caller processes the current one. timeout bounds each chunk fetch, total_timeout the
+        whole stream. Streams use their own connection (at most max_streams at a time) so a
+        long scan never holds a pool slot; leaving the loop early or cancelling drops that
+        connection, which is what stops the server from sending the rest. The connection goes
+        to the workload's read pool host (the replica if configured).
+        """
+        if row_format not in ('dict', 'tuple', 'numpy'):
+            raise ValueError(f"Unknown row_format: {row_format}")
+        workload = self._workload(workload)
+        timeout = timeout or workload.query_timeout
+        deadline = time.monotonic() + total_timeout if total_timeout else None
+        cursor_class = aiomysql.SSDictCursor if row_format == 'dict' else aiomysql.SSCursor
+        
+        def remaining() -> float:
+            if deadline is None:
+                return timeout
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise asyncio.TimeoutError(f"Stream exceeded {total_timeout}s")
+            return min(timeout, left)
+        
+        wait_start = time.perf_counter()
+        async with self._stream_slots:
+            start = time.perf_counter()
+            wait = start - wait_start
+            conn = await aiomysql.connect(**workload.read_pool.connect_kwargs)
+            finished = False
+            pending = None
             try:
-                conn = self._get_connection()
-                # Ensure connection is alive
-                conn.ping(reconnect=True)
+                cursor = await conn.cursor(cursor_class)
+                await asyncio.wait_for(cursor.execute(query, params or ()), remaining())
+                columns = [d[0] for d in cursor.description] if cursor.description else []
                 
-                loop = asyncio.get_event_loop()
-                def _execute_many():
-                    try:
-                        conn.ping(reconnect=True)  # Double check before executing
-                        with conn.cursor() as cursor:
-                            affected = cursor.executemany(query, params_list)
-                            conn.commit()
-                            return affected
-                    except Exception as e:
-                        conn.rollback()
-                        raise
-                result = await loop.run_in_executor(None, _execute_many)
-                self._return_connection(conn)
-                return result
-            except (pymysql.Error, ConnectionError, OSError) as e:
-                if conn:
-                    try:
-                        conn.close()
-                    except:
-                        pass
+                pending = asyncio.ensure_future(cursor.fetchmany(chunk_size))
+                while True:
+                    rows = await asyncio.wait_for(pending, remaining())
+                    if not rows:
+                        finished = True
+                        break
+                    pending = asyncio.ensure_future(cursor.fetchmany(chunk_size))
+                    
+                    if row_format == 'numpy':
+                        yield {name: np.asarray(values) for name, values in zip(columns, zip(*rows))}
+                    else:
+                        yield list(rows)
                 
-                retry_count += 1
-                if retry_count >= max_retries:
-                    logger.error(f"Database executemany error after {max_retries} retries: {e}")
-                    raise
-                else:
-                    logger.warning(f"Database executemany error (retry {retry_count}/{max_retries}): {e}")
-                    await asyncio.sleep(0.5 * retry_count)  # Exponential backoff
-            except Exception as e:
-                if conn:
-                    try:
-                        conn.rollback()
-                        self._return_connection(conn)
-                    except:
-                        if conn:
-                            try:
-                                conn.close()
-                            except:
-                                pass
-                logger.error(f"Database executemany error: {e}")
+                await cursor.close()
+            except Exception:
+                workload.stats.record(time.perf_counter() - start, wait, ok=False)
                 raise
+            else:
+                workload.stats.record(time.perf_counter() - start, wait)
+            finally:
+                if pending is not None and not pending.done():
+                    pending.cancel()
+                if finished:
+                    await conn.ensure_closed()
+                else:
+                    # Unread rows are still on the wire; closing the socket is the only cheap way out
+                    conn.close()
     
-    async def insert_predictions(self, predictions: List[Dict[str, Any]]):
-        """Insert predictions batch"""
+    def _insert_statements(self, table: str, columns: List[str], rows: Iterable[tuple],
+                           constants: Dict[str, str], on_duplicate: Optional[str]):
+        """Multi-row INSERT statements of at most bulk_max_statement_bytes; yields (sql, row_count)"""
+        head = f"INSERT INTO {table} ({', '.join(list(columns) + list(constants))}) VALUES "
+        tail = f" ON DUPLICATE KEY UPDATE {on_duplicate}" if on_duplicate else ""
+        constant_sql = "".join(f", {expression}" for expression in constants.values())
+        budget = self.bulk_max_statement_bytes - len(head.encode()) - len(tail.encode())
+        
+        values, size = [], 0
+        for row in rows:
+            literal = "(" + ", ".join(_sql_literal(v) for v in row) + constant_sql + ")"
+            length = len(literal.encode('utf-8')) + 2
+            if values and size + length > budget:
+                yield head + ",\n".join(values) + tail, len(values)
+                values, size = [], 0
+            values.append(literal)
+            size += length
+        if values:
+            yield head + ",\n".join(values) + tail, len(values)
+    
+    def _load_data_files(self, columns: List[str], rows: Iterable[tuple], directory: str):
+        """Write rows as LOAD DATA files of bulk_load_chunk_rows; yields (path, row_count)"""
+        chunk = []
+        part = 0
+        
+        def flush():
+            path = os.path.join(directory, f"part-{part:05d}.csv")
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.writelines(",".join(_load_data_field(v) for v in row) + "\n" for row in chunk)
+            return path
+        
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.bulk_load_chunk_rows:
+                yield flush(), len(chunk)
+                chunk = []
+                part += 1
+        if chunk:
+            yield flush(), len(chunk)
+    
+    async def _execute_statement(self, sql: str, description: str, workload: Optional[str] = None,
+                                 idempotent: bool = True) -> int:
+        """Run one literal statement (no parameter interpolation), retried like execute()"""
+        async def operation(conn):
+            async with conn.cursor() as cursor:
+                affected = await cursor.execute(sql)
+                await conn.commit()
+                return affected
+        
+        return await self._run(operation, description, workload, idempotent=idempotent)
+    
+    async def bulk_insert(self,
+                          table: str,
+                          columns: List[str],
+                          rows: Iterable[tuple],
+                          constants: Optional[Dict[str, str]] = None,
+                          on_duplicate: Optional[str] = None,
+                          use_load_data: Optional[bool] = None,
+                          workload: Optional[str] = None) -> Dict[str, Any]:
+        """Write rows with size-bounded multi-row INSERTs, or LOAD DATA LOCAL INFILE for big jobs
+        
+        constants maps extra columns to SQL expressions applied to every row (e.g. NOW()).
+        Every chunk is its own transaction. Upsert chunks (on_duplicate) are retried on
+        connection errors; plain INSERT and LOAD DATA chunks only if the connection failed
+        before the chunk was sent, since a chunk that committed would be inserted twice. LOAD DATA is used
+        when enabled and the job has at least bulk_load_threshold rows (or use_load_data=True);
+        it cannot upsert, so on_duplicate forces INSERTs. Returns row count, chunks and rows/s.
+        """
+        constants = constants or {}
+        rows = rows if isinstance(rows, list) else list(rows)
+        if not rows:
+            return {"rows": 0, "chunks": 0, "seconds": 0.0, "rows_per_second": 0.0, "method": None}
+        
+        if use_load_data is None:
+            use_load_data = self.local_infile and len(rows) >= self.bulk_load_threshold
+        use_load_data = use_load_data and self.local_infile and not on_duplicate
+        
+        start = time.perf_counter()
+        written = 0
+        chunks = 0
+        if use_load_data:
+            method = "load_data"
+            column_sql = ", ".join(columns)
+            set_sql = (" SET " + ", ".join(f"{c} = {e}" for c, e in constants.items())) if constants else ""
+            with tempfile.TemporaryDirectory(prefix=f"bulk_{table}_") as directory:
+                for path, count in self._load_data_files(columns, rows, directory):
+                    sql = (
+                        f"LOAD DATA LOCAL INFILE {_sql_literal(path)} INTO TABLE {table} "
+                        f"CHARACTER SET utf8mb4 "
+                        f"FIELDS TERMINATED BY ',' ENCLOSED BY '\"' ESCAPED BY '\\\\' "
+                        f"LINES TERMINATED BY '\\n' ({column_sql}){set_sql}"
+                    )
+                    await self._execute_statement(sql, f"load data into {table} ({count} rows)", workload,
+                                                  idempotent=False)
+                    written += count
+                    chunks += 1
+        else:
+            method = "multi_row_insert"
+            for sql, count in self._insert_statements(table, columns, rows, constants, on_duplicate):
+                await self._execute_statement(sql, f"bulk insert into {table} ({count} rows)", workload,
+                                              idempotent=bool(on_duplicate))
+                written += count
+                chunks += 1
+        
+        seconds = time.perf_counter() - start
+        rows_per_second = written / seconds if seconds > 0 else 0.0
+        logger.info(f"📦 {table}: {written} rows in {chunks} chunk(s) via {method}, {seconds:.2f}s ({rows_per_second:.0f} rows/s)")
+        return {
+            "rows": written,
+            "chunks": chunks,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(rows_per_second, 1),
+            "method": method
+        }
+    
+    def _history_sample(self, rows: List[tuple]) -> List[tuple]:
+        """Rows kept in the append-only history (history_sample_rate of them)"""
+        if self.history_sample_rate >= 1.0:
+            return rows
+        if self.history_sample_rate <= 0.0:
+            return []
+        return [row for row in rows if random.random() < self.history_sample_rate]
+    
+    async def insert_predictions(self, predictions: List[Dict[str, Any]], workload: Optional[str] = None):
+        """Upsert the latest prediction per user/type (ml_predictions), append a sample to the history"""
         if not predictions:
             return
         
-        query = """
-            INSERT INTO ml_predictions 
-            (userId, tenantId, predictionType, probability, metadata, createdAt)
-            VALUES (%s, %s, %s, %s, %s, NOW())
-        """
-        params = [
+        rows = [
             (
                 p['userId'],
                 p.get('tenantId', 1),
@@ -261,19 +674,27 @@ class DBConnector:
             )
             for p in predictions
         ]
-        await self.execute_many(query, params)
+        columns = ['userId', 'tenantId', 'predictionType', 'probability', 'metadata']
+        result = await self.bulk_insert(
+            'ml_predictions',
+            columns,
+            rows,
+            constants={'updatedAt': 'NOW()'},
+            on_duplicate="probability = VALUES(probability), metadata = VALUES(metadata), updatedAt = NOW()",
+            workload=workload
+        )
+        history = self._history_sample(rows)
+        if history:
+            await self.bulk_insert('ml_predictions_history', columns, history, constants={'createdAt': 'NOW()'},
+                                   workload=workload)
+        return result
     
-    async def insert_recommendations(self, recommendations: List[Dict[str, Any]]):
-        """Insert recommendations batch"""
+    async def insert_recommendations(self, recommendations: List[Dict[str, Any]], workload: Optional[str] = None):
+        """Upsert the current recommendations per user (ml_recommendations), append a sample to the history"""
         if not recommendations:
             return
         
-        query = """
-            INSERT INTO ml_recommendations 
-            (userId, tenantId, productIds, scores, metadata, createdAt)
-            VALUES (%s, %s, %s, %s, %s, NOW())
-        """
-        params = [
+        rows = [
             (
                 r['userId'],
                 r.get('tenantId', 1),
@@ -283,19 +704,63 @@ class DBConnector:
             )
             for r in recommendations
         ]
-        await self.execute_many(query, params)
+        columns = ['userId', 'tenantId', 'productIds', 'scores', 'metadata']
+        result = await self.bulk_insert(
+            'ml_recommendations',
+            columns,
+            rows,
+            constants={'createdAt': 'NOW()'},
+            on_duplicate=(
+                "productIds = VALUES(productIds), scores = VALUES(scores), "
+                "metadata = VALUES(metadata), updatedAt = NOW()"
+            ),
+            workload=workload
+        )
+        history = self._history_sample(rows)
+        if history:
+            await self.bulk_insert('ml_recommendations_history', columns, history, constants={'createdAt': 'NOW()'},
+                                   workload=workload)
+        return result
+    
+    async def prune_history(self, table: str, retention_days: int, chunk_rows: int = 5000,
+                            pause: float = 0.1, workload: Optional[str] = None) -> int:
+        """Delete history rows older than retention_days in chunks of chunk_rows
+        
+        The newest expired id is looked up once; every chunk is a short DELETE ... ORDER BY id
+        LIMIT transaction below it, with a pause in between, so locks and replication lag stay
+        bounded however much has to go.
+        """
+        rows = await self.execute(
+            f"SELECT MAX(id) AS max_id FROM {table} WHERE createdAt < DATE_SUB(NOW(), INTERVAL %s DAY)",
+            (retention_days,),
+            workload=workload
+        )
+        max_id = rows[0]['max_id'] if rows else None
+        if max_id is None:
+            return 0
+        
+        start = time.perf_counter()
+        deleted = 0
+        while True:
+            affected = await self._execute_statement(
+                f"DELETE FROM {table} WHERE id <= {int(max_id)} ORDER BY id LIMIT {int(chunk_rows)}",
+                f"prune {table}",
+                workload
+            )
+            deleted += affected
+            if affected < chunk_rows:
+                break
+            await asyncio.sleep(pause)
+        
+        logger.info(f"🧹 {table}: pruned {deleted} rows older than {retention_days} days in {time.perf_counter() - start:.1f}s")
+        return deleted
     
-    async def insert_anomalies(self, anomalies: List[Dict[str, Any]]):
+    async def insert_anomalies(self, anomalies: List[Dict[str, Any]], workload: Optional[str] = None):
         """Insert anomalies batch"""
         if not anomalies:
             return
         
-        query = """
-            INSERT INTO ml_anomalies 
-            (eventId, userId, tenantId, anomalyScore, anomalyType, metadata, createdAt)
-            VALUES (%s, %s, %s, %s, %s, %s, NOW())
-        """
-        params = [
+        rows = [
             (
                 a['eventId'],
                 a.get('userId'),
@@ -306,25 +771,20 @@ class DBConnector:
             )
             for a in anomalies
         ]
-        await self.execute_many(query, params)
+        return await self.bulk_insert(
+            'ml_anomalies',
+            ['eventId', 'userId', 'tenantId', 'anomalyScore', 'anomalyType', 'metadata'],
+            rows,
+            constants={'createdAt': 'NOW()'},
+            workload=workload
+        )
     
-    async def insert_segments(self, segments: List[Dict[str, Any]]):
+    async def insert_segments(self, segments: List[Dict[str, Any]], workload: Optional[str] = None):
         """Insert/update segments batch"""
         if not segments:
             return
         
-        query = """
-            INSERT INTO ml_segments 
-            (userId, tenantId, segmentId, segmentName, confidence, metadata, updatedAt)
-            VALUES (%s, %s, %s, %s, %s, %s, NOW())
-            ON DUPLICATE KEY UPDATE
-                segmentId = VALUES(segmentId),
-                segmentName = VALUES(segmentName),
-                confidence = VALUES(confidence),
-                metadata = VALUES(metadata),
-                updatedAt = NOW()
-        """
-        params = [
+        rows = [
             (
                 s['userId'],
                 s.get('tenantId', 1),
@@ -335,5 +795,14 @@ class DBConnector:
             )
             for s in segments
         ]
-        await self.execute_many(query, params)
-
+        return await self.bulk_insert(
+            'ml_segments',
+            ['userId', 'tenantId', 'segmentId', 'segmentName', 'confidence', 'metadata'],
+            rows,
+            constants={'updatedAt': 'NOW()'},
+            on_duplicate=(
+                "segmentId = VALUES(segmentId), segmentName = VALUES(segmentName), "
+                "confidence = VALUES(confidence), metadata = VALUES(metadata), updatedAt = NOW()"
+            ),
+            workload=workload
+        )
@@ -0,0 +1,171 @@
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def _relu(x: np.ndarray) -> np.ndarray:
+    return np.maximum(x, 0, out=x)
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    with np.errstate(over='ignore'):
+        np.negative(x, out=x)
+        np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+def _tanh(x: np.ndarray) -> np.ndarray:
+    return np.tanh(x, out=x)
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    x -= x.max(axis=-1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': _relu,
+    'sigmoid': _sigmoid,
+    'tanh': _tanh,
+    'softmax': _softmax
+}
+
+# Layers that are the identity at inference time
+PASSTHROUGH_LAYERS = ('InputLayer', 'Dropout', 'GaussianNoise', 'GaussianDropout', 'AlphaDropout')
+
+def read_architecture(path: str) -> Tuple[List[Dict[str, Any]], Dict[Tuple[str, str], np.ndarray]]:
+    """Layer specs (class_name, name, inbound layer names, config) of a .mmw file's Keras
+    architecture and its memory-mapped weights keyed by (layer name, weight name)"""
+    from utils.weight_file import read_weight_file
+    
+    header, arrays = read_weight_file(path)
+    architecture = json.loads(header['architecture'])
+    specs = []
+    for layer in architecture['config']['layers']:
+        inbound = None
+        if layer.get('inbound_nodes'):
+            inbound = [node[0] for node in layer['inbound_nodes'][0]]
+        specs.append({
+            'class_name': layer['class_name'],
+            'name': layer.get('name') or layer['config']['name'],
+            'inbound': inbound,
+            'config': layer['config']
+        })
+    
+    # Weight names look like "<layer>/kernel:0" or "<layer>/<cell>/kernel:0"
+    weights = {}
+    for entry, array in zip(header['arrays'], arrays):
+        parts = entry['name'].split('/')
+        weights[(parts[0], parts[-1].split(':')[0])] = np.asarray(array)  # Plain view of the map, no copy
+    return specs, weights
+
+class DenseNetwork:
+    """Inference-only runtime for chains of Dense layers (the autoencoders)
+    
+    Each layer is one float32 matmul plus bias and an in-place activation; Dropout and the
+    other PASSTHROUGH_LAYERS are dropped. Built from a live Keras model or straight from a
+    .mmw weight file, whose memory maps are used as is (no TensorFlow needed, pages shared
+    between workers). output_layer cuts the chain after that layer, e.g. 'encoded'.
+    """
+    
+    def __init__(self, layers: List[Tuple[str, np.ndarray, Optional[np.ndarray], str]]):
+        if not layers:
+            raise ValueError("DenseNetwork needs at least one Dense layer")
+        for name, _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation '{activation}' in layer {name}")
+        self.layers = layers  # (name, kernel, bias or None, activation)
+        self.input_dim = layers[0][1].shape[0]
+        self.output_dim = layers[-1][1].shape[1]
+    
+    @staticmethod
+    def _chain(layer_specs: List[Dict[str, Any]], output_layer: Optional[str]) -> List[Dict[str, Any]]:
+        """Dense layers from input to output_layer, checking the graph is a single chain"""
+        dense, previous = [], None
+        for spec in layer_specs:
+            class_name, name = spec['class_name'], spec['name']
+            inbound = spec.get('inbound')
+            if inbound is not None and previous is not None and inbound != [previous]:
+                raise ValueError(f"Layer {name} is not part of a single chain (inputs {inbound})")
+            previous = name
+            if class_name in PASSTHROUGH_LAYERS:
+                pass
+            elif class_name == 'Dense':
+                dense.append(spec)
+            else:
+                raise ValueError(f"Unsupported layer {name} ({class_name})")
+            if name == output_layer:
+                return dense
+        if output_layer is not None:
+            raise ValueError(f"Output layer {output_layer} not found")
+        return dense
+    
+    @classmethod
+    def from_keras(cls, keras_model, output_layer: Optional[str] = None) -> 'DenseNetwork':
+        """Copy the weights of a built Keras model"""
+        specs = []
+        for layer in keras_model.layers:
+            inbound = None
+            nodes = getattr(layer, 'inbound_nodes', None) or []
+            if nodes and getattr(nodes[0], 'inbound_layers', None):
+                inbound_layers = nodes[0].inbound_layers
+                inbound_layers = inbound_layers if isinstance(inbound_layers, list) else [inbound_layers]
+                inbound = [l.name for l in inbound_layers]
+            specs.append({
+                'class_name': layer.__class__.__name__,
+                'name': layer.name,
+                'inbound': inbound,
+                'layer': layer
+            })
+        
+        layers = []
+        for spec in cls._chain(specs, output_layer):
+            layer = spec['layer']
+            weights = layer.get_weights()
+            kernel = np.ascontiguousarray(weights[0], dtype=np.float32)
+            bias = np.asarray(weights[1], dtype=np.float32) if layer.use_bias else None
+            layers.append((layer.name, kernel, bias, layer.activation.__name__))
+        return cls(layers)
+    
+    @classmethod
+    def from_weight_file(cls, path: str, output_layer: Optional[str] = None) -> 'DenseNetwork':
+        """Use the architecture and memory-mapped weights of a .mmw file"""
+        specs, weights = read_architecture(path)
+        layers = []
+        for spec in cls._chain(specs, output_layer):
+            name, layer_config = spec['name'], spec['config']
+            kernel = weights.get((name, 'kernel'))
+            if kernel is None:
+                raise ValueError(f"No weights for layer {name} in {path}")
+            bias = weights.get((name, 'bias')) if layer_config.get('use_bias', True) else None
+            layers.append((name, kernel, bias, layer_config.get('activation', 'linear')))
+        return cls(layers)
+    
+    def predict(self, x: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+        """Forward pass in float32, batch_size rows at a time to bound the temporaries"""
+        x = np.asarray(x, dtype=np.float32)
+        if x.ndim != 2 or x.shape[1] != self.input_dim:
+            raise ValueError(f"Expected input of shape (n, {self.input_dim}), got {x.shape}")
+        if len(x) <= batch_size:
+            return self._forward(x)
+        
+        output = np.empty((len(x), self.output_dim), dtype=np.float32)
+        for start in range(0, len(x), batch_size):
+            output[start:start + batch_size] = self._forward(x[start:start + batch_size])
+        return output
+    
+    def _forward(self, x: np.ndarray) -> np.ndarray:
+        for _, kernel, bias, activation in self.layers:
+            x = x @ kernel  # New array: the caller's input is never modified in place
+            if bias is not None:
+                x += bias
+            x = ACTIVATIONS[activation](x)
+        return x
+    
+    def describe(self) -> List[Dict[str, Any]]:
+        return [
+            {"name": name, "units": int(kernel.shape[1]), "activation": activation}
+            for name, kernel, _, activation in self.layers
+        ]
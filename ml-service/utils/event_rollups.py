@@ -0,0 +1,264 @@
+import hashlib
+import json
+import logging
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Data-quality counters stored next to the per-event-type counts
+QUALITY_FIELDS = ('_all', '_null_user', '_empty_data', '_null_session')
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch (2**p one-byte registers, ~1.04/sqrt(2**p) error)"""
+    
+    def __init__(self, p: int = 14, registers: Optional[np.ndarray] = None):
+        self.p = p
+        self.m = 1 << p
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+    
+    @staticmethod
+    def _hash(value: Any) -> int:
+        return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+    
+    def add(self, values: Iterable[Any]):
+        hashes = np.array([self._hash(v) for v in values], dtype=np.uint64)
+        if len(hashes) == 0:
+            return
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = (hashes << np.uint64(self.p)) | np.uint64(1 << (self.p - 1))  # Sentinel bit caps the rank
+        # Rank = leading zeros of the remaining bits + 1
+        rank = (64 - np.floor(np.log2(rest.astype(np.float64))).astype(np.int64)).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+    
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        return HyperLogLog(self.p, np.maximum(self.registers, other.registers))
+    
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros > 0:
+            estimate = self.m * np.log(self.m / zeros)  # Linear counting for small cardinalities
+        return int(round(estimate))
+
+def _parse_event_day(event: Dict[str, Any]) -> str:
+    """UTC day (YYYYMMDD) of an event's timestamp, today if missing or unparseable"""
+    timestamp = event.get('timestamp')
+    try:
+        if isinstance(timestamp, (int, float)):
+            moment = datetime.fromtimestamp(timestamp / 1000 if timestamp > 1e11 else timestamp, tz=timezone.utc)
+        elif isinstance(timestamp, str):
+            moment = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+        else:
+            raise ValueError
+        return moment.astimezone(timezone.utc).strftime('%Y%m%d')
+    except (ValueError, OverflowError, OSError):
+        return datetime.now(timezone.utc).strftime('%Y%m%d')
+
+def _window_days(days: int) -> List[str]:
+    today = datetime.now(timezone.utc).date()
+    return [(today - timedelta(days=i)).strftime('%Y%m%d') for i in range(days)]
+
+class EventRollups:
+    """Per-day event counters and distinct user/device sketches kept by the realtime processor
+    
+    Every day has a counts hash (events per eventType plus the QUALITY_FIELDS counters) and
+    HyperLogLog sketches of distinct users and devices, overall and per event type. With
+    backend='redis' they are Redis hashes and PFADD sketches (~12KB each, expiring after
+    retention_days); backend='local' keeps numpy sketches in memory, snapshotted to local_path.
+    Range queries merge the daily entries, so they cost O(days) whatever the event volume.
+    The day recording started is kept too, so callers can tell whether a window is complete.
+    """
+    
+    def __init__(self, redis_connector=None, backend: str = 'redis', prefix: str = 'ml:rollup',
+                 retention_days: int = 90, local_path: Optional[str] = None):
+        if backend not in ('redis', 'local'):
+            raise ValueError(f"Unknown rollup backend: {backend}")
+        self.redis = redis_connector
+        self.backend = backend
+        self.prefix = prefix
+        self.retention_days = retention_days
+        self.local_path = local_path
+        self._counts: Dict[str, Counter] = defaultdict(Counter)
+        self._sketches: Dict[tuple, HyperLogLog] = {}  # (day, kind, event_type) -> sketch
+        self._since: Optional[str] = None  # Day of the first recorded batch (local backend)
+    
+    def _key(self, day: str, kind: str, event_type: Optional[str] = None) -> str:
+        return f"{self.prefix}:{day}:{kind}" + (f":{event_type}" if event_type is not None else "")
+    
+    @staticmethod
+    def _aggregate(events: List[Dict[str, Any]]):
+        """Counts and distinct members of one batch, grouped by day"""
+        counts = defaultdict(Counter)
+        members = defaultdict(set)  # (day, kind, event_type or None) -> ids
+        for event in events:
+            day = _parse_event_day(event)
+            event_type = str(event.get('eventType') or 'unknown')
+            user_id = event.get('userId')
+            device_id = event.get('deviceId')
+            event_data = event.get('eventData')
+            
+            day_counts = counts[day]
+            day_counts['_all'] += 1
+            if user_id is None:
+                day_counts['_null_user'] += 1
+            else:
+                day_counts[event_type] += 1
+                members[(day, 'users', None)].add(str(user_id))
+                members[(day, 'users', event_type)].add(str(user_id))
+                if device_id is not None:
+                    members[(day, 'devices', None)].add(str(device_id))
+                    members[(day, 'devices', event_type)].add(str(device_id))
+            if event_data is None or event_data == {} or event_data == '{}':
+                day_counts['_empty_data'] += 1
+            if event.get('sessionId') is None:
+                day_counts['_null_session'] += 1
+        return counts, members
+    
+    async def record(self, events: List[Dict[str, Any]]):
+        """Add a batch of events (one Redis round trip per batch)"""
+        if not events:
+            return
+        counts, members = self._aggregate(events)
+        today = _window_days(1)[0]
+        
+        if self.backend == 'local':
+            self._since = self._since or today
+            for day, day_counts in counts.items():
+                self._counts[day].update(day_counts)
+            for key, ids in members.items():
+                self._sketches.setdefault(key, HyperLogLog()).add(ids)
+            self._prune_local()
+            return
+        
+        ttl = self.retention_days * 86400
+        pipe = self.redis.client.pipeline(transaction=False)
+        pipe.setnx(f"{self.prefix}:since", today)
+        for day, day_counts in counts.items():
+            key = self._key(day, 'counts')
+            for field, value in day_counts.items():
+                pipe.hincrby(key, field, value)
+            pipe.expire(key, ttl)
+        for (day, kind, event_type), ids in members.items():
+            key = self._key(day, kind, event_type)
+            pipe.pfadd(key, *ids)
+            pipe.expire(key, ttl)
+        await pipe.execute()
+    
+    def _prune_local(self):
+        cutoff = set(_window_days(self.retention_days))
+        for day in [d for d in self._counts if d not in cutoff]:
+            del self._counts[day]
+        for key in [k for k in self._sketches if k[0] not in cutoff]:
+            del self._sketches[key]
+    
+    async def covers(self, days: int) -> bool:
+        """Whether every day of the last days was recorded in full (recording started before them)"""
+        if days > self.retention_days:
+            return False
+        since = self._since if self.backend == 'local' else await self.redis.client.get(f"{self.prefix}:since")
+        if isinstance(since, bytes):
+            since = since.decode()
+        return since is not None and since < _window_days(days)[-1]
+    
+    async def query(self, days: int = 30) -> Dict[str, Any]:
+        """Event counts, distinct users/devices (estimates) and quality counters of the last days"""
+        days = max(1, min(days, self.retention_days))
+        window = _window_days(days)
+        
+        if self.backend == 'local':
+            daily = [dict(self._counts.get(day, {})) for day in window]
+        else:
+            pipe = self.redis.client.pipeline(transaction=False)
+            for day in window:
+                pipe.hgetall(self._key(day, 'counts'))
+            daily = [{field: int(value) for field, value in counts.items()} for counts in await pipe.execute()]
+        
+        totals = Counter()
+        for counts in daily:
+            totals.update(counts)
+        event_types = sorted((t for t in totals if t not in QUALITY_FIELDS), key=lambda t: totals[t], reverse=True)
+        
+        # One merged distinct count per (kind, event type) over all days of the window
+        targets = [('users', None), ('devices', None)] + [(kind, t) for t in event_types for kind in ('users', 'devices')]
+        distinct = dict(zip(targets, await self._merged_counts(window, targets)))
+        
+        return {
+            "days": days,
+            "from_day": window[-1],
+            "to_day": window[0],
+            "total_events": sum(totals[t] for t in event_types),
+            "total_users": distinct[('users', None)],
+            "total_devices": distinct[('devices', None)],
+            "event_statistics": [
+                {
+                    "eventType": t,
+                    "count": totals[t],
+                    "unique_users": distinct[('users', t)],
+                    "unique_devices": distinct[('devices', t)]
+                }
+                for t in event_types
+            ],
+            "data_quality": {
+                "total_events": totals['_all'],
+                "null_user_events": totals['_null_user'],
+                "empty_data_events": totals['_empty_data'],
+                "null_session_events": totals['_null_session']
+            },
+            "daily": [
+                {"day": day, "events": counts.get('_all', 0)} for day, counts in zip(reversed(window), reversed(daily))
+            ],
+            "approximate": True
+        }
+    
+    async def _merged_counts(self, window: List[str], targets) -> List[int]:
+        if self.backend == 'local':
+            results = []
+            for kind, event_type in targets:
+                merged = HyperLogLog()
+                for day in window:
+                    sketch = self._sketches.get((day, kind, event_type))
+                    if sketch is not None:
+                        merged = merged.merge(sketch)
+                results.append(merged.count())
+            return results
+        
+        # PFCOUNT over several keys counts their union without storing it
+        pipe = self.redis.client.pipeline(transaction=False)
+        for kind, event_type in targets:
+            pipe.pfcount(*[self._key(day, kind, event_type) for day in window])
+        return [int(count) for count in await pipe.execute()]
+    
+    def save(self):
+        """Snapshot the local backend to local_path (npz of stacked registers plus a JSON index)"""
+        if self.backend != 'local' or not self.local_path:
+            return
+        os.makedirs(os.path.dirname(self.local_path) or '.', exist_ok=True)
+        keys = list(self._sketches)
+        registers = np.stack([self._sketches[k].registers for k in keys]) if keys else np.zeros((0, HyperLogLog().m), dtype=np.uint8)
+        index = {"sketches": [list(k) for k in keys], "counts": {day: dict(c) for day, c in self._counts.items()},
+                 "since": self._since}
+        tmp_path = f"{self.local_path}.tmp.npz"
+        np.savez_compressed(tmp_path, registers=registers, index=np.array(json.dumps(index)))
+        os.replace(tmp_path, self.local_path)
+    
+    def load(self):
+        """Restore a local snapshot written by save()"""
+        if self.backend != 'local' or not self.local_path or not os.path.exists(self.local_path):
+            return
+        with np.load(self.local_path) as data:
+            index = json.loads(str(data['index']))
+            registers = data['registers']
+        for key, row in zip(index["sketches"], registers):
+            self._sketches[tuple(key)] = HyperLogLog(registers=row.copy())
+        for day, counts in index["counts"].items():
+            self._counts[day] = Counter(counts)
+        self._since = index.get("since")
+        self._prune_local()
+        logger.info(f"Event rollups restored from {self.local_path} ({len(self._counts)} days)")
@@ -0,0 +1,93 @@
+import numpy as np
+import os
+import logging
+from typing import Union
+
+logger = logging.getLogger(__name__)
+
+class IdMap:
+    """Raw id -> embedding row mapping stored as sorted int arrays
+    
+    keys holds the raw ids sorted, rows the embedding row of each key. Lookups are a
+    binary search (np.searchsorted) and work on memory-mapped arrays, so no Python dict
+    is built. Ids that are not in the map resolve to unknown_row (= len(map)), the
+    cold-start row at the end of the embedding table.
+    """
+    
+    def __init__(self, keys: np.ndarray, rows: np.ndarray):
+        self.keys = keys
+        self.rows = rows
+        self._row_ids = None
+    
+    @classmethod
+    def from_row_order(cls, ids) -> 'IdMap':
+        """Build from raw ids listed in embedding row order (row i <-> ids[i])"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        order = np.argsort(ids, kind='stable')
+        keys = ids[order]
+        if len(keys) > 1 and np.any(keys[1:] == keys[:-1]):
+            raise ValueError("Duplicate ids in id map")
+        return cls(keys, order.astype(np.int32))
+    
+    @classmethod
+    def empty(cls) -> 'IdMap':
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32))
+    
+    def __len__(self) -> int:
+        return len(self.keys)
+    
+    @property
+    def unknown_row(self) -> int:
+        return len(self.keys)
+    
+    @property
+    def row_ids(self) -> np.ndarray:
+        """Raw ids in embedding row order"""
+        if self._row_ids is None:
+            ids = np.empty(len(self.keys), dtype=np.int64)
+            ids[self.rows] = self.keys
+            self._row_ids = ids
+        return self._row_ids
+    
+    def lookup(self, raw_ids) -> np.ndarray:
+        """Map an array of raw ids to embedding rows in one vectorized call"""
+        raw_ids = np.asarray(raw_ids, dtype=np.int64)
+        if len(self.keys) == 0:
+            return np.full(raw_ids.shape, self.unknown_row, dtype=np.int32)
+        
+        pos = np.minimum(np.searchsorted(self.keys, raw_ids), len(self.keys) - 1)
+        found = self.keys[pos] == raw_ids
+        return np.where(found, self.rows[pos], self.unknown_row).astype(np.int32)
+    
+    def lookup_one(self, raw_id: Union[int, str]) -> int:
+        """Embedding row for a single raw id (unknown_row if unseen or not numeric)"""
+        try:
+            raw_id = int(raw_id)
+        except (TypeError, ValueError):
+            return self.unknown_row
+        return int(self.lookup(np.array([raw_id]))[0])
+    
+    def contains(self, raw_ids) -> np.ndarray:
+        return self.lookup(raw_ids) != self.unknown_row
+    
+    def extended(self, new_ids) -> 'IdMap':
+        """Copy with unseen ids appended as new rows (sorted); existing rows are kept"""
+        new_ids = np.unique(np.asarray(new_ids, dtype=np.int64))
+        new_ids = new_ids[~self.contains(new_ids)]
+        return IdMap.from_row_order(np.concatenate([self.row_ids, new_ids]))
+    
+    def save(self, prefix: str):
+        """Write <prefix>_keys.npy and <prefix>_rows.npy"""
+        os.makedirs(os.path.dirname(prefix) or '.', exist_ok=True)
+        np.save(f"{prefix}_keys.npy", np.asarray(self.keys, dtype=np.int64))
+        np.save(f"{prefix}_rows.npy", np.asarray(self.rows, dtype=np.int32))
+    
+    @classmethod
+    def exists(cls, prefix: str) -> bool:
+        return os.path.exists(f"{prefix}_keys.npy") and os.path.exists(f"{prefix}_rows.npy")
+    
+    @classmethod
+    def load(cls, prefix: str, mmap: bool = True) -> 'IdMap':
+        """Load a saved map, memory-mapped by default"""
+        mode = 'r' if mmap else None
+        return cls(np.load(f"{prefix}_keys.npy", mmap_mode=mode), np.load(f"{prefix}_rows.npy", mmap_mode=mode))
@@ -0,0 +1,135 @@
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+from utils.dense_runtime import ACTIVATIONS, DenseNetwork, read_architecture
+
+logger = logging.getLogger(__name__)
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return ACTIVATIONS['sigmoid'](x)
+
+class LSTMLayer:
+    """One Keras LSTM layer (tanh / sigmoid, gate order i, f, c, o) as float32 NumPy"""
+    
+    def __init__(self, kernel: np.ndarray, recurrent_kernel: np.ndarray, bias: Optional[np.ndarray]):
+        self.kernel = np.ascontiguousarray(kernel, dtype=np.float32)
+        self.recurrent_kernel = np.ascontiguousarray(recurrent_kernel, dtype=np.float32)
+        self.bias = np.zeros(self.kernel.shape[1], dtype=np.float32) if bias is None else np.asarray(bias, dtype=np.float32)
+        self.units = self.recurrent_kernel.shape[0]
+    
+    @classmethod
+    def from_keras(cls, layer) -> 'LSTMLayer':
+        if layer.activation.__name__ != 'tanh' or layer.recurrent_activation.__name__ != 'sigmoid':
+            raise ValueError(f"Unsupported LSTM activations in layer {layer.name}")
+        weights = layer.get_weights()
+        return cls(weights[0], weights[1], weights[2] if layer.use_bias else None)
+    
+    def step(self, x: np.ndarray, h: np.ndarray, c: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """One time step for a batch: x (n, input), h and c (n, units)"""
+        z = x @ self.kernel
+        z += h @ self.recurrent_kernel
+        z += self.bias
+        u = self.units
+        i = _sigmoid(z[:, :u])
+        f = _sigmoid(z[:, u:2 * u])
+        g = np.tanh(z[:, 2 * u:3 * u])
+        o = _sigmoid(z[:, 3 * u:])
+        c = f * c + i * g
+        return o * np.tanh(c), c
+
+class PurchaseNetwork:
+    """NumPy forward pass of the purchase model: LSTM(128) -> LSTM(64), concatenated with the
+    feature branch and run through the dense head (Dropout is the identity at inference)"""
+    
+    def __init__(self, lstm_layers: List[LSTMLayer], feature_branch: DenseNetwork, head: DenseNetwork,
+                 sequence_first: bool = True, window_length: Optional[int] = None):
+        self.lstm_layers = lstm_layers
+        self.feature_branch = feature_branch
+        self.head = head
+        self.sequence_first = sequence_first  # Order of the concatenate inputs
+        self.window_length = window_length  # Time steps of the sequence input the model was built with
+    
+    @classmethod
+    def from_keras(cls, keras_model) -> 'PurchaseNetwork':
+        """Split a built PurchasePredictionModel graph into its LSTM stack, feature branch and head"""
+        lstm_layers, feature_dense, head_dense, concat = [], [], [], None
+        for layer in keras_model.layers:
+            class_name = layer.__class__.__name__
+            if class_name == 'LSTM':
+                lstm_layers.append(LSTMLayer.from_keras(layer))
+            elif class_name == 'Concatenate':
+                concat = layer
+            elif class_name == 'Dense':
+                weights = layer.get_weights()
+                spec = (layer.name, weights[0], weights[1] if layer.use_bias else None, layer.activation.__name__)
+                (head_dense if concat is not None else feature_dense).append(spec)
+            elif class_name not in ('InputLayer', 'Dropout'):
+                raise ValueError(f"Unsupported layer {layer.name} ({class_name})")
+        if not lstm_layers or concat is None or not feature_dense or not head_dense:
+            raise ValueError("Not a purchase prediction graph")
+        
+        concat_inputs = concat.inbound_nodes[0].inbound_layers
+        sequence_first = concat_inputs[0].__class__.__name__ == 'LSTM'
+        window_length = next(shape[1] for shape in keras_model.input_shape if len(shape) == 3)
+        return cls(lstm_layers, DenseNetwork(feature_dense), DenseNetwork(head_dense), sequence_first, window_length)
+    
+    @classmethod
+    def from_weight_file(cls, path: str) -> 'PurchaseNetwork':
+        """Same split from a .mmw file's architecture, on its memory-mapped weights (no TensorFlow)"""
+        specs, weights = read_architecture(path)
+        classes = {spec['name']: spec['class_name'] for spec in specs}
+        lstm_layers, feature_dense, head_dense, concat, window_length = [], [], [], None, None
+        for spec in specs:
+            class_name, name, layer_config = spec['class_name'], spec['name'], spec['config']
+            if class_name == 'LSTM':
+                if layer_config.get('activation') != 'tanh' or layer_config.get('recurrent_activation') != 'sigmoid':
+                    raise ValueError(f"Unsupported LSTM activations in layer {name}")
+                lstm_layers.append(LSTMLayer(weights[(name, 'kernel')], weights[(name, 'recurrent_kernel')],
+                                             weights.get((name, 'bias'))))
+            elif class_name == 'Concatenate':
+                concat = spec
+            elif class_name == 'Dense':
+                bias = weights.get((name, 'bias')) if layer_config.get('use_bias', True) else None
+                entry = (name, weights[(name, 'kernel')], bias, layer_config.get('activation', 'linear'))
+                (head_dense if concat is not None else feature_dense).append(entry)
+            elif class_name == 'InputLayer':
+                shape = layer_config.get('batch_input_shape') or layer_config.get('batch_shape') or []
+                if len(shape) == 3:
+                    window_length = shape[1]
+            elif class_name != 'Dropout':
+                raise ValueError(f"Unsupported layer {name} ({class_name})")
+        if not lstm_layers or concat is None or not feature_dense or not head_dense:
+            raise ValueError(f"Not a purchase prediction graph: {path}")
+        
+        sequence_first = classes.get((concat['inbound'] or [None])[0]) == 'LSTM'
+        return cls(lstm_layers, DenseNetwork(feature_dense), DenseNetwork(head_dense), sequence_first, window_length)
+    
+    def zero_state(self, n: int) -> List[np.ndarray]:
+        """[h, c] per LSTM layer for n sequences"""
+        state = []
+        for layer in self.lstm_layers:
+            state += [np.zeros((n, layer.units), dtype=np.float32), np.zeros((n, layer.units), dtype=np.float32)]
+        return state
+    
+    def step(self, x: np.ndarray, state: List[np.ndarray]) -> List[np.ndarray]:
+        """Advance every layer of the stack by one time step"""
+        new_state = []
+        for k, layer in enumerate(self.lstm_layers):
+            h, c = layer.step(x, state[2 * k], state[2 * k + 1])
+            new_state += [h, c]
+            x = h
+        return new_state
+    
+    def score(self, state: List[np.ndarray], features: np.ndarray) -> np.ndarray:
+        """Purchase probability from the top layer's hidden state and the user features"""
+        feature_out = self.feature_branch.predict(features)
+        parts = [state[-2], feature_out] if self.sequence_first else [feature_out, state[-2]]
+        return self.head.predict(np.concatenate(parts, axis=1)).ravel()
+    
+    def predict(self, sequences: np.ndarray, features: np.ndarray) -> np.ndarray:
+        """Full recomputation over (n, timesteps, event_types), same as keras predict"""
+        sequences = np.asarray(sequences, dtype=np.float32)
+        state = self.zero_state(len(sequences))
+        for t in range(sequences.shape[1]):
+            state = self.step(sequences[:, t], state)
+        return self.score(state, np.asarray(features, dtype=np.float32))
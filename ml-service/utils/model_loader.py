@@ -1,86 +1,304 @@
 import os
+import re
 import json
+import hashlib
 import logging
-from typing import Optional, Dict, Any, List
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Tuple
 from config import config
 
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
+MANIFEST_NAME = "registry.json"
+
+# Parsed manifests shared by all ModelLoader instances: path -> ((mtime_ns, size, inode), manifest)
+_manifest_cache: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {}
+_manifest_lock = threading.Lock()
+
+def _normalize_version(version) -> str:
+    """Trainer versions look like "v1700000000"; the registry and file names use the number"""
+    return str(version).lstrip("v")
+
+def _file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 class ModelLoader:
-    """Load and manage ML models"""
+    """Load and manage ML models through the registry manifest
+    
+    saved_models/registry.json records every version of every model with its artifact files
+    (size, sha256), metadata/metrics and per-model "latest" and "deployed" pointers. It is
+    parsed once per change (an os.stat decides) and shared by all instances, so resolving
+    and listing do not touch the artifacts. Updates rewrite it atomically (temp file +
+    os.replace) under a file lock. A directory without a manifest is indexed once.
+    """
     
     def __init__(self, model_storage_path: str = None):
         self.model_storage_path = model_storage_path or config.MODEL_STORAGE_PATH
+        self.manifest_path = os.path.join(self.model_storage_path, MANIFEST_NAME)
         self.loaded_models = {}
         
         # Create model storage directory if it doesn't exist
         os.makedirs(self.model_storage_path, exist_ok=True)
     
+    # Manifest
+    
+    def _stat_key(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    
+    def _read_manifest(self) -> Dict[str, Any]:
+        with open(self.manifest_path, 'r') as f:
+            return json.load(f)
+    
+    def manifest(self) -> Dict[str, Any]:
+        """Current manifest (cached until the file changes); do not mutate the result"""
+        key = self._stat_key()
+        cached = _manifest_cache.get(self.manifest_path)
+        if cached is not None and key is not None and cached[0] == key:
+            return cached[1]
+        
+        with _manifest_lock:
+            if key is None:
+                with self._locked():
+                    if self._stat_key() is None:
+                        self._write_manifest(self._index_directory())
+                key = self._stat_key()
+            manifest = self._read_manifest()
+            _manifest_cache[self.manifest_path] = (key, manifest)
+            return manifest
+    
+    def manifest_version(self) -> Optional[Tuple[int, int, int]]:
+        """Changes whenever the manifest is rewritten (cheap change detection for reloaders)"""
+        return self._stat_key()
+    
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock across processes for read-modify-write of the manifest"""
+        lock_file = open(self.manifest_path + ".lock", 'a')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+    
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        manifest["updated_at"] = datetime.now().isoformat()
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+    
+    def _update_manifest(self, update):
+        """Apply update(manifest) to a fresh copy and publish it atomically"""
+        with _manifest_lock, self._locked():
+            manifest = self._read_manifest() if self._stat_key() is not None else self._index_directory()
+            result = update(manifest)
+            self._write_manifest(manifest)
+            _manifest_cache[self.manifest_path] = (self._stat_key(), manifest)
+            return result
+    
+    def _artifact_files(self, model_name: str, version: str, names: Optional[List[str]] = None) -> List[str]:
+        """Files of one version: <model>_v<version>.h5 and its suffixed companions"""
+        prefix = f"{model_name}_v{_normalize_version(version)}"
+        names = os.listdir(self.model_storage_path) if names is None else names
+        return sorted(f for f in names if f.startswith(prefix) and f[len(prefix):len(prefix) + 1] in ('.', '_'))
+    
+    def _describe_artifacts(self, files: List[str]) -> Dict[str, Dict[str, Any]]:
+        artifacts = {}
+        for file in files:
+            path = os.path.join(self.model_storage_path, file)
+            artifacts[file] = {"size": os.path.getsize(path), "sha256": _file_sha256(path)}
+        return artifacts
+    
+    def _index_directory(self) -> Dict[str, Any]:
+        """Build a manifest from the files of a directory that has none yet"""
+        names = os.listdir(self.model_storage_path)
+        pattern = re.compile(r"^(.+?)_v+(\d+)(?:[._]|$)")
+        found = {}
+        for file in names:
+            match = pattern.match(file)
+            if match:
+                found.setdefault(match.group(1), set()).add(match.group(2))
+        
+        manifest = {"format": 1, "models": {}}
+        for model_name, versions in found.items():
+            entry = {"latest": None, "deployed": None, "versions": {}}
+            for version in sorted(versions, key=int):
+                files = self._artifact_files(model_name, version, names)
+                metadata_file = f"{model_name}_v{version}_metadata.json"
+                metadata = {}
+                if metadata_file in files:
+                    try:
+                        with open(os.path.join(self.model_storage_path, metadata_file), 'r') as f:
+                            metadata = json.load(f)
+                    except Exception as e:
+                        logger.warning(f"Unreadable metadata {metadata_file}: {e}")
+                entry["versions"][version] = {
+                    "artifacts": self._describe_artifacts(files),
+                    "metadata": metadata,
+                    "registered_at": datetime.now().isoformat()
+                }
+                entry["latest"] = version
+            manifest["models"][model_name] = entry
+        
+        if found:
+            logger.info(f"📒 Model registry indexed from {self.model_storage_path}: "
+                        f"{sum(len(v) for v in found.values())} versions of {len(found)} models")
+        return manifest
+    
+    # Resolution
+    
+    def _model_entry(self, model_name: str) -> Optional[Dict[str, Any]]:
+        return self.manifest()["models"].get(model_name)
+    
+    def resolve_version(self, model_name: str, version: str = "latest") -> Optional[str]:
+        """Registered version for "latest", "deployed" (falls back to latest) or an explicit version"""
+        entry = self._model_entry(model_name)
+        if entry is None:
+            return None
+        if version == "deployed":
+            return entry.get("deployed") or entry.get("latest")
+        if version == "latest":
+            return entry.get("latest")
+        version = _normalize_version(version)
+        return version if version in entry["versions"] else None
+    
+    def get_latest_version(self, model_name: str) -> Optional[str]:
+        """Newest registered version of a model"""
+        return self.resolve_version(model_name, "latest")
+    
     def get_model_path(self, model_name: str, version: str = "latest") -> str:
         """Get path to model file"""
-        if version == "latest":
-            # Find latest version
-            versions = []
-            for file in os.listdir(self.model_storage_path):
-                if file.startswith(f"{model_name}_v") and file.endswith(".h5"):
-                    try:
-                        v = file.replace(f"{model_name}_v", "").replace(".h5", "")
-                        versions.append((int(v.split(".")[0]), file))
-                    except:
-                        pass
-            
-            if versions:
-                versions.sort(reverse=True)
-                return os.path.join(self.model_storage_path, versions[0][1])
-            else:
-                return os.path.join(self.model_storage_path, f"{model_name}_v1.h5")
-        else:
-            return os.path.join(self.model_storage_path, f"{model_name}_v{version}.h5")
+        if version in ("latest", "deployed"):
+            version = self.resolve_version(model_name, version) or "1"
+        return os.path.join(self.model_storage_path, f"{model_name}_v{_normalize_version(version)}.h5")
     
     def model_exists(self, model_name: str, version: str = "latest") -> bool:
-        """Check if model file exists"""
-        model_path = self.get_model_path(model_name, version)
-        return os.path.exists(model_path)
+        """Check if the version is registered (models with only suffixed artifacts count too)"""
+        return self.resolve_version(model_name, version) is not None
     
     def load_model_metadata(self, model_name: str, version: str = "latest") -> Optional[Dict[str, Any]]:
         """Load model metadata"""
-        metadata_path = self.get_model_path(model_name, version).replace(".h5", "_metadata.json")
-        if os.path.exists(metadata_path):
-            try:
-                with open(metadata_path, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"Error loading model metadata: {e}")
-                return None
-        return None
+        resolved = self.resolve_version(model_name, version)
+        if resolved is None:
+            return None
+        return self._model_entry(model_name)["versions"][resolved].get("metadata")
+    
+    # Registration
     
     def save_model_metadata(self, model_name: str, version: str, metadata: Dict[str, Any]):
-        """Save model metadata"""
+        """Save model metadata and register the saved version as latest
+        
+        Call after the artifacts are written: their sizes and hashes go into the manifest.
+        The <model>_v<version>_metadata.json file is still written for external tools.
+        """
+        version = _normalize_version(version)
         metadata_path = self.get_model_path(model_name, version).replace(".h5", "_metadata.json")
         try:
             with open(metadata_path, 'w') as f:
                 json.dump(metadata, f, indent=2)
         except Exception as e:
             logger.error(f"Error saving model metadata: {e}")
+        
+        artifacts = self._describe_artifacts(self._artifact_files(model_name, version))
+        
+        def register(manifest):
+            entry = manifest["models"].setdefault(model_name, {"latest": None, "deployed": None, "versions": {}})
+            entry["versions"][version] = {
+                "artifacts": artifacts,
+                "metadata": metadata,
+                "registered_at": datetime.now().isoformat()
+            }
+            if entry["latest"] is None or int(version) >= int(entry["latest"]):
+                entry["latest"] = version
+        
+        self._update_manifest(register)
+        logger.info(f"📒 {model_name} v{version} registered ({len(artifacts)} artifacts, "
+                    f"{sum(a['size'] for a in artifacts.values()) / 1e6:.1f} MB)")
+        
+        if config.MODEL_RETENTION_VERSIONS > 0:
+            self.prune(model_name, config.MODEL_RETENTION_VERSIONS)
     
-    def list_models(self) -> List[Dict[str, Any]]:
-        """List all available models"""
-        models = []
-        for file in os.listdir(self.model_storage_path):
-            if file.endswith(".h5"):
+    def deploy(self, model_name: str, version: str) -> str:
+        """Point "deployed" at a registered version; returns the normalized version"""
+        version = _normalize_version(version)
+        
+        def set_pointer(manifest):
+            entry = manifest["models"].get(model_name)
+            if entry is None or version not in entry["versions"]:
+                raise ValueError(f"{model_name} v{version} is not registered")
+            entry["deployed"] = version
+        
+        self._update_manifest(set_pointer)
+        logger.info(f"🚀 {model_name} v{version} deployed")
+        return version
+    
+    def verify(self, model_name: str, version: str = "latest") -> bool:
+        """Re-hash a version's artifacts against the manifest"""
+        resolved = self.resolve_version(model_name, version)
+        if resolved is None:
+            return False
+        for file, info in self._model_entry(model_name)["versions"][resolved]["artifacts"].items():
+            path = os.path.join(self.model_storage_path, file)
+            if not os.path.exists(path) or os.path.getsize(path) != info["size"] or _file_sha256(path) != info["sha256"]:
+                logger.error(f"Artifact mismatch: {file}")
+                return False
+        return True
+    
+    def prune(self, model_name: str, keep: int) -> List[str]:
+        """Delete all but the newest keep versions (the latest and deployed ones always stay)"""
+        def drop_old(manifest):
+            entry = manifest["models"].get(model_name)
+            if entry is None:
+                return {}
+            protected = {entry.get("latest"), entry.get("deployed")}
+            ordered = sorted(entry["versions"], key=int, reverse=True)
+            removed = {v: entry["versions"].pop(v) for v in ordered[keep:] if v not in protected}
+            return removed
+        
+        removed = self._update_manifest(drop_old)
+        # Files go after the manifest stops referencing them, so readers never see a dangling version
+        for version, info in removed.items():
+            for file in info["artifacts"]:
                 try:
-                    parts = file.replace(".h5", "").split("_v")
-                    if len(parts) == 2:
-                        model_name = parts[0]
-                        version = parts[1]
-                        metadata = self.load_model_metadata(model_name, version)
-                        models.append({
-                            "name": model_name,
-                            "version": version,
-                            "path": os.path.join(self.model_storage_path, file),
-                            "metadata": metadata
-                        })
-                except:
+                    os.remove(os.path.join(self.model_storage_path, file))
+                except FileNotFoundError:
                     pass
+        if removed:
+            logger.info(f"🧹 {model_name}: pruned versions {', '.join(sorted(removed, key=int))}")
+        return list(removed)
+    
+    def list_models(self) -> List[Dict[str, Any]]:
+        """List all registered model versions"""
+        models = []
+        for model_name, entry in self.manifest()["models"].items():
+            for version, info in entry["versions"].items():
+                models.append({
+                    "name": model_name,
+                    "version": version,
+                    "path": self.get_model_path(model_name, version),
+                    "latest": version == entry.get("latest"),
+                    "deployed": version == entry.get("deployed"),
+                    "size": sum(a["size"] for a in info["artifacts"].values()),
+                    "metadata": info.get("metadata")
+                })
         return models
-
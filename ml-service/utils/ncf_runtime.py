@@ -0,0 +1,93 @@
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+from utils.dense_runtime import DenseNetwork, PASSTHROUGH_LAYERS, read_architecture
+from utils.quantization import as_table
+
+logger = logging.getLogger(__name__)
+
+class RecommendationNetwork:
+    """NumPy forward pass of the recommendation model: two embedding lookups, concatenated
+    and run through the dense head (Flatten and Dropout are the identity at inference)
+    
+    The tables can be QuantizedTables (int8 per-row or float16, see utils/quantization).
+    """
+    
+    def __init__(self, user_table, product_table, head: DenseNetwork,
+                 user_first: bool = True):
+        self.user_table = user_table
+        self.product_table = product_table
+        self.head = head
+        self.user_first = user_first  # Order of the concatenate inputs
+        self.num_users = user_table.shape[0] - 1  # Last row is the cold-start row
+        self.num_products = product_table.shape[0] - 1
+    
+    @staticmethod
+    def _split(layers: List[Tuple[str, str, Optional[list]]]) -> Tuple[str, str, bool]:
+        """(user embedding, product embedding, user first) from (name, class, inbound) triples"""
+        embeddings = [name for name, class_name, _ in layers if class_name == 'Embedding']
+        if len(embeddings) != 2:
+            raise ValueError(f"Expected two embedding tables, found {len(embeddings)}")
+        user, product = sorted(embeddings, key=lambda name: not name.startswith('user'))
+        
+        # Follow the first concatenate input back to its embedding through the Flatten
+        inbound = {name: inputs for name, _, inputs in layers}
+        concat = next((inputs for _, class_name, inputs in layers if class_name == 'Concatenate'), None)
+        if not concat:
+            raise ValueError("Not a recommendation graph: no concatenate layer")
+        first = concat[0]
+        while first not in embeddings and inbound.get(first):
+            first = inbound[first][0]
+        return user, product, first == user
+    
+    @classmethod
+    def from_keras(cls, keras_model) -> 'RecommendationNetwork':
+        """Copy the tables and head of a built RecommendationModel graph"""
+        layers, tables, head, concat_seen = [], {}, [], False
+        for layer in keras_model.layers:
+            class_name = layer.__class__.__name__
+            nodes = getattr(layer, 'inbound_nodes', None) or []
+            inbound_layers = nodes[0].inbound_layers if nodes else []
+            inbound_layers = inbound_layers if isinstance(inbound_layers, list) else [inbound_layers]
+            layers.append((layer.name, class_name, [l.name for l in inbound_layers]))
+            if class_name == 'Embedding':
+                tables[layer.name] = np.ascontiguousarray(layer.get_weights()[0], dtype=np.float32)
+            elif class_name == 'Concatenate':
+                concat_seen = True
+            elif class_name == 'Dense' and concat_seen:
+                weights = layer.get_weights()
+                head.append((layer.name, weights[0], weights[1] if layer.use_bias else None, layer.activation.__name__))
+            elif class_name not in PASSTHROUGH_LAYERS + ('Flatten',):
+                raise ValueError(f"Unsupported layer {layer.name} ({class_name})")
+        
+        user, product, user_first = cls._split(layers)
+        return cls(tables[user], tables[product], DenseNetwork(head), user_first)
+    
+    @classmethod
+    def from_weight_file(cls, path: str) -> 'RecommendationNetwork':
+        """Same split from a .mmw file's architecture, on its memory-mapped weights (no TensorFlow);
+        quantized tables written by utils/quantization.quantize_weight_file are kept quantized"""
+        specs, weights = read_architecture(path)
+        layers, head, concat_seen = [], [], False
+        for spec in specs:
+            class_name, name, layer_config = spec['class_name'], spec['name'], spec['config']
+            layers.append((name, class_name, spec['inbound']))
+            if class_name == 'Concatenate':
+                concat_seen = True
+            elif class_name == 'Dense' and concat_seen:
+                bias = weights.get((name, 'bias')) if layer_config.get('use_bias', True) else None
+                head.append((name, weights[(name, 'kernel')], bias, layer_config.get('activation', 'linear')))
+            elif class_name not in PASSTHROUGH_LAYERS + ('Flatten', 'Embedding'):
+                raise ValueError(f"Unsupported layer {name} ({class_name})")
+        
+        user, product, user_first = cls._split(layers)
+        return cls(as_table(weights, user), as_table(weights, product), DenseNetwork(head), user_first)
+    
+    def predict(self, user_rows: np.ndarray, product_rows: np.ndarray) -> np.ndarray:
+        """Scores (n, 1) for row pairs, same as keras predict([user_rows, product_rows])"""
+        user_rows = np.asarray(user_rows).reshape(-1).astype(np.int64, copy=False)
+        product_rows = np.asarray(product_rows).reshape(-1).astype(np.int64, copy=False)
+        parts = [self.user_table[user_rows], self.product_table[product_rows]]
+        if not self.user_first:
+            parts.reverse()
+        return self.head.predict(np.concatenate(parts, axis=1))
@@ -0,0 +1,29 @@
+import os
+import time
+from typing import Dict, Optional
+
+def process_start_time() -> Optional[float]:
+    """Wall-clock start time of this process (Linux /proc), None elsewhere"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 (starttime, in clock ticks since boot) comes after the parenthesized command name
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def memory_usage_mb() -> Dict[str, float]:
+    """Current and peak resident set size of this process in MB"""
+    usage = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key = 'rss' if line.startswith('VmRSS') else 'peak_rss'
+                    usage[key] = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        import resource
+        usage['peak_rss'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return usage
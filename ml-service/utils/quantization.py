@@ -0,0 +1,80 @@
+import logging
+from typing import Optional, Tuple
+import numpy as np
+from utils.weight_file import read_weight_file, write_weight_file
+
+logger = logging.getLogger(__name__)
+
+# Weight file array name suffix of the per-row scales next to an int8 table
+SCALE_SUFFIX = '_scale'
+
+def quantize_rows(table: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 per row: table ~= q * scale[:, None], |q| <= 127"""
+    table = np.asarray(table, dtype=np.float32)
+    scale = np.abs(table).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.rint(table / scale[:, None]).clip(-127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+class QuantizedTable:
+    """Embedding table stored as int8 with per-row scales, or as float16
+    
+    Indexing returns float32 rows, so the runtimes use it like the plain table; only the
+    gathered rows are ever dequantized.
+    """
+    
+    def __init__(self, values: np.ndarray, scale: Optional[np.ndarray] = None):
+        if scale is None and values.dtype != np.float16:
+            raise ValueError(f"Unsupported table dtype {values.dtype} without scales")
+        self.values = values
+        self.scale = scale
+        self.shape = values.shape
+        self.nbytes = values.nbytes + (scale.nbytes if scale is not None else 0)
+    
+    def __len__(self) -> int:
+        return self.shape[0]
+    
+    def __getitem__(self, rows) -> np.ndarray:
+        out = self.values[rows].astype(np.float32)
+        if self.scale is not None:
+            out *= self.scale[rows][..., None]
+        return out
+
+def as_table(weights, layer: str):
+    """Plain, int8 (+ scales) or float16 embedding table of a layer from read_architecture weights"""
+    values = weights[(layer, 'embeddings')]
+    scale = weights.get((layer, 'embeddings' + SCALE_SUFFIX))
+    if scale is not None or values.dtype == np.float16:
+        return QuantizedTable(values, scale)
+    return values
+
+def quantize_weight_file(src: str, dst: str, mode: str) -> int:
+    """Copy a .mmw file with its embedding tables as int8 + per-row scales or float16
+    
+    Every other array (dense kernels, LSTM weights) stays float32. Returns the number of
+    tables quantized; a file without embedding tables is not written.
+    """
+    if mode not in ('int8', 'float16'):
+        raise ValueError(f"Unknown table quantization '{mode}'")
+    header, arrays = read_weight_file(src)
+    names, out, tables = [], [], 0
+    for entry, array in zip(header['arrays'], arrays):
+        name = entry['name']
+        base, _, suffix = name.rpartition(':')
+        if base.endswith('/embeddings') and array.ndim == 2:
+            tables += 1
+            if mode == 'int8':
+                q, scale = quantize_rows(array)
+                names += [name, f"{base}{SCALE_SUFFIX}:{suffix}"]
+                out += [q, scale]
+            else:
+                names.append(name)
+                out.append(np.asarray(array, dtype=np.float16))
+        else:
+            names.append(name)
+            out.append(np.asarray(array))
+    if tables == 0:
+        return 0
+    extra = dict(header.get('extra') or {}, quantization=mode)
+    write_weight_file(dst, out, names=names, architecture=header['architecture'], extra=extra)
+    return tables
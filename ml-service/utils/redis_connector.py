@@ -1,6 +1,6 @@
 import redis.asyncio as redis
 import logging
-from typing import Optional
+from typing import List, Optional, Union
 
 logger = logging.getLogger(__name__)
 
@@ -52,8 +52,8 @@ class RedisConnector:
             raise Exception("Redis not connected")
         return await self.client.rpop(queue_name)
     
-    async def brpop(self, queue_name: str, timeout: int = 5) -> Optional[tuple]:
-        """Blocking pop from queue"""
+    async def brpop(self, queue_name: Union[str, List[str]], timeout: int = 5) -> Optional[tuple]:
+        """Blocking pop from queue (from the first non-empty one of several, in order)"""
         if not self.client:
             raise Exception("Redis not connected")
         return await self.client.brpop(queue_name, timeout=timeout)
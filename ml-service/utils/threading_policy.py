@@ -0,0 +1,208 @@
+"""CPU threading policy per process role (serving, training or mixed)
+
+TensorFlow (intra/inter-op pools), the BLAS/OpenMP runtimes behind NumPy and sklearn, and
+joblib (sklearn n_jobs) each size their thread pools to every core by default, so realtime
+scoring and a background training job oversubscribe the CPU. The policy sizes all of them
+from config (SERVING_* / TRAINING_*; 0 = derived from the CPUs the role may use):
+  
+  serving   small batches, latency bound: TF intra 2, inter 1, BLAS 1, n_jobs 1
+  training  throughput bound: every core for TF, BLAS and n_jobs
+  mixed     serving and training in one process: training gets the cores serving does
+            not reserve (all cores minus serving's TF intra threads)
+
+TF and BLAS pools are process-global: TF reads its sizes once, before its first op, and a
+BLAS limit applies to every thread. In a mixed process the TF pools are therefore sized
+for training and the BLAS limit is raised to the training value only while a training job
+runs (training_threads()); strict separation needs separate serving and training
+processes (SERVING_ONLY / PROCESS_ROLE) with their own *_CPUS affinity.
+"""
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from config import config
+
+logger = logging.getLogger(__name__)
+
+ROLES = ('serving', 'training', 'mixed')
+BLAS_ENV = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS',
+            'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+def parse_cpus(value: str) -> Optional[List[int]]:
+    """CPU list like '0-3,6' (None when empty)"""
+    cpus = set()
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            first, last = part.split('-', 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus) or None
+
+def available_cpus() -> List[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on macOS/Windows
+        return list(range(os.cpu_count() or 1))
+
+class ThreadPolicy:
+    """Thread pool sizes and CPU affinity of one role"""
+    
+    def __init__(self, role: str, tf_intra: int, tf_inter: int, blas: int, n_jobs: int,
+                 cpus: Optional[List[int]] = None):
+        self.role = role
+        self.tf_intra = tf_intra
+        self.tf_inter = tf_inter
+        self.blas = blas
+        self.n_jobs = n_jobs
+        self.cpus = cpus
+    
+    def as_dict(self) -> Dict:
+        return {
+            "role": self.role,
+            "tf_intra_op_threads": self.tf_intra,
+            "tf_inter_op_threads": self.tf_inter,
+            "blas_threads": self.blas,
+            "n_jobs": self.n_jobs,
+            "cpus": self.cpus
+        }
+
+def process_role() -> str:
+    role = config.PROCESS_ROLE or ('serving' if config.SERVING_ONLY or config.SERVING_WORKERS > 1 else 'mixed')
+    if role not in ROLES:
+        raise ValueError(f"Unknown PROCESS_ROLE '{role}' (one of {', '.join(ROLES)})")
+    return role
+
+def role_policy(role: str, shared: bool = False) -> ThreadPolicy:
+    """Policy of 'serving' or 'training'; shared: training next to serving in a mixed process"""
+    prefix = role.upper()
+    cpus = parse_cpus(getattr(config, f'{prefix}_CPUS'))
+    count = len(cpus or available_cpus())
+    if role == 'serving':
+        defaults = dict(tf_intra=min(2, count), tf_inter=1, blas=1, n_jobs=1)
+    elif role == 'training':
+        if shared and cpus is None:
+            count = max(1, count - role_policy('serving').tf_intra)
+        defaults = dict(tf_intra=count, tf_inter=min(2, count), blas=count, n_jobs=count)
+    else:
+        raise ValueError(f"No thread policy for role '{role}'")
+    
+    values = {}
+    for key, setting in (('tf_intra', 'TF_INTRA_THREADS'), ('tf_inter', 'TF_INTER_THREADS'),
+                         ('blas', 'BLAS_THREADS'), ('n_jobs', 'N_JOBS')):
+        values[key] = getattr(config, f'{prefix}_{setting}') or defaults[key]
+    return ThreadPolicy(role, cpus=cpus, **values)
+
+def process_policy() -> ThreadPolicy:
+    """Process-wide pools: the role's own policy, or for mixed TF sized for training and BLAS for serving"""
+    role = process_role()
+    if role != 'mixed':
+        return role_policy(role)
+    serving, training = role_policy('serving'), role_policy('training', shared=True)
+    cpus = sorted(set(serving.cpus) | set(training.cpus)) if serving.cpus and training.cpus else None
+    return ThreadPolicy('mixed', training.tf_intra, training.tf_inter, serving.blas, training.n_jobs, cpus)
+
+def n_jobs(role: str) -> int:
+    """sklearn/joblib n_jobs for fits ('training') and for loaded estimators ('serving')"""
+    return role_policy(role, shared=role == 'training' and process_role() == 'mixed').n_jobs
+
+def inference_threads() -> int:
+    """Threads of one serving interpreter (TFLite): serving TF intra, within the CPUs this process may use
+    
+    Evaluated when the interpreter is created, so forked workers see their pinned CPUs.
+    """
+    return max(1, min(role_policy('serving').tf_intra, len(available_cpus())))
+
+def _limit_blas(threads: int) -> bool:
+    """Resize already loaded BLAS/OpenMP pools (threadpoolctl ships with sklearn)"""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return False
+    threadpool_limits(limits=threads)
+    return True
+
+_applied = None
+
+def apply_process_policy(role: Optional[str] = None) -> Dict:
+    """Apply the process policy once, as early as possible (before TensorFlow and NumPy load)
+    
+    Environment variables cover runtimes loaded later; pools that already exist are resized
+    where the runtime allows it. CPU affinity set here is inherited by every thread started
+    afterwards. role applies that role's policy instead, also after the process policy (the
+    training process forked by serving_workers).
+    """
+    global _applied
+    if _applied is not None and role is None:
+        return _applied
+    policy = process_policy() if role is None else role_policy(role)
+    
+    if policy.cpus:
+        try:
+            os.sched_setaffinity(0, policy.cpus)
+        except (AttributeError, OSError) as e:
+            logger.warning(f"⚠️ CPU affinity {policy.cpus} could not be set: {e}")
+    
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(policy.tf_intra)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(policy.tf_inter)
+    for name in BLAS_ENV:
+        os.environ[name] = str(policy.blas)
+    
+    if 'numpy' in sys.modules:
+        _limit_blas(policy.blas)
+    if 'tensorflow' in sys.modules:
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(policy.tf_intra)
+            tf.config.threading.set_inter_op_parallelism_threads(policy.tf_inter)
+        except RuntimeError as e:
+            logger.warning(f"⚠️ TensorFlow already initialized, thread pools unchanged: {e}")
+    
+    _applied = policy.as_dict()
+    logger.info(f"🧵 Thread policy: {_applied}")
+    return _applied
+
+def pin_worker(index: int, count: int) -> Optional[List[int]]:
+    """Restrict a forked serving worker to every count-th CPU of the process (enough CPUs only)"""
+    cpus = available_cpus()
+    if count < 2 or len(cpus) < count:
+        return None
+    own = cpus[index::count]
+    try:
+        os.sched_setaffinity(0, own)
+    except (AttributeError, OSError) as e:
+        logger.warning(f"⚠️ Worker {index} could not be pinned to CPUs {own}: {e}")
+        return None
+    return own
+
+_training_lock = threading.Lock()
+_training_jobs = 0
+
+@contextmanager
+def training_threads():
+    """Raise the BLAS/OpenMP limit to the training value while training code runs in a mixed process
+    
+    Reference counted, so overlapping training calls from the executor keep the higher limit
+    until the last one finishes; outside mixed processes this is a no-op.
+    """
+    global _training_jobs
+    if process_role() != 'mixed':
+        yield
+        return
+    training = role_policy('training', shared=True)
+    with _training_lock:
+        _training_jobs += 1
+        if _training_jobs == 1:
+            _limit_blas(training.blas)
+    try:
+        yield
+    finally:
+        with _training_lock:
+            _training_jobs -= 1
+            if _training_jobs == 0:
+                _limit_blas(process_policy().blas)
@@ -0,0 +1,101 @@
+"""TorchScript copies of the NumPy runtimes (optional dependency: torch)
+
+The modules are rebuilt from the weights the NumPy runtimes already hold, so no Keras model
+is needed; Keras LSTM gates (i, f, c, o) are in the same order as torch's (i, f, g, o).
+"""
+import logging
+from typing import List
+import numpy as np
+import torch
+from torch import nn
+from utils.dense_runtime import DenseNetwork
+from utils.lstm_runtime import PurchaseNetwork
+from utils.ncf_runtime import RecommendationNetwork
+
+logger = logging.getLogger(__name__)
+
+_ACTIVATIONS = {
+    'linear': nn.Identity,
+    'relu': nn.ReLU,
+    'sigmoid': nn.Sigmoid,
+    'tanh': nn.Tanh,
+    'softmax': lambda: nn.Softmax(dim=-1)
+}
+
+def _tensor(array: np.ndarray) -> torch.Tensor:
+    return torch.from_numpy(np.array(array, dtype=np.float32))  # Copy: the maps are read-only
+
+def dense_module(network: DenseNetwork) -> nn.Sequential:
+    modules = []
+    for _, kernel, bias, activation in network.layers:
+        linear = nn.Linear(kernel.shape[0], kernel.shape[1], bias=bias is not None)
+        with torch.no_grad():
+            linear.weight.copy_(_tensor(kernel).T)
+            if bias is not None:
+                linear.bias.copy_(_tensor(bias))
+        modules += [linear, _ACTIVATIONS[activation]()]
+    return nn.Sequential(*modules)
+
+class PurchaseModule(nn.Module):
+    def __init__(self, network: PurchaseNetwork):
+        super().__init__()
+        lstms = []
+        for layer in network.lstm_layers:
+            lstm = nn.LSTM(layer.kernel.shape[0], layer.units, batch_first=True)
+            with torch.no_grad():
+                lstm.weight_ih_l0.copy_(_tensor(layer.kernel).T)
+                lstm.weight_hh_l0.copy_(_tensor(layer.recurrent_kernel).T)
+                lstm.bias_ih_l0.copy_(_tensor(layer.bias))
+                lstm.bias_hh_l0.zero_()
+            lstms.append(lstm)
+        self.lstms = nn.ModuleList(lstms)
+        self.feature_branch = dense_module(network.feature_branch)
+        self.head = dense_module(network.head)
+        self.sequence_first = network.sequence_first
+    
+    def forward(self, sequences: torch.Tensor, features: torch.Tensor) -> torch.Tensor:
+        x = sequences
+        for lstm in self.lstms:
+            x, _ = lstm(x)
+        parts: List[torch.Tensor] = [x[:, -1], self.feature_branch(features)]
+        if not self.sequence_first:
+            parts = [parts[1], parts[0]]
+        return self.head(torch.cat(parts, dim=1))
+
+class RecommendationModule(nn.Module):
+    def __init__(self, network: RecommendationNetwork):
+        super().__init__()
+        self.user_embedding = nn.Embedding.from_pretrained(_tensor(network.user_table))
+        self.product_embedding = nn.Embedding.from_pretrained(_tensor(network.product_table))
+        self.head = dense_module(network.head)
+        self.user_first = network.user_first
+    
+    def forward(self, user_rows: torch.Tensor, product_rows: torch.Tensor) -> torch.Tensor:
+        parts: List[torch.Tensor] = [self.user_embedding(user_rows), self.product_embedding(product_rows)]
+        if not self.user_first:
+            parts = [parts[1], parts[0]]
+        return self.head(torch.cat(parts, dim=1))
+
+def script(network) -> torch.jit.ScriptModule:
+    """Frozen TorchScript module for a DenseNetwork, PurchaseNetwork or RecommendationNetwork"""
+    if isinstance(network, DenseNetwork):
+        module = dense_module(network)
+    elif isinstance(network, PurchaseNetwork):
+        module = PurchaseModule(network)
+    elif isinstance(network, RecommendationNetwork):
+        module = RecommendationModule(network)
+    else:
+        raise ValueError(f"No TorchScript module for {type(network).__name__}")
+    return torch.jit.freeze(torch.jit.script(module.eval()))
+
+def predict(module: torch.jit.ScriptModule, inputs: List[np.ndarray]) -> np.ndarray:
+    """Run a scripted module on NumPy inputs (ids as int64, everything else float32)"""
+    tensors = []
+    for x in inputs:
+        x = np.asarray(x)
+        if np.issubdtype(x.dtype, np.integer):
+            tensors.append(torch.from_numpy(x.reshape(-1).astype(np.int64, copy=False)))
+        else:
+            tensors.append(torch.from_numpy(np.ascontiguousarray(x, dtype=np.float32)))
+    with torch.inference_mode():
+        return module(*tensors).numpy()
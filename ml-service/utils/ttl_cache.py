@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class AsyncTTLCache:
+    """Keyed cache for expensive async computations with stale-while-revalidate
+    
+    Entries younger than ttl are served as is. Between ttl and max_stale the cached value
+    is still returned immediately and a background task recomputes it. Older entries (or
+    refresh=True) are recomputed before returning. Concurrent misses of one key share a
+    single computation.
+    """
+    
+    def __init__(self, ttl: float, max_stale: float, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_stale = max(max_stale, ttl)
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[Any, float]] = {}  # key -> (value, computed_at)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+    
+    def _compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            async def run():
+                try:
+                    value = await compute()
+                    self._entries[key] = (value, time.time())
+                    if len(self._entries) > self.max_entries:
+                        oldest = min(self._entries, key=lambda k: self._entries[k][1])
+                        self._entries.pop(oldest, None)
+                    return value
+                finally:
+                    self._inflight.pop(key, None)
+            
+            task = asyncio.create_task(run())
+            self._inflight[key] = task
+        return task
+    
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable[Any]],
+                  refresh: bool = False) -> Tuple[Any, float, bool]:
+        """(value, computed_at, from_cache) for key, computing it with compute() if needed"""
+        entry = self._entries.get(key)
+        if entry is not None and not refresh:
+            value, computed_at = entry
+            age = time.time() - computed_at
+            if age < self.ttl:
+                self.hits += 1
+                return value, computed_at, True
+            if age < self.max_stale:
+                self.stale_hits += 1
+                task = self._compute(key, compute)
+                task.add_done_callback(self._log_refresh_error)
+                return value, computed_at, True
+        
+        self.misses += 1
+        # shield: a client disconnecting must not cancel the shared computation
+        value = await asyncio.shield(self._compute(key, compute))
+        return value, self._entries.get(key, (value, time.time()))[1], False
+    
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background cache refresh failed: {task.exception()}")
+    
+    def invalidate(self, key: Optional[Hashable] = None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshing": len(self._inflight)
+        }
@@ -0,0 +1,123 @@
+"""Memory-mappable weight files (.mmw) stored next to the Keras .h5 models
+
+Layout: the 8-byte MAGIC, the header length as a little-endian uint64, a UTF-8 JSON header,
+then the raw little-endian arrays, each starting on an ALIGN (64-byte) boundary. The header
+holds the format version, the Keras architecture JSON, free-form extra fields and, per array,
+its name, dtype, shape, absolute offset and size in bytes. Readers map the arrays with
+np.memmap, so loading copies nothing and processes serving the same model share its pages.
+"""
+import json
+import os
+import struct
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from config import config
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MLWEIGHT'
+FORMAT_VERSION = 1
+ALIGN = 64
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+def weight_file_path(h5_path: str) -> str:
+    """<name>.mmw next to <name>.h5"""
+    return (h5_path[:-3] if h5_path.endswith('.h5') else h5_path) + '.mmw'
+
+def write_weight_file(path: str, arrays: List[np.ndarray], names: Optional[List[str]] = None,
+                      architecture: Optional[str] = None, extra: Optional[Dict[str, Any]] = None):
+    """Write arrays as raw little-endian data behind a JSON header, atomically
+    
+    Floating point arrays are stored as float32 (float16 ones as they are). Offsets in the
+    header are absolute and ALIGN-aligned, so every array can be mapped with np.memmap
+    without copying.
+    """
+    def stored_dtype(a: np.ndarray):
+        if np.issubdtype(a.dtype, np.floating) and a.dtype != np.float16:
+            return np.float32
+        return None
+    
+    arrays = [np.ascontiguousarray(a, dtype=stored_dtype(np.asarray(a))) for a in arrays]
+    arrays = [a.astype(a.dtype.newbyteorder('<'), copy=False) for a in arrays]
+    names = names or [f"w{i}" for i in range(len(arrays))]
+    
+    def header_bytes(data_start: int) -> bytes:
+        entries, offset = [], data_start
+        for name, array in zip(names, arrays):
+            entries.append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset,
+                            "nbytes": array.nbytes})
+            offset = _aligned(offset + array.nbytes)
+        header = {"format": FORMAT_VERSION, "architecture": architecture, "extra": extra or {}, "arrays": entries}
+        return json.dumps(header).encode('utf-8')
+    
+    # Offsets depend on the header length and vice versa: grow the data start until it fits
+    data_start = _aligned(len(MAGIC) + 8 + len(header_bytes(0)))
+    header = header_bytes(data_start)
+    while _aligned(len(MAGIC) + 8 + len(header)) > data_start:
+        data_start = _aligned(len(MAGIC) + 8 + len(header))
+        header = header_bytes(data_start)
+    
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for array in arrays:
+            f.write(b'\0' * (_aligned(f.tell()) - f.tell()))
+            f.write(array.tobytes())
+    os.replace(tmp_path, path)
+
+def read_weight_file(path: str) -> Tuple[Dict[str, Any], List[np.ndarray]]:
+    """Header and read-only memory maps of the arrays
+    
+    The maps share the page cache, so processes loading the same file share physical memory.
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a weight file: {path}")
+        (header_len,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len).decode('utf-8'))
+    if header.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported weight file format {header.get('format')}: {path}")
+    
+    arrays = []
+    for entry in header["arrays"]:
+        shape = tuple(entry["shape"])
+        if entry["nbytes"] == 0:
+            arrays.append(np.zeros(shape, dtype=entry["dtype"]))
+        else:
+            arrays.append(np.memmap(path, dtype=entry["dtype"], mode='r', offset=entry["offset"], shape=shape))
+    return header, arrays
+
+def save_keras_model(keras_model, h5_path: str):
+    """Save a Keras model as .h5 and, if MODEL_SAVE_MMW is on, as architecture + weight file"""
+    keras_model.save(h5_path)
+    if config.MODEL_SAVE_MMW:
+        weights = keras_model.weights
+        write_weight_file(
+            weight_file_path(h5_path),
+            [w.numpy() for w in weights],
+            names=[w.name for w in weights],
+            architecture=keras_model.to_json()
+        )
+
+def load_keras_model(h5_path: str):
+    """Load a Keras model, from the weight file when MODEL_LOAD_FORMAT is mmw and one exists
+    
+    Returns (model, needs_compile): models rebuilt from a weight file are not compiled.
+    """
+    from tensorflow import keras
+    
+    mmw_path = weight_file_path(h5_path)
+    if config.MODEL_LOAD_FORMAT == 'mmw' and os.path.exists(mmw_path):
+        header, arrays = read_weight_file(mmw_path)
+        model = keras.models.model_from_json(header["architecture"])
+        model.set_weights(arrays)
+        return model, True
+    
+    if not os.path.exists(h5_path):
+        raise FileNotFoundError(f"Model file not found: {h5_path}")
+    return keras.models.load_model(h5_path), False
@@ -0,0 +1,44 @@
+import mmap
+import os
+import time
+from typing import Any, Dict
+import numpy as np
+
+class WorkerStats:
+    """Realtime counters of every serving worker in one shared memory table
+    
+    Created by the parent before it forks (an anonymous shared mapping), so each worker
+    writes its own row and whichever worker answers /api/stats can sum all of them.
+    """
+    
+    COUNTERS = ('events_processed', 'events_forwarded', 'predictions_made', 'recommendations_generated',
+                'anomalies_detected', 'segments_updated', 'buffer_size')
+    FIELDS = COUNTERS + ('pid', 'updated_at')
+    
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._buffer = mmap.mmap(-1, workers * len(self.FIELDS) * 8)
+        self.table = np.frombuffer(self._buffer, dtype=np.float64).reshape(workers, len(self.FIELDS))
+    
+    def publish(self, worker: int, values: Dict[str, int]):
+        row = self.table[worker]
+        for i, name in enumerate(self.COUNTERS):
+            row[i] = values.get(name, 0)
+        row[-2] = os.getpid()
+        row[-1] = time.time()
+    
+    def restore(self, worker: int) -> Dict[str, int]:
+        """Counters left by an earlier process of this worker (restarted after a crash)"""
+        row = self.table[worker]
+        return {name: int(row[i]) for i, name in enumerate(self.COUNTERS) if name != 'buffer_size'}
+    
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        workers = []
+        for index, row in enumerate(self.table):
+            entry = {name: int(row[i]) for i, name in enumerate(self.COUNTERS)}
+            entry.update(worker=index, pid=int(row[-2]) or None,
+                         updated_seconds_ago=round(now - row[-1], 1) if row[-1] else None)
+            workers.append(entry)
+        totals = {name: int(self.table[:, i].sum()) for i, name in enumerate(self.COUNTERS)}
+        return dict(totals, workers=workers)
@@ -2695,9 +2695,49 @@ async function createDatabaseSchema(pool) {
       `);
       console.log('✅ analytics_aggregates table ready');
 
-      // ML Predictions table
+      // ML result tables: <name> holds the latest state per user (upserted by the ML service),
+      // <name>_history a sampled, pruned append-only history. ml_predictions used to be the
+      // append-only log and the latest state lived in ml_predictions_latest: rename both once.
+      const [predictionTables] = await pool.execute(`
+    SELECT TABLE_NAME, MAX(COLUMN_NAME = 'id') AS hasId
+    FROM INFORMATION_SCHEMA.COLUMNS 
+    WHERE TABLE_SCHEMA = DATABASE() 
+    AND TABLE_NAME IN ('ml_predictions', 'ml_predictions_latest', 'ml_predictions_history')
+    GROUP BY TABLE_NAME
+  `);
+      const predictionTableIds = Object.fromEntries(predictionTables.map(t => [t.TABLE_NAME, Number(t.hasId)]));
+
+      if (predictionTableIds.ml_predictions === 1 && !('ml_predictions_history' in predictionTableIds)) {
+        await pool.execute('RENAME TABLE ml_predictions TO ml_predictions_history');
+        delete predictionTableIds.ml_predictions;
+        console.log('✅ Renamed ml_predictions log to ml_predictions_history');
+      }
+      if ('ml_predictions_latest' in predictionTableIds && !('ml_predictions' in predictionTableIds)) {
+        await pool.execute('RENAME TABLE ml_predictions_latest TO ml_predictions');
+        console.log('✅ Renamed ml_predictions_latest to ml_predictions');
+      }
+
+      // ML Predictions latest state (one row per user and prediction type)
       await pool.execute(`
         CREATE TABLE IF NOT EXISTS ml_predictions (
+          userId INT NOT NULL,
+          tenantId INT NOT NULL DEFAULT 1,
+          predictionType ENUM('purchase', 'churn', 'session_duration', 'engagement') NOT NULL,
+          probability DECIMAL(5,4) NOT NULL,
+          metadata JSON,
+          createdAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          updatedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+          PRIMARY KEY (tenantId, userId, predictionType),
+          INDEX idx_tenant_updatedAt (tenantId, updatedAt),
+          FOREIGN KEY (userId) REFERENCES users(id) ON DELETE CASCADE,
+          FOREIGN KEY (tenantId) REFERENCES tenants(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+      `);
+      console.log('✅ ml_predictions table ready');
+
+      // ML Predictions history (sampled, append-only)
+      await pool.execute(`
+        CREATE TABLE IF NOT EXISTS ml_predictions_history (
           id BIGINT AUTO_INCREMENT PRIMARY KEY,
           userId INT NULL,
           tenantId INT NOT NULL DEFAULT 1,
@@ -2714,9 +2754,9 @@ async function createDatabaseSchema(pool) {
           FOREIGN KEY (tenantId) REFERENCES tenants(id) ON DELETE CASCADE
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
       `);
-      console.log('✅ ml_predictions table ready');
+      console.log('✅ ml_predictions_history table ready');
 
-      // ML Recommendations table
+      // ML Recommendations latest state (one row per user)
       await pool.execute(`
         CREATE TABLE IF NOT EXISTS ml_recommendations (
           id BIGINT AUTO_INCREMENT PRIMARY KEY,
@@ -2737,6 +2777,22 @@ async function createDatabaseSchema(pool) {
       `);
       console.log('✅ ml_recommendations table ready');
 
+      // ML Recommendations history (sampled, append-only)
+      await pool.execute(`
+        CREATE TABLE IF NOT EXISTS ml_recommendations_history (
+          id BIGINT AUTO_INCREMENT PRIMARY KEY,
+          userId INT NOT NULL,
+          tenantId INT NOT NULL DEFAULT 1,
+          productIds TEXT NOT NULL,
+          scores TEXT NOT NULL,
+          metadata JSON,
+          createdAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          INDEX idx_user_tenant (userId, tenantId),
+          INDEX idx_createdAt (createdAt)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+      `);
+      console.log('✅ ml_recommendations_history table ready');
+
       // ML Anomalies table
       await pool.execute(`
         CREATE TABLE IF NOT EXISTS ml_anomalies (
@@ -470,16 +470,16 @@ router.get('/logs/inference', async (req, res) => {
     const limit = parseInt(req.query.limit) || 100;
     const offset = parseInt(req.query.offset) || 0;
 
+    // Latest prediction per user and type (ml_predictions_history is sampled and pruned)
     const [rows] = await poolWrapper.execute(`
       SELECT 
-        id,
         userId,
         predictionType,
         probability,
         metadata,
-        createdAt
+        updatedAt as createdAt
       FROM ml_predictions
-      ORDER BY createdAt DESC
+      ORDER BY updatedAt DESC
       LIMIT ? OFFSET ?
     `, [limit, offset]);
 
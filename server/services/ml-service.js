@@ -64,18 +64,18 @@ class MLService {
   }
 
   /**
-   * Get ML predictions for user (userId optional - if null, returns all)
+   * Get latest ML predictions for user (userId optional - if null, returns all)
+   * Reads the latest-state table, so the cost does not grow with the prediction history
    */
   async getPredictions(userId = null, tenantId = 1, limit = 50) {
     try {
       let query = `
         SELECT 
-          id,
           userId,
           predictionType,
           probability,
           metadata,
-          createdAt
+          updatedAt as createdAt
         FROM ml_predictions
         WHERE tenantId = ?
       `;
@@ -86,7 +86,7 @@ class MLService {
         params.push(userId);
       }
 
-      query += ` ORDER BY createdAt DESC LIMIT ?`;
+      query += ` ORDER BY updatedAt DESC LIMIT ?`;
       params.push(limit);
 
       const [rows] = await poolWrapper.execute(query, params);
@@ -98,7 +98,7 @@ class MLService {
             metadata: typeof row.metadata === 'string' ? JSON.parse(row.metadata || '{}') : (row.metadata || {})
           };
         } catch (parseError) {
-          console.warn(`⚠️ Error parsing metadata for prediction ${row.id}:`, parseError);
+          console.warn(`⚠️ Error parsing metadata for prediction of user ${row.userId}:`, parseError);
           return {
             ...row,
             metadata: {}
@@ -456,11 +456,14 @@ class MLService {
     return startDate.toISOString().slice(0, 19).replace('T', ' ');
   }
 
+  // Prediction stats read the latest state (ml_predictions_history is sampled and pruned):
+  // user/prediction-type pairs scored since dateValue
+
   async getTotalPredictions(tenantId, dateValue) {
     const [rows] = await poolWrapper.execute(`
       SELECT COUNT(*) as count
       FROM ml_predictions
-      WHERE tenantId = ? AND createdAt >= ?
+      WHERE tenantId = ? AND updatedAt >= ?
     `, [tenantId, dateValue]);
     return rows[0]?.count || 0;
   }
@@ -487,7 +490,7 @@ class MLService {
     const [rows] = await poolWrapper.execute(`
       SELECT AVG(probability) as avg
       FROM ml_predictions
-      WHERE tenantId = ? AND createdAt >= ?
+      WHERE tenantId = ? AND updatedAt >= ?
     `, [tenantId, dateValue]);
     return parseFloat(rows[0]?.avg || 0);
   }